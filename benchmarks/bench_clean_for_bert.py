@@ -0,0 +1,189 @@
+"""
+Benchmark text_clean: the original row-by-row clean_for_bert vs the precompiled engine in
+02_combine_clean_ira_comments.py (single process and chunked across processes).
+
+Builds a synthetic comment corpus (default 1,000,000 rows) with the noise clean_for_bert removes
+(line breaks, "see attached file(s)", [PDF_TEXT], bullets, curly quotes, section references,
+missing values), checks the outputs are identical and prints the timings.
+
+--check skips the timings and fuzzes the engine against the reference instead: random strings
+built from the pieces the fast path and its fallback care about ("section", "§", whitespace, codes
+that prefix each other, regex metacharacters), for several SECTION_CODES sets and both lowercase
+settings. It exits non-zero at the first mismatch, so run it after touching clean_for_bert.
+
+    python benchmarks/bench_clean_for_bert.py --rows 1000000
+    python benchmarks/bench_clean_for_bert.py --check --rows 200000
+"""
+
+from __future__ import annotations
+import argparse
+import importlib
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts" / "scraping_clean_combine"))
+combine = importlib.import_module("02_combine_clean_ira_comments")
+
+DEFAULT_SECTION_CODES = ["45Q", "45V", "45X", "45Y", "48C", "48E", "45Z", "179D", "45L", "30D", "25D", "45U", "6418", "45"]
+
+
+# clean_for_bert as it was before the engine, kept verbatim as the reference
+def clean_for_bert_reference(x, lowercase: bool = True):
+
+    if pd.isna(x):
+        return np.nan
+
+    s = str(x)
+    s = re.sub(r"[\r\n\t]", " ", s)
+
+    s = re.sub(r"(?i)see attached file\(s\)", " ", s)
+    s = re.sub(r"(?i)see attached files", " ", s)
+    s = s.replace("[PDF_TEXT]", " ")
+
+    s = s.replace("•", " ")
+    s = s.replace("’", "'")
+    s = re.sub(r"\s+", " ", s).strip()
+    if not s:
+        return np.nan
+
+    # --- Section code normalization ---
+    if lowercase:
+        s = s.lower()
+        codes = sorted([c.lower() for c in combine.SECTION_CODES], key=len, reverse=True)
+
+        for code in codes:
+            # e.g. section 45q -> 45q
+            s = re.sub(rf"section\s*{code}", code, s)
+            # e.g. §45q -> 45q
+            s = re.sub(rf"§\s*{code}", code, s)
+    else:
+        codes = sorted(combine.SECTION_CODES, key=len, reverse=True)
+        for code in codes:
+            s = re.sub(
+                rf"[sS]ection\s*{code}",
+                code,
+                s,
+            )
+            s = re.sub(rf"§\s*{code}", code, s)
+    return s if s else np.nan
+
+
+WORDS = (
+    "the credit clean hydrogen treasury guidance proposed rule energy community wage apprenticeship "
+    "domestic content facility project carbon capture storage manufacturing we support oppose comment"
+).split()
+NOISE = [
+    "\n", "\r\n", "\t", "  ", " • ", "’s", "See Attached File(s)", "see attached files", "SEE ATTACHED FILES",
+    "[PDF_TEXT]\n", "Section 45Q", "section45v", "§ 179D", "§48C", "SECTION  45X", "section 45", " ",
+]
+
+
+def make_corpus(n_rows: int, seed: int = 0) -> pd.Series:
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n_rows):
+        r = rng.random()
+        if r < 0.02:
+            rows.append(np.nan)
+            continue
+        if r < 0.03:
+            rows.append(rng.choice(["", "   ", "See attached file(s)", "\n\t"]))
+            continue
+        parts = []
+        for _ in range(rng.randint(5, 120)):
+            parts.append(rng.choice(NOISE) if rng.random() < 0.12 else rng.choice(WORDS))
+        rows.append(" ".join(parts))
+    return pd.Series(rows, name="combinedText", dtype=object)
+
+
+# SECTION_CODES sets for --check: none, the defaults, codes that prefix / contain each other, and
+# codes with regex metacharacters (the reference pastes them into its patterns unescaped)
+CHECK_SECTION_CODES = [
+    [],
+    DEFAULT_SECTION_CODES,
+    ["4", "45", "45q", "45Q", "q", "1", "179", "179D", "79D"],
+    ["45(a)", "1.5", "4+5", "48[CE]", "6418?", "a|b", "45\\b", "30D$", "^25D"],
+    ["ion", "section", "§", "s", "Section 4"],
+]
+CHECK_PIECES = [
+    "section", "Section", "SECTION", "sec", "tion", "§", "§ ", " ", "  ", "\t", "\n", "\r\n", "•", "’",
+    "see attached files", "See Attached File(s)", "[PDF_TEXT]", "45", "45q", "45Q", "q", "Q", "179D", "179d",
+    "48C", "48E", "4", "5", "1.5", "1x5", "4+5", "445", "45a", "45(a)", "(", ")", ".", "+", "a", "b", "|",
+    "$", "^", "?", "\\", "x", "credit", "Ş", "İ",
+]
+
+
+def make_check_corpus(n_rows: int, seed: int = 0) -> pd.Series:
+    rng = random.Random(seed)
+    rows = [np.nan, "", " ", "\n"]
+    while len(rows) < n_rows:
+        rows.append("".join(rng.choice(CHECK_PIECES) for _ in range(rng.randint(1, 12))))
+    return pd.Series(rows[:n_rows], name="combinedText", dtype=object)
+
+
+def check(n_rows: int) -> int:
+    # Engine vs reference on fuzzed inputs; returns the number of mismatching rows (stops at the first set)
+    texts = make_check_corpus(n_rows)
+    for codes in CHECK_SECTION_CODES:
+        combine.SECTION_CODES = list(codes)
+        for lowercase in (True, False):
+            expected = texts.apply(lambda x: clean_for_bert_reference(x, lowercase))
+            got = combine.clean_text_series(texts, lowercase, workers=1)
+            diff = got.ne(expected) & ~(got.isna() & expected.isna())
+            if diff.any():
+                first = diff.idxmax()
+                print(
+                    f"[WARN] {int(diff.sum())} mismatches, SECTION_CODES={codes} lowercase={lowercase}; "
+                    f"first: {texts[first]!r} -> {got[first]!r}, reference {expected[first]!r}"
+                )
+                return int(diff.sum())
+            print(f"[INFO] {len(texts):,} rows identical, SECTION_CODES={codes} lowercase={lowercase}")
+    return 0
+
+
+def timed(label: str, fn):
+    start = time.perf_counter()
+    out = fn()
+    seconds = time.perf_counter() - start
+    print(f"{label:<32} {seconds:8.2f} s")
+    return out, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=combine.CLEAN_WORKERS)
+    parser.add_argument("--section-codes", nargs="*", default=DEFAULT_SECTION_CODES)
+    parser.add_argument("--no-lowercase", action="store_true")
+    parser.add_argument("--check", action="store_true", help="fuzz the engine against the reference, no timings")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(1 if check(args.rows) else 0)
+
+    combine.SECTION_CODES = list(args.section_codes)
+    lowercase = not args.no_lowercase
+    texts = make_corpus(args.rows)
+    print(f"[INFO] {len(texts):,} rows, {len(combine.SECTION_CODES)} section codes, lowercase={lowercase}")
+
+    expected, t_ref = timed("reference (Series.apply)", lambda: texts.apply(lambda x: clean_for_bert_reference(x, lowercase)))
+    single, t_single = timed("engine, 1 process", lambda: combine.clean_text_series(texts, lowercase, workers=1))
+    multi, t_multi = timed(f"engine, {args.workers} processes", lambda: combine.clean_text_series(texts, lowercase, workers=args.workers))
+
+    for label, got in (("1 process", single), (f"{args.workers} processes", multi)):
+        if not got.equals(expected):
+            diff = got.ne(expected) & ~(got.isna() & expected.isna())
+            first = diff.idxmax()
+            raise AssertionError(f"engine ({label}) differs from reference at row {first}: {got[first]!r} != {expected[first]!r}")
+    print("[INFO] outputs identical")
+    print(f"speedup: {t_ref / t_single:.1f}x (1 process), {t_ref / t_multi:.1f}x ({args.workers} processes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Benchmark cosine DBSCAN on growing corpus sizes: sklearn.cluster.DBSCAN(metric="cosine") vs the
+blocked engine in scripts/embedding_dbscan/cosine_dbscan.py (and its HNSW mode if hnswlib is
+installed).
+
+Synthetic embeddings mimic comment data: tight form-letter clusters, looser topical clusters and
+unique comments as noise, with duplicate-group weights like the notebook's sample_weight. For each
+size the exact engine's labels must equal sklearn's; the HNSW mode reports its adjusted Rand index.
+Peak memory is measured with tracemalloc (numpy and Python allocations).
+
+--check skips the timings and runs randomized correctness checks on small sets. First the exact
+engine's labels must equal sklearn's, with and without weights. Then incremental_clusters: after
+IncrementalDBSCAN.fit on part of the points and 1-3 add() calls, the model must match cosine_dbscan
+refit on all its points and weights. Counts, core points, noise points and the partition of the
+core points into clusters must be equal; only cluster ids and the cluster of a border point
+reachable from two clusters may differ. Some adds repeat rows that are already clustered, which only
+adds weight. It exits non-zero on the first failure.
+
+    python benchmarks/bench_cosine_dbscan.py --sizes 5000 10000 20000 40000 --sklearn-max 20000
+    python benchmarks/bench_cosine_dbscan.py --check --cases 80
+"""
+
+from __future__ import annotations
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+from sklearn.cluster import DBSCAN
+from sklearn.metrics import adjusted_rand_score
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts" / "embedding_dbscan"))
+from cosine_dbscan import cosine_dbscan
+from incremental_clusters import IncrementalDBSCAN
+
+
+def make_embeddings(n: int, dim: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.RandomState(seed)
+    n_letters, n_topics = max(1, n // 200), max(1, n // 500)
+    centers = rng.randn(n_letters + n_topics, dim)
+    kind = rng.rand(n)
+    X = rng.randn(n, dim)  # unique comments
+    letters = kind < 0.5
+    X[letters] = centers[rng.randint(0, n_letters, letters.sum())] + 0.15 * rng.randn(letters.sum(), dim)
+    topics = (kind >= 0.5) & (kind < 0.8)
+    X[topics] = centers[n_letters + rng.randint(0, n_topics, topics.sum())] + 0.6 * rng.randn(topics.sum(), dim)
+    weights = np.where(letters, rng.randint(1, 50, n), 1)
+    return X.astype(np.float32), weights
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    out = fn()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return out, seconds, peak
+
+
+def make_check_case(rng: np.random.RandomState):
+    # Small low-dimensional set with many near points, so clusters grow, merge and gain borders
+    n, dim = rng.randint(20, 400), rng.randint(2, 9)
+    centers = rng.randn(rng.randint(1, 8), dim)
+    X = centers[rng.randint(0, len(centers), n)] + rng.uniform(0.02, 0.4) * rng.randn(n, dim)
+    weights = rng.randint(1, 4, n).astype(np.float64) if rng.rand() < 0.5 else np.ones(n)
+    eps, min_samples = rng.uniform(0.005, 0.1), rng.randint(2, 8)
+    return X.astype(np.float32), weights, eps, min_samples
+
+
+def same_partition(a: np.ndarray, b: np.ndarray) -> bool:
+    pairs = set(zip(a.tolist(), b.tolist()))
+    return len(pairs) == len(set(a.tolist())) == len(set(b.tolist()))
+
+
+def check_incremental(rng: np.random.RandomState, path: str) -> str:
+    # "" if the model after fit + adds matches a refit on the union, else what differs
+    X, weights, eps, min_samples = make_check_case(rng)
+    n = len(X)
+    cuts = np.sort(rng.choice(np.arange(1, n), size=min(n - 1, rng.randint(1, 4)), replace=False))
+    parts = np.split(rng.permutation(n), cuts)
+    model = IncrementalDBSCAN.fit(path, X[parts[0]], rows=parts[0], eps=eps, min_samples=min_samples, sample_weight=weights[parts[0]])
+    for part in parts[1:]:
+        # Some already clustered rows again: they only add weight to their point
+        again = rng.choice(np.concatenate(parts[:1]), size=rng.randint(0, 4))
+        rows = np.concatenate([part, again])
+        added = np.concatenate([weights[part], np.ones(len(again))])
+        model.add(X[rows], rows=rows, sample_weight=added)
+        model = IncrementalDBSCAN.load(path)
+
+    labels, counts = cosine_dbscan(np.asarray(model.vectors()), eps, min_samples, sample_weight=model.weights, return_counts=True)
+    core, model_core = counts >= min_samples, model.counts >= min_samples
+    if not np.allclose(model.counts, counts):
+        return "neighbor counts"
+    if not np.array_equal(model_core, core):
+        return "core points"
+    if not np.array_equal(model.labels < 0, labels < 0):
+        return "noise points"
+    if not same_partition(model.labels[core], labels[core]):
+        return "core partition"
+    return ""
+
+
+def run_checks(n_cases: int) -> bool:
+    rng = np.random.RandomState(0)
+    for case in range(n_cases):
+        X, weights, eps, min_samples = make_check_case(rng)
+        w = weights if case % 2 else None
+        reference = DBSCAN(eps=eps, min_samples=min_samples, metric="cosine").fit_predict(X, sample_weight=w)
+        if not np.array_equal(cosine_dbscan(X, eps, min_samples, sample_weight=w, tile_size=64), reference):
+            print(f"[WARN] case {case}: cosine_dbscan labels differ from sklearn")
+            return False
+    print(f"[INFO] {n_cases} cases: cosine_dbscan labels identical to sklearn")
+
+    for case in range(n_cases):
+        with tempfile.TemporaryDirectory() as tmp:
+            failed = check_incremental(rng, tmp)
+        if failed:
+            print(f"[WARN] case {case}: incremental model differs from a refit ({failed})")
+            return False
+    print(f"[INFO] {n_cases} cases: fit + add matches a refit (counts, core, noise, core partition)")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 5000, 10000, 20000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--eps", type=float, default=0.05)
+    parser.add_argument("--min-samples", type=int, default=5)
+    parser.add_argument("--sklearn-max", type=int, default=20000, help="largest size sklearn is run on")
+    parser.add_argument("--check", action="store_true", help="randomized correctness checks, no timings")
+    parser.add_argument("--cases", type=int, default=80, help="cases per --check")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if run_checks(args.cases) else 1)
+
+    try:
+        import hnswlib  # noqa: F401
+        methods = ["exact", "hnsw"]
+    except ImportError:
+        methods = ["exact"]
+        print("[INFO] hnswlib not installed, HNSW mode skipped")
+
+    print(f"{'n':>8} {'engine':<8} {'seconds':>9} {'peak MB':>9} {'clusters':>9}  check")
+    for n in args.sizes:
+        X, weights = make_embeddings(n, args.dim)
+        reference = None
+        if n <= args.sklearn_max:
+            db = DBSCAN(eps=args.eps, min_samples=args.min_samples, metric="cosine")
+            reference, seconds, peak = measure(lambda: db.fit_predict(X, sample_weight=weights))
+            print(f"{n:>8} {'sklearn':<8} {seconds:9.2f} {peak:9.1f} {reference.max() + 1:>9}")
+
+        for method in methods:
+            labels, seconds, peak = measure(
+                lambda: cosine_dbscan(X, args.eps, args.min_samples, sample_weight=weights, method=method)
+            )
+            check = ""
+            if reference is not None:
+                if method == "exact":
+                    if not np.array_equal(labels, reference):
+                        raise AssertionError(f"exact labels differ from sklearn at n={n}: {(labels != reference).sum()} points")
+                    check = "identical"
+                else:
+                    check = f"ARI {adjusted_rand_score(reference, labels):.4f}"
+            print(f"{n:>8} {method:<8} {seconds:9.2f} {peak:9.1f} {labels.max() + 1:>9}  {check}")
+
+
+if __name__ == "__main__":
+    main()
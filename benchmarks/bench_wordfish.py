@@ -0,0 +1,186 @@
+"""
+Benchmark Wordfish: a dense, loop-by-loop reference of the algorithm (one Newton update per word,
+then per document, as the C++ loop behind quanteda.textmodels::textmodel_wordfish) vs the sparse,
+vectorized textmodel_wordfish in scripts/lda_wordfish/wordfish.py.
+
+Synthetic document-term matrices are drawn from the Wordfish model itself (Poisson counts with
+known positions), with duplicate documents like form letters. Both fits must converge and agree;
+the script prints the timings and the largest differences.
+
+--check runs correctness cases instead of timings:
+- the sparse fit against the dense reference on small matrices (duplicate rows, an empty document
+  and an unused word), positions and word weights equal to 1e-6
+- the sparse fit against quanteda's own fit of data/wordfish_small_dtm.csv, saved by
+  wordfish_quanteda_reference.R to data/wordfish_small_quanteda_*.csv; a missing reference fails
+  the check (rerun the R script after changing the fixture)
+
+    python benchmarks/bench_wordfish.py --docs 300 --words 200
+    python benchmarks/bench_wordfish.py --check
+    Rscript benchmarks/wordfish_quanteda_reference.R    # (re)writes the quanteda reference
+"""
+
+from __future__ import annotations
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.special import gammaln
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts" / "lda_wordfish"))
+from wordfish import MAX_OUTER_ITER, PRIORS, TOL, textmodel_wordfish
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+FIXTURE_DTM = DATA_DIR / "wordfish_small_dtm.csv"
+QUANTEDA_PREFIX = DATA_DIR / "wordfish_small_quanteda"
+
+
+def make_dtm(n_docs: int, n_words: int, duplicate_share: float = 0.2, seed: int = 0) -> np.ndarray:
+    # Poisson counts from the Wordfish model; duplicate_share of the documents copy another one
+    rng = np.random.default_rng(seed)
+    theta, alpha = rng.standard_normal(n_docs), rng.normal(0, 0.3, n_docs)
+    psi, beta = rng.normal(0, 1, n_words), rng.normal(0, 0.5, n_words)
+    Y = rng.poisson(np.exp(alpha[:, None] + psi[None, :] + beta[None, :] * theta[:, None])).astype(np.float64)
+    copies = np.flatnonzero(rng.random(n_docs) < duplicate_share)
+    copies = copies[copies > 1]  # keep the two dir documents distinct
+    Y[copies] = Y[rng.integers(0, 2, len(copies))]
+    return Y
+
+
+# ---- dense reference ----
+def wordfish_reference(Y, dir=(0, 1), priors=PRIORS, tol=TOL, max_iter: int = MAX_OUTER_ITER) -> dict:
+    # Same model, start values and stopping rule, one parameter pair at a time on a dense matrix
+    Y = np.asarray(Y, dtype=np.float64)
+    docs = np.flatnonzero(Y.sum(axis=1) > 0)
+    words = np.flatnonzero(Y.sum(axis=0) > 0)
+    Y = Y[docs][:, words]
+    n, k = Y.shape
+    prec_alpha, prec_psi, prec_beta, prec_theta = (1 / np.asarray(priors, dtype=np.float64) ** 2).tolist()
+
+    rsum, csum, total = Y.sum(axis=1), Y.sum(axis=0), Y.sum()
+    E = np.outer(rsum, csum) / total
+    U = np.linalg.svd((Y - E) / np.sqrt(E), full_matrices=False)[0]
+    theta = np.sqrt(total / rsum) * U[:, 0]
+    theta = (theta - theta.mean()) / theta.std(ddof=1)
+    alpha = np.log(rsum) - np.log(total / n)
+    psi = np.log(csum / n)
+    beta = np.zeros(k)
+    log_factorials = gammaln(Y + 1).sum()
+
+    def log_posterior():
+        mu = alpha[:, None] + psi[None, :] + beta[None, :] * theta[:, None]
+        lp = (Y * mu - np.exp(mu)).sum() - log_factorials
+        return lp - 0.5 * (
+            prec_alpha * (alpha @ alpha) + prec_psi * (psi @ psi) + prec_beta * (beta @ beta) + prec_theta * (theta @ theta)
+        )
+
+    def newton(par0, par1, y, x, offset, prec0, prec1, step):
+        # Up to 10 Newton steps on one (intercept, slope) pair; x is the other side's parameter
+        for _ in range(10):
+            lam = np.exp(offset + par0 + par1 * x)
+            G = np.array([(y - lam).sum() - par0 * prec0, (x * (y - lam)).sum() - par1 * prec1])
+            H = np.array([[-lam.sum() - prec0, -(x * lam).sum()], [-(x * lam).sum(), -(x * x * lam).sum() - prec1]])
+            new0, new1 = np.array([par0, par1]) - step * np.linalg.solve(H, G)
+            resid = max(abs(new0 - par0), abs(new1 - par1))
+            par0, par1, step = new0, new1, 1.0
+            if resid <= tol[1]:
+                break
+        return par0, par1
+
+    lp, last_lp, outer = log_posterior(), -2e12, 0
+    while abs((lp - last_lp) / lp) > tol[0] and outer < max_iter:
+        outer += 1
+        step = 0.5 if outer == 1 else 1.0
+        for j in range(k):
+            psi[j], beta[j] = newton(psi[j], beta[j], Y[:, j], theta, alpha, prec_psi, prec_beta, step)
+        for i in range(n):
+            alpha[i], theta[i] = newton(alpha[i], theta[i], Y[i], beta, psi, prec_alpha, prec_theta, step)
+        last_lp, lp = lp, log_posterior()
+
+    if theta[dir[0]] > theta[dir[1]]:
+        beta, theta = -beta, -theta
+    return {"theta": theta, "alpha": alpha, "beta": beta, "psi": psi, "n_iter": outer, "log_posterior": lp}
+
+
+def max_differences(fit, ref: dict) -> dict:
+    return {name: float(np.abs(getattr(fit, name) - np.asarray(ref[name])).max()) for name in ("theta", "alpha", "beta", "psi")}
+
+
+# ---- checks ----
+def check_reference(tolerance: float = 1e-6) -> bool:
+    ok = True
+    for n_docs, n_words, seed in ((40, 30, 0), (120, 60, 1), (80, 150, 2)):
+        Y = make_dtm(n_docs, n_words, seed=seed)
+        Y[n_docs // 2] = 0  # empty document
+        Y[:, n_words // 2] = 0  # unused word
+        fit = textmodel_wordfish(sp.csr_matrix(Y), dir=(0, 1), verbose=False)
+        ref = wordfish_reference(Y, dir=(0, 1))
+        diff = max_differences(fit, ref)
+        same = max(diff.values()) < tolerance and fit.n_iter == ref["n_iter"] and fit.n_iter < MAX_OUTER_ITER
+        print(
+            f"[{'INFO' if same else 'WARN'}] {n_docs} x {n_words}: {fit.n_iter} iterations "
+            f"(reference {ref['n_iter']}), max abs diff " + ", ".join(f"{k} {v:.1e}" for k, v in diff.items())
+        )
+        ok &= same
+    return ok
+
+
+def check_quanteda(tolerance: float = 1e-3) -> bool:
+    documents, words = Path(f"{QUANTEDA_PREFIX}_documents.csv"), Path(f"{QUANTEDA_PREFIX}_words.csv")
+    if not (documents.exists() and words.exists()):
+        print(f"[WARN] no quanteda reference ({documents.name}); run benchmarks/wordfish_quanteda_reference.R to write it")
+        return False
+    counts = pd.read_csv(FIXTURE_DTM)
+    fit = textmodel_wordfish(sp.csr_matrix(counts.drop(columns="docname").to_numpy(dtype=np.float64)), dir=(0, 1), verbose=False)
+    doc_ref, word_ref = pd.read_csv(documents), pd.read_csv(words)
+    ref = {"theta": doc_ref["theta"], "alpha": doc_ref["alpha"], "beta": word_ref["beta"], "psi": word_ref["psi"]}
+    diff = max_differences(fit, ref)
+    same = max(diff.values()) < tolerance
+    print(f"[{'INFO' if same else 'WARN'}] quanteda reference: max abs diff " + ", ".join(f"{k} {v:.1e}" for k, v in diff.items()))
+    return same
+
+
+def write_fixture():
+    Y = make_dtm(40, 30, seed=20)
+    counts = pd.DataFrame(Y.astype(np.int64), columns=[f"w{j + 1:02d}" for j in range(Y.shape[1])])
+    counts.insert(0, "docname", [f"d{i + 1:02d}" for i in range(len(Y))])
+    DATA_DIR.mkdir(exist_ok=True)
+    counts.to_csv(FIXTURE_DTM, index=False)
+    print(f"[INFO] Wrote {FIXTURE_DTM}; rerun wordfish_quanteda_reference.R to refresh the quanteda fit")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--words", type=int, default=200)
+    parser.add_argument("--check", action="store_true", help="correctness cases (dense reference, quanteda), no timings")
+    parser.add_argument("--write-fixture", action="store_true", help=f"rewrite {FIXTURE_DTM.name}")
+    args = parser.parse_args()
+
+    if args.write_fixture:
+        write_fixture()
+        return
+    if args.check:
+        ok = check_reference()
+        ok &= check_quanteda()
+        sys.exit(0 if ok else 1)
+
+    Y = make_dtm(args.docs, args.words)
+    print(f"[INFO] {args.docs:,} documents x {args.words:,} words")
+    start = time.perf_counter()
+    ref = wordfish_reference(Y)
+    t_ref = time.perf_counter() - start
+    print(f"{'dense loops':<20} {t_ref:8.2f} s  {ref['n_iter']} iterations")
+    start = time.perf_counter()
+    fit = textmodel_wordfish(sp.csr_matrix(Y), verbose=False)
+    t_fit = time.perf_counter() - start
+    print(f"{'sparse, vectorized':<20} {t_fit:8.2f} s  {fit.n_iter} iterations")
+    print("max abs diff: " + ", ".join(f"{k} {v:.1e}" for k, v in max_differences(fit, ref).items()))
+    print(f"speedup: {t_ref / t_fit:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Local stand-in for the regulations.gov v4 API, so the scraper can be timed without API quota.
+
+Serves a generated docket over HTTP/1.1 keep-alive on 127.0.0.1:
+
+- GET /v4/comments?filter[docketId]=...&page[size]=...&page[number]=...   list pages (+ meta)
+- GET /v4/comments/{commentId}?include=attachments                        detail + attachments
+- GET /files/{commentId}/attachment_{k}.pdf                               generated PDF
+
+Like the real API, a query lists at most max_pages pages (default 20 x 250 = 5000 comments); later
+pages are answered with 400, so dockets above that must be split into lastModifiedDate windows.
+Every request can be delayed (latency + jitter seconds) and a share of them answered with
+429 Too Many Requests (with Retry-After), like the real API under load. JSON is gzipped when the
+client asks for it. Comment texts come from synthetic_comments.py (form letters + unique text).
+
+    with RegulationsStub(n_comments=2000, latency=0.05, rate_429=0.02) as stub:
+        scraper.BASE_URL = stub.base_url
+        rows = scraper.get_comments_with_text_and_pdfs(stub.docket_id)
+    stub.stats    # requests served per endpoint, 429s
+"""
+
+from __future__ import annotations
+import gzip
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from zoneinfo import ZoneInfo
+
+from synthetic_comments import comment_texts
+
+DOCKET_ID = "IRS-2099-0001"
+API_TIMEZONE = ZoneInfo("America/New_York")
+PAGE_SIZE_MAX = 250
+MAX_PAGES_PER_QUERY = 20
+PDF_LINES_PER_PAGE = 45
+PDF_LINE_CHARS = 90
+
+
+# ---- PDF attachments ----
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(text: str, max_pages: int = 50) -> bytes:
+    # Minimal uncompressed PDF (Helvetica, one text object per page) that PyPDF2 extracts text from
+    words, lines, line = text.split(), [], ""
+    for word in words:
+        if line and len(line) + 1 + len(word) > PDF_LINE_CHARS:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    pages = [lines[i:i + PDF_LINES_PER_PAGE] for i in range(0, len(lines), PDF_LINES_PER_PAGE)][:max_pages] or [[]]
+
+    # Objects: 1 catalog, 2 page tree, 3 font, then (page, content stream) per page
+    objects = [b"", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page_lines in pages:
+        stream = "BT /F1 11 Tf 14 TL 50 760 Td " + " ".join(f"({_pdf_escape(l)}) Tj T*" for l in page_lines) + " ET"
+        stream = stream.encode("latin-1", "replace")
+        page_num, content_num = len(objects) + 1, len(objects) + 2
+        kids.append(f"{page_num} 0 R")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+            f"/Contents {content_num} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+# ---- server ----
+class RegulationsStub:
+    """Generated docket served by a background ThreadingHTTPServer; use as a context manager."""
+
+    def __init__(
+        self,
+        n_comments: int = 2000,
+        docket_id: str = DOCKET_ID,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        rate_429: float = 0.0,
+        retry_after: int = 0,
+        pdf_share: float = 0.3,
+        pdf_words: int = 1500,
+        max_pages: int | None = MAX_PAGES_PER_QUERY,
+        form_letter_share: float = 0.6,
+        seed: int = 0,
+    ):
+        self.docket_id = docket_id
+        self.latency, self.jitter = latency, jitter
+        self.rate_429, self.retry_after = rate_429, retry_after
+        self.max_pages = max_pages  # None: no page ceiling
+        self.stats = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        rng = random.Random(seed + 1)
+        texts = comment_texts(n_comments, form_letter_share=form_letter_share, seed=seed)
+        start = datetime(2024, 1, 2, 9, 0, 0, tzinfo=timezone.utc)
+        self.comments = {}
+        self.order = []
+        for i, text in enumerate(texts):
+            comment_id = f"{docket_id}-{i + 1:07d}"
+            n_pdfs = (1 + (rng.random() < 0.2)) if rng.random() < pdf_share else 0
+            self.comments[comment_id] = {
+                "text": text,
+                "n_pdfs": n_pdfs,
+                "modified": (start + timedelta(seconds=37 * i)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "pdf_seed": rng.randrange(2 ** 31),
+            }
+            self.order.append(comment_id)
+        self.pdf_words = pdf_words
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v4"
+
+    def __enter__(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub._handle(self)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # ---- responses ----
+    def _send(self, handler, status: int, body: bytes, content_type: str, headers: dict | None = None):
+        if content_type == "application/json" and "gzip" in (handler.headers.get("Accept-Encoding") or ""):
+            body = gzip.compress(body, compresslevel=1)
+            headers = {**(headers or {}), "Content-Encoding": "gzip"}
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _send_json(self, handler, obj, status: int = 200, headers: dict | None = None):
+        self._send(handler, status, json.dumps(obj).encode("utf-8"), "application/json", headers)
+
+    def _handle(self, handler):
+        parts = urllib.parse.urlsplit(handler.path)
+        params = dict(urllib.parse.parse_qsl(parts.query))
+        path = parts.path
+        endpoint = "pdf" if path.startswith("/files/") else "detail" if path.startswith("/v4/comments/") else "list"
+
+        with self._lock:
+            delay = self.latency + self.jitter * self._rng.random()
+            throttled = self._rng.random() < self.rate_429
+            self.stats[f"{endpoint}_requests"] += 1
+            if throttled:
+                self.stats["429_responses"] += 1
+        if delay > 0:
+            time.sleep(delay)
+        if throttled:
+            self._send_json(handler, {"error": {"code": "OVER_RATE_LIMIT"}}, 429, {"Retry-After": str(self.retry_after)})
+            return
+
+        if endpoint == "list" and path == "/v4/comments":
+            number = int(params.get("page[number]", 1))
+            if self.max_pages is not None and not 1 <= number <= self.max_pages:
+                with self._lock:
+                    self.stats["list_pages_over_ceiling"] += 1
+                detail = f"page[number] must be between 1 and {self.max_pages}"
+                self._send_json(handler, {"errors": [{"status": "400", "title": "Bad Request", "detail": detail}]}, 400)
+                return
+            self._send_json(handler, self._list_page(params))
+        elif endpoint == "detail" and path[len("/v4/comments/"):] in self.comments:
+            self._send_json(handler, self._detail(path[len("/v4/comments/"):], handler))
+        elif endpoint == "pdf" and (match := re.fullmatch(r"/files/([^/]+)/attachment_(\d+)\.pdf", path)):
+            comment = self.comments.get(match.group(1))
+            if comment is None or int(match.group(2)) > comment["n_pdfs"]:
+                self._send_json(handler, {"error": "not found"}, 404)
+                return
+            rng = random.Random(comment["pdf_seed"] + int(match.group(2)))
+            words = comment["text"].split() or ["attachment"]
+            body = make_pdf(" ".join(rng.choice(words) for _ in range(self.pdf_words)))
+            self.stats["pdf_bytes"] += len(body)
+            self._send(handler, 200, body, "application/pdf")
+        else:
+            self._send_json(handler, {"error": "not found"}, 404)
+
+    def _list_page(self, params: dict) -> dict:
+        ids = self.order if params.get("filter[docketId]") == self.docket_id else []
+        ge, le = params.get("filter[lastModifiedDate][ge]"), params.get("filter[lastModifiedDate][le]")
+        if ge or le:
+            # Filters are Eastern time "YYYY-MM-DD HH:MM:SS", compared against the UTC timestamps
+            def to_utc(value):
+                local = datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=API_TIMEZONE)
+                return local.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+            lo, hi = to_utc(ge) if ge else "", to_utc(le) if le else "~"
+            ids = [c for c in ids if lo <= self.comments[c]["modified"] <= hi]
+        if params.get("sort", "").startswith("-"):
+            ids = ids[::-1]
+        size = min(int(params.get("page[size]", 25)), PAGE_SIZE_MAX)
+        number = int(params.get("page[number]", 1))
+        page_ids = ids[(number - 1) * size:number * size]
+        total_pages = math.ceil(len(ids) / size) if ids else 0
+        return {
+            "data": [
+                {
+                    "id": c,
+                    "type": "comments",
+                    "attributes": {
+                        "documentType": "Public Submission",
+                        "lastModifiedDate": self.comments[c]["modified"],
+                        "postedDate": self.comments[c]["modified"],
+                        "title": f"Comment on {self.docket_id}",
+                        "withdrawn": False,
+                    },
+                }
+                for c in page_ids
+            ],
+            "meta": {
+                "totalElements": len(ids),
+                "totalPages": total_pages,
+                "pageNumber": number,
+                "pageSize": size,
+                "hasNextPage": number < total_pages,
+            },
+        }
+
+    def _detail(self, comment_id: str, handler) -> dict:
+        comment = self.comments[comment_id]
+        host = handler.headers.get("Host")
+        text = comment["text"]
+        if comment["n_pdfs"]:
+            text += " See attached file(s)"
+        attachments = [
+            {
+                "id": f"{comment_id}-{k}",
+                "type": "attachments",
+                "attributes": {
+                    "title": f"Attachment {k}",
+                    "fileFormats": [{"fileUrl": f"http://{host}/files/{comment_id}/attachment_{k}.pdf", "format": "pdf", "size": 0}],
+                },
+            }
+            for k in range(1, comment["n_pdfs"] + 1)
+        ]
+        return {
+            "data": {
+                "id": comment_id,
+                "type": "comments",
+                "attributes": {
+                    "agencyId": self.docket_id.split("-")[0],
+                    "docketId": self.docket_id,
+                    "documentId": comment_id,
+                    "documentType": "Public Submission",
+                    "comment": f"<p>{text}</p>",
+                    "title": f"Comment on {self.docket_id}",
+                    "postedDate": comment["modified"],
+                    "lastModifiedDate": comment["modified"],
+                    "withdrawn": False,
+                },
+            },
+            "included": attachments,
+        }
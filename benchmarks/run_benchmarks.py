@@ -0,0 +1,295 @@
+"""
+Offline benchmark suite for the comment pipeline, written to one JSON report to diff between versions.
+
+Benchmarks (each size runs in a fresh process, so peak memory is its own):
+
+- scrape              01's crawl_docket_to_files end to end against regulations_stub.py (date-window
+                      plan, list pages, details, PDF downloads + parsing, JSONL/CSV output), with
+                      injected latency and 429s; the stub lists at most 20 pages per query like the
+                      real API, so sizes above 5000 comments are crawled in several windows
+- clean_for_bert      02's clean_text_series on the raw combinedText of a synthetic corpus
+- combine             02's streaming combine (read CSVs, clean, write csv/jsonl/parquet)
+- sentence_embedding  sentence_encoder.py on the distinct texts (needs sentence-transformers, the
+                      model and NLTK punkt; skipped otherwise)
+- dbscan              cosine_dbscan.py on one embedding per distinct text, weighted by duplicates
+
+Corpora come from synthetic_comments.py: --sizes comments (default 10k, 100k, 1M) with
+form-letter duplication. Three benchmarks are capped by default (MAX_ROWS, raise with --max-rows):
+scrape at 10k comments (every comment is a local HTTP round trip), sentence_embedding at 10k (CPU
+encoding is slow) and dbscan at 100k (exact DBSCAN is quadratic in the distinct texts). Sizes above
+a cap are reported as skipped; the caps are printed first and saved in the report's "max_rows".
+
+    python benchmarks/run_benchmarks.py --out benchmarks/results/report.json
+    python benchmarks/run_benchmarks.py --only scrape --latency 0.05 --rate-429 0.02
+    python benchmarks/run_benchmarks.py --compare old.json --out new.json
+"""
+
+from __future__ import annotations
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR / "scripts" / "scraping_clean_combine"))
+sys.path.insert(0, str(REPO_DIR / "scripts" / "embedding_dbscan"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_clean_for_bert import DEFAULT_SECTION_CODES  # noqa: E402
+from synthetic_comments import comment_frame, letter_embeddings  # noqa: E402
+
+REPORT_VERSION = 1
+SIZES = [10_000, 100_000, 1_000_000]
+MAX_ROWS = {"scrape": 10_000, "sentence_embedding": 10_000, "dbscan": 100_000}
+
+
+# ---- benchmarks ----
+def bench_scrape(size: int, args) -> dict:
+    from regulations_stub import RegulationsStub
+
+    scraper = importlib.import_module("01_scrape_docket_metadata_and_pdfs")
+    scraper.API_KEY = "benchmark"
+    scraper.CACHE = None
+    scraper.RATE_LIMITER = scraper.TokenBucket(args.requests_per_hour, burst=scraper.RATE_LIMIT_BURST)
+    if args.list_max_pages:
+        scraper.MAX_PAGES_PER_QUERY = args.list_max_pages  # plan windows for the stub's ceiling
+    stub = RegulationsStub(
+        n_comments=size, latency=args.latency, jitter=args.jitter, rate_429=args.rate_429,
+        retry_after=args.retry_after, pdf_share=args.pdf_share, max_pages=args.list_max_pages or None,
+    )
+    with stub, tempfile.TemporaryDirectory(prefix="bench_scrape_") as tmp, contextlib.redirect_stdout(io.StringIO()):
+        scraper.BASE_URL = stub.base_url
+        start = time.perf_counter()
+        state = scraper.crawl_docket_to_files(stub.docket_id, tmp, page_size=250, max_workers=args.fetch_workers)
+        seconds = time.perf_counter() - start
+        with open(Path(tmp) / f"{stub.docket_id}_comments_text_pdf_all.jsonl", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    with_pdf = sum(1 for row in rows if row["pdfText"])
+    expected_pdf = sum(1 for c in stub.comments.values() if c["n_pdfs"])
+    if len(rows) != size or with_pdf != expected_pdf:
+        raise AssertionError(f"scraped {len(rows)} rows ({with_pdf} with PDF text), expected {size} ({expected_pdf})")
+    details = {**stub.stats, "rows_with_pdf_text": with_pdf, "list_max_pages": args.list_max_pages, "windows": len(state["windows"])}
+    return {"seconds": seconds, "items": size, "details": details}
+
+
+def bench_clean_for_bert(size: int, args) -> dict:
+    combine = importlib.import_module("02_combine_clean_ira_comments")
+    combine.SECTION_CODES = list(DEFAULT_SECTION_CODES)
+    texts = comment_frame(size)["combinedText"]
+    start = time.perf_counter()
+    cleaned = combine.clean_text_series(texts, lowercase=True, workers=args.workers)
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "items": size, "details": {"workers": args.workers, "non_empty": int(cleaned.notna().sum())}}
+
+
+def bench_combine(size: int, args) -> dict:
+    combine = importlib.import_module("02_combine_clean_ira_comments")
+    df = comment_frame(size).drop(columns="letterId")
+    with tempfile.TemporaryDirectory(prefix="bench_combine_") as tmp:
+        files = []
+        for k, part in enumerate(np.array_split(np.arange(len(df)), args.combine_files)):
+            files.append(f"comments_{k}.csv")
+            df.iloc[part].to_csv(Path(tmp) / files[-1], index=False)
+        combine.ROOT_DIR = Path(tmp)
+        combine.CSV_FILES = files
+        combine.SECTION_CODES = list(DEFAULT_SECTION_CODES)
+        combine.CLEAN_WORKERS = args.workers
+        formats = ["csv", "jsonl"]
+        try:
+            import pyarrow  # noqa: F401
+            formats.append("parquet")
+        except ImportError:
+            pass
+        combine.OUTPUT_FORMATS = formats
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            combine.main_streaming()
+        seconds = time.perf_counter() - start
+    return {"seconds": seconds, "items": size, "details": {"files": args.combine_files, "formats": formats, "workers": args.workers}}
+
+
+def bench_sentence_embedding(size: int, args) -> dict:
+    try:
+        from sentence_transformers import SentenceTransformer
+        from nltk.tokenize import sent_tokenize
+        sent_tokenize("Punkt is installed. Check.")
+    except (ImportError, LookupError) as e:
+        return {"status": "skipped", "reason": f"{type(e).__name__}: {e}".splitlines()[0]}
+    from sentence_encoder import encode_documents_sentence_level
+
+    texts = comment_frame(size)["combinedText"].dropna().drop_duplicates().tolist()
+    model = SentenceTransformer(args.model, device="cpu")
+    model.max_seq_length = 128
+    start = time.perf_counter()
+    encode_documents_sentence_level(model, texts, batch_size=128)
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "items": size, "details": {"distinct_texts": len(texts), "model": args.model}}
+
+
+def bench_dbscan(size: int, args) -> dict:
+    from cosine_dbscan import cosine_dbscan
+
+    df = comment_frame(size)
+    X, inverse = letter_embeddings(df["combinedText"].fillna("").tolist(), df["letterId"].to_numpy(), dim=args.dim)
+    weights = np.bincount(inverse)
+    start = time.perf_counter()
+    labels = cosine_dbscan(X, eps=0.05, min_samples=5, sample_weight=weights)
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": seconds,
+        "items": size,
+        "details": {"distinct_texts": len(X), "dim": args.dim, "clusters": int(labels.max() + 1), "noise": int((labels < 0).sum())},
+    }
+
+
+BENCHMARKS = {
+    "scrape": bench_scrape,
+    "clean_for_bert": bench_clean_for_bert,
+    "combine": bench_combine,
+    "sentence_embedding": bench_sentence_embedding,
+    "dbscan": bench_dbscan,
+}
+
+
+# ---- runner ----
+def _run_case(name: str, size: int, args) -> dict:
+    # Runs in its own process: ru_maxrss is this benchmark's peak resident memory
+    try:
+        result = BENCHMARKS[name](size, args)
+    except Exception as e:
+        result = {"status": "error", "reason": f"{type(e).__name__}: {e}"}
+    result.setdefault("status", "ok")
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result["peak_rss_mb"] = round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+    return result
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+        dirty = subprocess.run(["git", "status", "--porcelain"], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+        return out.stdout.strip() + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _environment() -> dict:
+    packages = {}
+    for name in ("numpy", "pandas", "scipy", "sklearn", "PyPDF2", "pyarrow", "nltk", "sentence_transformers", "torch", "hnswlib"):
+        try:
+            packages[name] = importlib.import_module(name).__version__
+        except Exception:
+            packages[name] = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": packages,
+    }
+
+
+def compare_reports(old: dict, new: dict):
+    # Print seconds old -> new per (benchmark, size)
+    before = {(r["benchmark"], r["size"]): r for r in old["results"]}
+    print(f"\n{'benchmark':<20} {'size':>9} {'old s':>9} {'new s':>9} {'change':>8}")
+    for r in new["results"]:
+        o = before.get((r["benchmark"], r["size"]))
+        if o is None or o.get("status") != "ok" or r.get("status") != "ok":
+            continue
+        change = r["seconds"] / o["seconds"] - 1 if o["seconds"] else float("nan")
+        print(f"{r['benchmark']:<20} {r['size']:>9} {o['seconds']:>9.2f} {r['seconds']:>9.2f} {change:>+8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="synthetic corpus sizes (comments)")
+    parser.add_argument("--max-rows", nargs="*", default=[], metavar="BENCH=N", help="override size caps, e.g. dbscan=1000000")
+    parser.add_argument("--out", default=str(REPO_DIR / "benchmarks" / "results" / "report.json"))
+    parser.add_argument("--compare", help="earlier report to compare against")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="clean / combine processes")
+    parser.add_argument("--combine-files", type=int, default=4)
+    parser.add_argument("--dim", type=int, default=768, help="embedding dimension for dbscan")
+    parser.add_argument("--model", default="sentence-transformers/all-mpnet-base-v2")
+    scrape = parser.add_argument_group("scrape (local regulations.gov stand-in)")
+    scrape.add_argument("--list-max-pages", type=int, default=20, help="list pages per query the stub serves (0: no ceiling)")
+    scrape.add_argument("--latency", type=float, default=0.02, help="seconds added to every response")
+    scrape.add_argument("--jitter", type=float, default=0.01, help="random extra seconds, up to")
+    scrape.add_argument("--rate-429", type=float, default=0.01, help="share of requests answered with 429")
+    scrape.add_argument("--retry-after", type=int, default=0, help="Retry-After seconds sent with a 429")
+    scrape.add_argument("--pdf-share", type=float, default=0.3, help="share of comments with PDF attachments")
+    scrape.add_argument("--fetch-workers", type=int, default=8)
+    scrape.add_argument("--requests-per-hour", type=float, default=1e9, help="scraper rate limit (default: unthrottled)")
+    args = parser.parse_args()
+
+    max_rows = dict(MAX_ROWS)
+    for item in args.max_rows:
+        name, _, value = item.partition("=")
+        max_rows[name] = int(value)
+
+    caps = ", ".join(f"{name} {max_rows[name]:,}" for name in args.only if name in max_rows)
+    if caps:
+        print(f"[INFO] Size caps (comments): {caps}; larger sizes are skipped (--max-rows BENCH=N to raise)")
+    cases = [(name, size) for name in args.only for size in sorted(args.sizes)]
+
+    results = []
+    for name, size in cases:
+        if size > max_rows.get(name, size):
+            result = {"status": "skipped", "reason": f"size above max rows {max_rows[name]:,} (--max-rows {name}=N)"}
+        else:
+            print(f"[INFO] {name}, {size:,} comments ...", flush=True)
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    result = pool.submit(_run_case, name, size, args).result()
+            except BrokenProcessPool:
+                result = {"status": "error", "reason": "benchmark process died (out of memory?)"}
+        if result.get("status") == "ok":
+            result["seconds"] = round(result["seconds"], 3)
+            result["items_per_second"] = round(result.pop("items") / result["seconds"], 1) if result["seconds"] else None
+            print(f"       {result['seconds']:.2f} s, {result['items_per_second']:,} comments/s, peak {result.get('peak_rss_mb')} MB")
+        else:
+            print(f"[WARN] {name} {size:,}: {result['status']} ({result.get('reason')})")
+        results.append({"benchmark": name, "size": size, **result})
+
+    report = {
+        "report_version": REPORT_VERSION,
+        "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "git_commit": _git_commit(),
+        "environment": _environment(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "max_rows": {name: max_rows[name] for name in args.only if name in max_rows},
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"[INFO] Saved report to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare_reports(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Synthetic public-comment corpora for the benchmarks: form-letter campaigns plus unique comments.
+
+A form_letter_share of the comments copy one of n_letters campaign letters; variant_share of those
+add a personal sentence (near duplicates), the rest are exact copies. The remaining comments are
+unique text. comment_frame() adds the scraper's columns and the noise clean_for_bert removes
+(line breaks, "See attached file(s)", [PDF_TEXT], bullets, curly quotes, section references), and
+letter_embeddings() gives embedding-like vectors: one tight cluster per letter, unique comments
+spread out.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+WORDS = np.array((
+    "the credit clean hydrogen treasury guidance proposed rule energy community wage apprenticeship "
+    "domestic content facility project carbon capture storage manufacturing we support oppose comment "
+    "tax section investment production wind solar battery grid utility jobs workers union rural "
+    "emissions lifecycle electrolyzer nuclear biofuel vehicle consumer price family small business "
+    "urge department final should must not please consider impact local state federal program"
+).split())
+SECTION_REFS = ["Section 45Q", "section45v", "§ 179D", "§48C", "SECTION  45X", "section 45"]
+NOISE = ["\n", "\r\n", "\t", " • ", "’s", "See Attached File(s)", "see attached files"]
+DOCKETS = ["IRS-2023-0042", "IRS-2023-0066", "CMS-2024-0256"]
+
+
+def _random_texts(rng: np.random.Generator, n: int, min_words: int = 5, max_words: int = 120) -> list:
+    lengths = rng.integers(min_words, max_words + 1, n)
+    words = WORDS[rng.integers(0, len(WORDS), lengths.sum())]
+    ends = np.cumsum(lengths)
+    return [" ".join(words[end - length:end]) for end, length in zip(ends.tolist(), lengths.tolist())]
+
+
+def comment_texts(
+    n: int,
+    form_letter_share: float = 0.6,
+    n_letters: int | None = None,
+    variant_share: float = 0.3,
+    seed: int = 0,
+    return_letters: bool = False,
+):
+    # n comment texts; return_letters: also the letter id of each comment (-1 = unique comment)
+    rng = np.random.default_rng(seed)
+    n_letters = n_letters or max(5, n // 2000)
+    letters = _random_texts(rng, n_letters, 80, 400)
+    letter_of = np.where(rng.random(n) < form_letter_share, rng.integers(0, n_letters, n), -1)
+    unique = iter(_random_texts(rng, int((letter_of < 0).sum())))
+    personal = iter(_random_texts(rng, n, 4, 15))
+    variant = rng.random(n) < variant_share
+
+    texts = []
+    for i, letter in enumerate(letter_of.tolist()):
+        if letter < 0:
+            texts.append(next(unique))
+        elif variant[i]:
+            texts.append(next(personal).capitalize() + ". " + letters[letter])
+        else:
+            texts.append(letters[letter])
+    return (texts, letter_of) if return_letters else texts
+
+
+def comment_frame(n: int, form_letter_share: float = 0.6, seed: int = 0) -> pd.DataFrame:
+    # Rows shaped like the scraper's CSV output (02's COLS_KEEP), with combinedText as raw as scraped
+    rng = np.random.default_rng(seed + 1)
+    texts, letter_of = comment_texts(n, form_letter_share, seed=seed, return_letters=True)
+    noisy = []
+    for text, r in zip(texts, rng.random(n).tolist()):
+        if r < 0.02:
+            noisy.append(None)
+        elif r < 0.2:
+            noisy.append(text + " " + NOISE[int(r * 1000) % len(NOISE)] + " [PDF_TEXT]\n" + SECTION_REFS[int(r * 100) % len(SECTION_REFS)])
+        elif r < 0.4:
+            noisy.append(text.replace(" the ", " ’the’ \n ", 1) + " " + NOISE[int(r * 1000) % len(NOISE)])
+        else:
+            noisy.append(text)
+    docket = np.array(DOCKETS)[rng.integers(0, len(DOCKETS), n)]
+    return pd.DataFrame({
+        "docketId": docket,
+        "commentId": [f"{d}-{i + 1:07d}" for i, d in enumerate(docket.tolist())],
+        "title": "Comment on proposed rule",
+        "trackingNbr": None,
+        "organizationName": np.where(rng.random(n) < 0.1, "Example Energy Association", None),
+        "firstName": None,
+        "lastName": None,
+        "city": None,
+        "stateProvinceRegion": None,
+        "country": "United States",
+        "combinedText": noisy,
+        "letterId": letter_of,
+    })
+
+
+def letter_embeddings(texts: list, letter_of: np.ndarray, dim: int = 768, seed: int = 0):
+    # Float32 vectors of the distinct texts and the distinct text of every comment (as the notebook
+    # embeds each text once): near-duplicate letter variants sit close to their letter, unique
+    # comments are spread out
+    rng = np.random.default_rng(seed)
+    n_letters = int(letter_of.max()) + 1 if len(letter_of) else 0
+    centers = rng.standard_normal((max(n_letters, 1), dim), dtype=np.float32)
+    inverse, distinct = pd.factorize(pd.Series(texts, dtype=object))
+    first = np.full(len(distinct), len(texts), dtype=np.int64)
+    np.minimum.at(first, inverse, np.arange(len(texts)))
+    letters = letter_of[first]
+    X = rng.standard_normal((len(distinct), dim), dtype=np.float32)
+    grouped = letters >= 0
+    X[grouped] = centers[letters[grouped]] + 0.1 * X[grouped]
+    return X, inverse
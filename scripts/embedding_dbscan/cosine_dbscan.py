@@ -0,0 +1,217 @@
+"""
+DBSCAN on cosine distance without sklearn's all-pairs neighbor lists.
+
+sklearn.cluster.DBSCAN(metric="cosine") computes every point's radius neighborhood up front and
+keeps it all in memory (on top of chunks of the dense distance matrix), which runs out of memory
+long before a million comments. This engine applies the same DBSCAN rules in three blocked passes
+over L2-normalized vectors, holding one (tile_size x tile_size) similarity tile at a time:
+
+1) weighted neighbor counts (cosine distance <= eps, the point itself included) -> core points;
+   distances are symmetric, so only tiles on and above the diagonal are computed
+2) core-core tiles -> connected components of core points (union of tile edges, scipy csgraph)
+3) non-core x core tiles -> border points join a neighboring core's cluster
+
+Labels match sklearn's: clusters are numbered by their lowest core index, and a border point
+reachable from several clusters takes the lowest-numbered one, as sklearn's expansion order does.
+Distances are computed like sklearn's cosine_distances (float32 1 - dot of normalized rows), so
+points exactly at eps fall on the same side.
+
+method="exact" is still quadratic in time, only memory is bounded. method="hnsw" (pip install
+hnswlib) replaces the passes with an approximate k-nearest-neighbor graph for very large corpora:
+neighborhoods are capped at hnsw_k points and may miss a few, so labels can differ slightly.
+
+    labels = cosine_dbscan(X, eps=0.05, min_samples=5, sample_weight=group_size)
+"""
+
+from __future__ import annotations
+import os
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.preprocessing import normalize
+
+TILE_SIZE = 2048
+
+
+def normalize_rows(X) -> np.ndarray:
+    # L2-normalized float copy of X, the vectors sklearn's cosine distance is computed from
+    X = np.asarray(X)
+    if X.dtype not in (np.float32, np.float64):
+        X = X.astype(np.float32)
+    return np.ascontiguousarray(normalize(X, copy=True))
+
+
+def _tiles(n: int, size: int):
+    return [(start, min(start + size, n)) for start in range(0, n, size)]
+
+
+def _neighbor_mask(A: np.ndarray, B: np.ndarray, eps: float) -> np.ndarray:
+    # mask[i, j]: cosine distance between normalized rows A[i] and B[j] <= eps
+    S = A @ B.T
+    S *= -1
+    S += 1
+    return S <= eps
+
+
+def radius_neighbor_pairs(Q: np.ndarray, X: np.ndarray, eps: float, tile_size: int = TILE_SIZE):
+    # (i, j) index pairs with cosine distance(Q[i], X[j]) <= eps, for L2-normalized rows;
+    # X may be a memmap, it's read one tile at a time
+    qi, xj = [], []
+    for r0, r1 in _tiles(len(Q), tile_size):
+        for c0, c1 in _tiles(len(X), tile_size):
+            i, j = np.nonzero(_neighbor_mask(Q[r0:r1], np.asarray(X[c0:c1]), eps))
+            qi.append(i + r0)
+            xj.append(j + c0)
+    if not qi:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(qi).astype(np.int64), np.concatenate(xj).astype(np.int64)
+
+
+def _number_clusters(core_components: np.ndarray) -> np.ndarray:
+    # Relabel components 0, 1, ... in order of their first (lowest-index) core point
+    _, first, inverse = np.unique(core_components, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(first))
+    return rank[inverse.reshape(-1)]
+
+
+def _dbscan_exact(Xn: np.ndarray, eps: float, min_samples: int, weights: np.ndarray, tile_size: int):
+    # Returns labels and the weighted neighbor counts (incremental_clusters.py keeps the counts)
+    n = len(Xn)
+
+    # 1) Weighted neighbor counts; each tile above the diagonal also counts for its mirror tile.
+    # Integer weights (group sizes) are summed in float32 BLAS, exact below 2^24
+    if np.array_equal(weights, np.round(weights)) and weights.sum() < 2 ** 24:
+        weights = weights.astype(np.float32)
+    counts = np.zeros(n, dtype=np.float64)
+    for r0, r1 in _tiles(n, tile_size):
+        for c0, c1 in _tiles(n, tile_size):
+            if c0 < r0:
+                continue
+            mask = _neighbor_mask(Xn[r0:r1], Xn[c0:c1], eps)
+            if r0 == c0:
+                np.fill_diagonal(mask, True)  # a point is always its own neighbor
+            mask = mask.astype(weights.dtype)
+            if r0 != c0:
+                counts[c0:c1] += weights[r0:r1] @ mask
+            counts[r0:r1] += mask @ weights[c0:c1]
+    cores = np.flatnonzero(counts >= min_samples)
+    labels = np.full(n, -1, dtype=np.int64)
+    if len(cores) == 0:
+        return labels, counts
+
+    # 2) Components of the core-core graph; the graph is symmetric, so only tiles on or above the
+    # diagonal are computed. component holds a node id per core and is relabeled after each row block.
+    Xc = Xn[cores]
+    component = np.arange(len(cores))
+    for r0, r1 in _tiles(len(cores), tile_size):
+        pairs = []
+        for c0, c1 in _tiles(len(cores), tile_size):
+            if c0 < r0:
+                continue
+            i, j = np.nonzero(_neighbor_mask(Xc[r0:r1], Xc[c0:c1], eps))
+            a, b = component[r0 + i], component[c0 + j]
+            keep = a != b
+            if keep.any():
+                pairs.append(np.unique(np.stack([a[keep], b[keep]], axis=1), axis=0))
+        if pairs:
+            edges = np.concatenate(pairs)
+            graph = coo_matrix(
+                (np.ones(len(edges), dtype=np.int8), (edges[:, 0], edges[:, 1])),
+                shape=(len(cores), len(cores)),
+            )
+            component = connected_components(graph, directed=False)[1][component]
+    core_labels = _number_clusters(component)
+    labels[cores] = core_labels
+
+    # 3) Border points: lowest cluster number among neighboring cores
+    others = np.flatnonzero(counts < min_samples)
+    none = np.iinfo(np.int64).max
+    for r0, r1 in _tiles(len(others), tile_size):
+        Xo = Xn[others[r0:r1]]
+        best = np.full(r1 - r0, none, dtype=np.int64)
+        for c0, c1 in _tiles(len(cores), tile_size):
+            mask = _neighbor_mask(Xo, Xc[c0:c1], eps)
+            best = np.minimum(best, np.where(mask, core_labels[c0:c1], none).min(axis=1))
+        labels[others[r0:r1]] = np.where(best == none, -1, best)
+    return labels, counts
+
+
+def _dbscan_hnsw(
+    Xn: np.ndarray, eps: float, min_samples: int, weights: np.ndarray,
+    k: int, ef: int, M: int, ef_construction: int, n_threads: int,
+) -> np.ndarray:
+    try:
+        import hnswlib
+    except ImportError as e:
+        raise ImportError('method="hnsw" needs hnswlib (pip install hnswlib)') from e
+
+    n, dim = Xn.shape
+    k = min(max(k, min_samples), n)
+    index = hnswlib.Index(space="ip", dim=dim)  # distance = 1 - dot = cosine distance for unit rows
+    index.init_index(max_elements=n, ef_construction=ef_construction, M=M)
+    index.add_items(Xn, np.arange(n), num_threads=n_threads)
+    index.set_ef(max(ef, k))
+    neighbors, distances = index.knn_query(Xn, k=k, num_threads=n_threads)
+
+    # A point is always its own neighbor, also when the index didn't return it
+    is_self = neighbors == np.arange(n)[:, None]
+    within = (distances <= eps) | is_self
+    counts = np.where(within, weights[neighbors], 0).sum(axis=1)
+    counts += np.where(is_self.any(axis=1), 0, weights)
+    is_core = counts >= min_samples
+    labels = np.full(n, -1, dtype=np.int64)
+    if not is_core.any():
+        return labels
+
+    rows = np.repeat(np.arange(n), k)
+    cols = neighbors.reshape(-1)
+    edge = within.reshape(-1) & is_core[rows] & is_core[cols]
+    graph = coo_matrix((np.ones(edge.sum(), dtype=np.int8), (rows[edge], cols[edge])), shape=(n, n))
+    component = connected_components(graph, directed=False)[1]
+    cores = np.flatnonzero(is_core)
+    labels[cores] = _number_clusters(component[cores])
+
+    none = np.iinfo(np.int64).max
+    reachable = within & is_core[neighbors]
+    best = np.where(reachable, labels[neighbors], none).min(axis=1)
+    border = ~is_core & (best != none)
+    labels[border] = best[border]
+    return labels
+
+
+def cosine_dbscan(
+    X,
+    eps: float = 0.05,
+    min_samples: int = 5,
+    sample_weight=None,
+    method: str = "exact",
+    tile_size: int = TILE_SIZE,
+    hnsw_k: int = 64,
+    hnsw_ef: int = 200,
+    hnsw_M: int = 32,
+    hnsw_ef_construction: int = 200,
+    n_threads: int = -1,
+    return_counts: bool = False,
+):
+    # DBSCAN(eps, min_samples, metric="cosine").fit_predict(X, sample_weight=sample_weight); -1 = noise.
+    # return_counts (exact method): also return each point's weighted neighbor count
+    Xn = normalize_rows(X)
+    n = len(Xn)
+    weights = np.ones(n) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    if len(weights) != n:
+        raise ValueError(f"sample_weight has {len(weights)} values for {n} points")
+    if n == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return (empty, np.empty(0)) if return_counts else empty
+
+    if method == "exact":
+        labels, counts = _dbscan_exact(Xn, eps, min_samples, weights, tile_size)
+        return (labels, counts) if return_counts else labels
+    if return_counts:
+        raise ValueError('return_counts needs method="exact"')
+    if method == "hnsw":
+        threads = (os.cpu_count() or 1) if n_threads == -1 else n_threads
+        return _dbscan_hnsw(Xn, eps, min_samples, weights, hnsw_k, hnsw_ef, hnsw_M, hnsw_ef_construction, threads)
+    raise ValueError(f'method must be "exact" or "hnsw", got {method!r}')
@@ -0,0 +1,184 @@
+"""
+Append-only, memory-mapped store for comment embeddings.
+
+Replaces the JSON embedding cache (768 floats as text per comment, parsed back with
+pd.read_json + np.stack). A store is a directory holding:
+
+- vectors.bin : raw row-major matrix (float32 or float16), opened with np.memmap, no parsing
+                and no copy until rows are read
+- keys.bin    : one 16-byte key per row, blake2b(model name + text), same order as vectors.bin
+- meta.json   : dim, dtype, model name
+
+Rows are looked up by text, so a rerun only embeds texts the store has never seen
+(new comments, or text_clean that changed), whatever order the rows come in:
+
+    store = EmbeddingStore(EMBED_STORE_DIR, MODEL_NAME, dim=768)
+    rows = store.embed_missing(texts, lambda batch: model_encode(batch))
+    X = store.vectors[rows]
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+
+import numpy as np
+
+KEY_BYTES = 16
+
+
+def text_key(text: str, model_name: str) -> bytes:
+    # Same text embedded by another model is another entry
+    h = hashlib.blake2b(digest_size=KEY_BYTES)
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update(str(text).encode("utf-8"))
+    return h.digest()
+
+
+class EmbeddingStore:
+    """Embeddings keyed by (model, text) in a memory-mapped, append-only matrix."""
+
+    def __init__(self, root: str, model_name: str | None = None, dim: int | None = None, dtype: str = "float32"):
+        # dim / dtype are only needed to create the store, an existing one keeps its own.
+        # model_name=None opens an existing store with the model it was built with (reading rows only)
+        self.root = root
+        self.vectors_path = os.path.join(root, "vectors.bin")
+        self.keys_path = os.path.join(root, "keys.bin")
+        self.meta_path = os.path.join(root, "meta.json")
+
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if model_name is None:
+                model_name = meta["model"]
+            if meta["model"] != model_name:
+                raise ValueError(f"{root} holds embeddings of {meta['model']}, not {model_name}")
+            if dim is not None and dim != meta["dim"]:
+                raise ValueError(f"{root} holds {meta['dim']}-dim embeddings, got dim={dim}")
+        else:
+            if model_name is None or dim is None:
+                raise ValueError(f"No embedding store in {root}; pass model_name and dim to create one")
+            if np.dtype(dtype) not in (np.float32, np.float16):
+                raise ValueError(f"dtype must be float32 or float16, got {dtype}")
+            os.makedirs(root, exist_ok=True)
+            meta = {"model": model_name, "dim": int(dim), "dtype": np.dtype(dtype).name}
+            tmp_path = self.meta_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=2)
+            os.replace(tmp_path, self.meta_path)
+            for path in (self.vectors_path, self.keys_path):
+                open(path, "ab").close()
+
+        self.model_name = model_name
+        self.dim = meta["dim"]
+        self.dtype = np.dtype(meta["dtype"])
+        self.row_bytes = self.dim * self.dtype.itemsize
+        self._repair()
+        self._load()
+
+    def _repair(self):
+        # keys.bin is appended after vectors.bin, so after a crash vectors.bin may have extra rows:
+        # the keys decide what was committed
+        n_keys = os.path.getsize(self.keys_path) // KEY_BYTES
+        n_vectors = os.path.getsize(self.vectors_path) // self.row_bytes
+        n = min(n_keys, n_vectors)
+        for path, size in ((self.keys_path, n * KEY_BYTES), (self.vectors_path, n * self.row_bytes)):
+            if os.path.getsize(path) != size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def _load(self):
+        self.keys = np.fromfile(self.keys_path, dtype=f"S{KEY_BYTES}")
+        self._map_vectors()
+        # Sorted view of the keys for vectorized lookups
+        self._order = np.argsort(self.keys, kind="stable")
+        self._sorted_keys = self.keys[self._order]
+
+    def _map_vectors(self):
+        n = len(self.keys)
+        # np.memmap can't map an empty file
+        self.vectors = (
+            np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(n, self.dim))
+            if n else np.empty((0, self.dim), dtype=self.dtype)
+        )
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def keys_for(self, texts) -> np.ndarray:
+        return np.array([text_key(t, self.model_name) for t in texts], dtype=f"S{KEY_BYTES}")
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        # Row of each key in vectors, -1 when not stored yet
+        keys = np.asarray(keys, dtype=f"S{KEY_BYTES}")
+        if len(self._sorted_keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.searchsorted(self._sorted_keys, keys)
+        pos_clipped = np.minimum(pos, len(self._sorted_keys) - 1)
+        found = self._sorted_keys[pos_clipped] == keys
+        return np.where(found, self._order[pos_clipped], -1).astype(np.int64)
+
+    def append(self, keys: np.ndarray, embeddings: np.ndarray):
+        # Add rows (keys already stored are skipped); they are merged into the sorted key index
+        # and the memmap is reopened to include them
+        keys = np.asarray(keys, dtype=f"S{KEY_BYTES}")
+        embeddings = np.asarray(embeddings)
+        if embeddings.shape != (len(keys), self.dim):
+            raise ValueError(f"expected embeddings of shape ({len(keys)}, {self.dim}), got {embeddings.shape}")
+        _, first = np.unique(keys, return_index=True)
+        new = np.sort(first[self.lookup(keys[first]) < 0])
+        if len(new) == 0:
+            return
+        self._write(keys[new], embeddings[new])
+        self._merge_index(keys[new])
+
+    def _write(self, keys: np.ndarray, embeddings: np.ndarray):
+        # Append to the files only, vectors first (see _repair); the in-memory index is left as is
+        with open(self.vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(embeddings, dtype=self.dtype).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.keys_path, "ab") as f:
+            f.write(keys.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _merge_index(self, keys: np.ndarray):
+        # keys (distinct, not stored yet) were just written as the next rows
+        n = len(self.keys)
+        order = np.argsort(keys, kind="stable")
+        pos = np.searchsorted(self._sorted_keys, keys[order])
+        self._sorted_keys = np.insert(self._sorted_keys, pos, keys[order])
+        self._order = np.insert(self._order, pos, n + order)
+        self.keys = np.concatenate([self.keys, keys])
+        self._map_vectors()
+
+    def embed_missing(self, texts, embed_fn, batch_size: int = 1024, progress=None) -> np.ndarray:
+        # Rows of texts in vectors, embedding (embed_fn(list of texts) -> (n, dim) array) and
+        # appending only texts not stored yet. Each batch is saved as soon as it's embedded,
+        # so an interrupted run keeps what it finished.
+        # progress: optional wrapper for the batch loop (e.g. tqdm)
+        texts = list(texts)
+        keys = self.keys_for(texts)
+        rows = self.lookup(keys)
+
+        missing = np.flatnonzero(rows < 0)
+        _, first = np.unique(keys[missing], return_index=True)
+        todo = missing[np.sort(first)]  # one row per distinct missing text
+        if len(todo):
+            print(f"[INFO] {len(todo):,} of {len(texts):,} texts are not in the embedding store, embedding them")
+            # todo keys are distinct and not stored: batches go straight to the files and the
+            # index is rebuilt once at the end (also when interrupted), not after every batch
+            starts = range(0, len(todo), batch_size)
+            try:
+                for start in (progress(starts) if progress else starts):
+                    batch = todo[start:start + batch_size]
+                    embeddings = np.asarray(embed_fn([texts[i] for i in batch]))
+                    if embeddings.shape != (len(batch), self.dim):
+                        raise ValueError(f"expected embeddings of shape ({len(batch)}, {self.dim}), got {embeddings.shape}")
+                    self._write(keys[batch], embeddings)
+            finally:
+                self._load()
+            rows = self.lookup(keys)
+        return rows
@@ -0,0 +1,336 @@
+"""
+Incremental cosine DBSCAN: assign newly scraped comments to an existing clustering without a refit.
+
+IncrementalDBSCAN keeps, in a model directory, what DBSCAN needs to take more points:
+
+- points.bin : L2-normalized float32 vector of every clustered point (one per duplicate group),
+               appended as points come in
+- state.npz  : per point the embedding store row, weight (comments in the group), weighted
+               neighbor count, cluster label and the batch it arrived in; plus eps, min_samples
+
+Adding points only searches neighbors of the points that changed (new points, points that got
+more weight, points that just became core), not the whole corpus. Counts are updated, points that
+reach min_samples become core, and their core neighbors decide whether they extend a cluster,
+merge clusters (the lowest id is kept) or start a new one. Non-core points join a neighboring
+core's cluster or stay noise. The core points and noise end up as a full refit would give them;
+only cluster numbering and the cluster of a border point reachable from two clusters can differ
+(checked by benchmarks/bench_cosine_dbscan.py --check).
+
+Outputs are kept as partitions (one CSV per cluster, one per batch of noise) so that after an
+update only the affected clusters' files, their representatives and the noise batches that
+changed are rewritten:
+
+    model = IncrementalDBSCAN.fit(MODEL_DIR, X, rows=store_rows, eps=0.05, min_samples=5, sample_weight=w)
+    update = model.add(X_new, rows=new_rows, sample_weight=new_w)
+    write_partitions(df, PARTITION_DIR, update["clusters"], update["noise_batches"], update["removed_clusters"])
+"""
+
+from __future__ import annotations
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from cosine_dbscan import TILE_SIZE, cosine_dbscan, normalize_rows, radius_neighbor_pairs
+
+# Columns scored to pick a cluster's representative comment (notebook step 5.2)
+INFO_COLS = [
+    "title", "trackingNbr", "organizationName", "firstName", "lastName",
+    "city", "stateProvinceRegion", "country", "combinedText",
+]
+
+
+# ---- Clustering model ----
+
+class IncrementalDBSCAN:
+    """Persisted cosine DBSCAN state that new embeddings can be added to."""
+
+    def __init__(self, path: str, eps: float, min_samples: int, dim: int, tile_size: int = TILE_SIZE):
+        self.path = path
+        self.eps = eps
+        self.min_samples = min_samples
+        self.dim = dim
+        self.tile_size = tile_size
+        self.points_path = os.path.join(path, "points.bin")
+        self.state_path = os.path.join(path, "state.npz")
+
+        self.rows = np.empty(0, dtype=np.int64)  # embedding store row per point
+        self.weights = np.empty(0, dtype=np.float64)
+        self.counts = np.empty(0, dtype=np.float64)  # weighted neighbor count, the point itself included
+        self.labels = np.empty(0, dtype=np.int64)
+        self.batch = np.empty(0, dtype=np.int64)
+        self.next_label = 0
+        self.n_batches = 0
+
+    @classmethod
+    def fit(cls, path: str, X, rows, eps: float, min_samples: int, sample_weight=None, tile_size: int = TILE_SIZE):
+        # Full DBSCAN (same labels as cosine_dbscan / sklearn), saved as batch 0
+        Xn = normalize_rows(X).astype(np.float32, copy=False)
+        weights = np.ones(len(Xn)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+        labels, counts = cosine_dbscan(Xn, eps, min_samples, sample_weight=weights, tile_size=tile_size, return_counts=True)
+
+        model = cls(path, eps, min_samples, Xn.shape[1], tile_size)
+        model.rows = np.asarray(rows, dtype=np.int64)
+        if len(np.unique(model.rows)) != len(model.rows):
+            raise ValueError("rows must be unique: one point per embedding store row")
+        model.weights, model.counts, model.labels = weights, counts, labels
+        model.batch = np.zeros(len(Xn), dtype=np.int64)
+        model.next_label = int(labels.max()) + 1 if len(labels) else 0
+        model.n_batches = 1
+
+        os.makedirs(path, exist_ok=True)
+        with open(model.points_path, "wb") as f:
+            f.write(Xn.tobytes())
+        model.save()
+        return model
+
+    @classmethod
+    def load(cls, path: str, tile_size: int = TILE_SIZE):
+        with np.load(os.path.join(path, "state.npz")) as state:
+            meta = json.loads(str(state["meta"]))
+            model = cls(path, meta["eps"], meta["min_samples"], meta["dim"], tile_size)
+            for name in ("rows", "weights", "counts", "labels", "batch"):
+                setattr(model, name, state[name])
+        model.next_label = meta["next_label"]
+        model.n_batches = meta["n_batches"]
+        return model
+
+    def save(self):
+        meta = {
+            "eps": self.eps, "min_samples": self.min_samples, "dim": self.dim,
+            "next_label": self.next_label, "n_batches": self.n_batches,
+        }
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f, meta=np.array(json.dumps(meta)), rows=self.rows, weights=self.weights,
+                counts=self.counts, labels=self.labels, batch=self.batch,
+            )
+        os.replace(tmp_path, self.state_path)
+
+    def vectors(self) -> np.ndarray:
+        if len(self.rows) == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(self.points_path, dtype=np.float32, mode="r", shape=(len(self.rows), self.dim))
+
+    def points_of_rows(self, rows) -> np.ndarray:
+        # Point index of each embedding store row, -1 if not clustered yet
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(self.rows) == 0:
+            return np.full(len(rows), -1, dtype=np.int64)
+        order = np.argsort(self.rows)
+        candidate = order[np.minimum(np.searchsorted(self.rows, rows, sorter=order), len(order) - 1)]
+        return np.where(self.rows[candidate] == rows, candidate, -1)
+
+    def labels_of_rows(self, rows) -> np.ndarray:
+        points = self.points_of_rows(rows)
+        if (points < 0).any():
+            raise KeyError(f"{(points < 0).sum()} embedding rows are not in the clustering model")
+        return self.labels[points]
+
+    def add(self, X, rows, sample_weight=None) -> dict:
+        # Add embeddings (X rows aligned with their embedding store rows; a row already clustered
+        # only adds weight to its point) and update the clustering in place, then save.
+        # Returns what changed: clusters (labels to rewrite), removed_clusters (merged away),
+        # noise_batches (batches whose noise changed) and batch (this batch's number).
+        rows = np.asarray(rows, dtype=np.int64)
+        weights_in = np.ones(len(rows)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+        batch_id = self.n_batches
+        n_old = len(self.rows)
+
+        # One entry per store row, weights summed
+        unique_rows, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+        added = np.bincount(inverse.reshape(-1), weights=weights_in, minlength=len(unique_rows))
+        points = self.points_of_rows(unique_rows)
+        is_new = points < 0
+        new_points = np.arange(n_old, n_old + is_new.sum())
+        points[is_new] = new_points
+
+        if is_new.any():
+            Xn_new = normalize_rows(np.asarray(X)[first[is_new]]).astype(np.float32, copy=False)
+            with open(self.points_path, "ab") as f:
+                f.write(Xn_new.tobytes())
+        old_counts = np.concatenate([self.counts, np.zeros(len(new_points))])
+        old_labels = np.concatenate([self.labels, np.full(len(new_points), -1, dtype=np.int64)])
+        self.rows = np.concatenate([self.rows, unique_rows[is_new]])
+        self.weights = np.concatenate([self.weights, np.zeros(len(new_points))])
+        self.batch = np.concatenate([self.batch, np.full(len(new_points), batch_id, dtype=np.int64)])
+        delta = np.zeros(len(self.rows))
+        delta[points] = added
+        self.weights = self.weights + delta
+        V = self.vectors()
+
+        # Neighbors of the points that changed; pairs exclude the point itself
+        changed = np.flatnonzero(delta > 0)
+        ci, j = radius_neighbor_pairs(np.asarray(V[changed]), V, self.eps, self.tile_size)
+        c = changed[ci]
+        keep = c != j
+        c, j = c[keep], j[keep]
+
+        # Counts: old points gain the added weight of changed neighbors (and their own);
+        # new points count all their neighbors
+        counts = old_counts.copy()
+        point_is_new = np.zeros(len(self.rows), dtype=bool)
+        point_is_new[new_points] = True
+        to_old = ~point_is_new[j]
+        np.add.at(counts, j[to_old], delta[c[to_old]])
+        from_new = point_is_new[c]
+        np.add.at(counts, c[from_new], self.weights[j[from_new]])
+        counts[changed] += delta[changed]  # itself (a new point's whole weight)
+        self.counts = counts
+
+        was_core = old_counts >= self.min_samples
+        is_core = counts >= self.min_samples
+        fresh = np.flatnonzero(is_core & ~was_core)
+
+        # Points that just became core without changing themselves need their own neighbor lists
+        flipped = np.setdiff1d(fresh, changed)
+        if len(flipped):
+            fi, fj = radius_neighbor_pairs(np.asarray(V[flipped]), V, self.eps, self.tile_size)
+            keep = flipped[fi] != fj
+            c = np.concatenate([c, flipped[fi][keep]])
+            j = np.concatenate([j, fj[keep]])
+
+        # Core connectivity: nodes are existing clusters (0..next_label-1) and the fresh cores
+        n_clusters = self.next_label
+        node = np.full(len(self.rows), -1, dtype=np.int64)
+        node[was_core] = old_labels[was_core]
+        node[fresh] = n_clusters + np.arange(len(fresh))
+        core_edge = is_core[c] & is_core[j]
+        graph = coo_matrix(
+            (np.ones(core_edge.sum(), dtype=np.int8), (node[c[core_edge]], node[j[core_edge]])),
+            shape=(n_clusters + len(fresh),) * 2,
+        )
+        component = connected_components(graph, directed=False)[1]
+
+        # Each component keeps its lowest existing cluster id, or gets a new id
+        none = np.iinfo(np.int64).max
+        target = np.full(component.max() + 1 if len(component) else 0, none, dtype=np.int64)
+        np.minimum.at(target, component[:n_clusters], np.arange(n_clusters))
+        for f in range(len(fresh)):  # fresh points in index order, so new ids are deterministic
+            comp = component[n_clusters + f]
+            if target[comp] == none:
+                target[comp] = self.next_label
+                self.next_label += 1
+
+        remap = target[component[:n_clusters]]
+        removed = np.flatnonzero(remap != np.arange(n_clusters))
+        labels = old_labels.copy()
+        clustered = labels >= 0
+        labels[clustered] = remap[labels[clustered]]
+        labels[fresh] = target[component[n_clusters:]]
+
+        # Border points: non-core points with a core neighbor that was changed or just became core,
+        # unless they already belong to a cluster
+        border_edge = is_core[c] & ~is_core[j] & (labels[j] < 0)
+        border_edge_rev = ~is_core[c] & is_core[j] & (labels[c] < 0)
+        candidates = np.concatenate([j[border_edge], c[border_edge_rev]])
+        their_label = np.concatenate([labels[c[border_edge]], labels[j[border_edge_rev]]])
+        best = np.full(len(self.rows), none, dtype=np.int64)
+        np.minimum.at(best, candidates, their_label)
+        joined = best != none
+        labels[joined] = best[joined]
+        self.labels = labels
+
+        # What to rewrite: clusters that gained points or merged, noise batches that gained or lost points
+        touched = np.concatenate([changed, fresh, np.flatnonzero(joined)])
+        clusters = set(labels[touched][labels[touched] >= 0].tolist())
+        clusters |= set(remap[removed].tolist())
+        noise_changed = np.concatenate([
+            changed[labels[changed] < 0],                                # new noise comments
+            np.flatnonzero((old_labels < 0) & (labels >= 0) & ~point_is_new),  # noise that joined a cluster
+        ])
+        self.n_batches += 1
+        self.save()
+        return {
+            "batch": batch_id,
+            "clusters": sorted(clusters),
+            "removed_clusters": removed.tolist(),
+            "noise_batches": sorted(set(self.batch[noise_changed].tolist())),
+            "new_points": len(new_points),
+        }
+
+
+# ---- Representatives and output partitions ----
+
+def pick_representatives(df_nonnoise: pd.DataFrame) -> pd.DataFrame:
+    # One row per dbscan_cluster: most filled-in info columns, ties by longer combinedText
+    df = df_nonnoise.copy()
+    info_cols = [c for c in INFO_COLS if c in df.columns]
+    for c in info_cols:
+        df[c] = df[c].replace(r"^\s*$", np.nan, regex=True)
+    df["info_nonnull"] = df[info_cols].notna().sum(axis=1) if info_cols else 0
+    df["text_len"] = df["combinedText"].fillna("").astype(str).str.len() if "combinedText" in df.columns else 0
+    return (
+        df
+        .sort_values(["dbscan_cluster", "info_nonnull", "text_len"], ascending=[True, False, False])
+        .groupby("dbscan_cluster", as_index=False)
+        .first()
+        .drop(columns=["info_nonnull", "text_len"], errors="ignore")
+    )
+
+
+def _cluster_file(out_dir: str, label: int) -> str:
+    return os.path.join(out_dir, "clusters", f"cluster={label}.csv")
+
+
+def _noise_file(out_dir: str, batch: int) -> str:
+    return os.path.join(out_dir, "noise", f"batch={batch}.csv")
+
+
+def _write_csv(df: pd.DataFrame, path: str):
+    tmp_path = path + ".tmp"
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def write_partitions(df: pd.DataFrame, out_dir: str, clusters=None, noise_batches=None, removed_clusters=()):
+    # Rewrite the given cluster / noise-batch partitions and their representatives from df
+    # (every comment with dbscan_cluster and noiseBatch = its point's batch). None = all of them.
+    os.makedirs(os.path.join(out_dir, "clusters"), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, "noise"), exist_ok=True)
+    is_noise = df["dbscan_cluster"] == -1
+    df_nonnoise = df[~is_noise]
+    if clusters is None:
+        clusters = df_nonnoise["dbscan_cluster"].unique().tolist()
+    if noise_batches is None:
+        noise_batches = df.loc[is_noise, "noiseBatch"].unique().tolist()
+
+    affected = df_nonnoise[df_nonnoise["dbscan_cluster"].isin(clusters)]
+    for label, part in affected.groupby("dbscan_cluster"):
+        _write_csv(part, _cluster_file(out_dir, label))
+    noise = df[is_noise & df["noiseBatch"].isin(noise_batches)]
+    for batch in noise_batches:
+        part = noise[noise["noiseBatch"] == batch]
+        if len(part):
+            _write_csv(part, _noise_file(out_dir, batch))
+        elif os.path.exists(_noise_file(out_dir, batch)):
+            os.remove(_noise_file(out_dir, batch))
+    for label in removed_clusters:
+        if os.path.exists(_cluster_file(out_dir, label)):
+            os.remove(_cluster_file(out_dir, label))
+
+    # Representatives: recompute the affected clusters only, keep the rest
+    reps_path = os.path.join(out_dir, "cluster_representatives.csv")
+    new_reps = pick_representatives(affected)
+    if os.path.exists(reps_path):
+        old_reps = pd.read_csv(reps_path, dtype={"commentId": str})
+        old_reps = old_reps[~old_reps["dbscan_cluster"].isin(list(clusters) + list(removed_clusters))]
+        new_reps = pd.concat([old_reps, new_reps], ignore_index=True)
+    _write_csv(new_reps.sort_values("dbscan_cluster"), reps_path)
+    print(f"[INFO] Rewrote {len(clusters)} cluster and {len(noise_batches)} noise partitions in {out_dir}")
+
+
+def read_partitions(out_dir: str, kind: str = "clusters", min_cluster_size: int = 0) -> pd.DataFrame:
+    # Concatenate partitions: kind="clusters" (optionally only clusters with > min_cluster_size
+    # comments, e.g. 5 for the clusters_gt5 export), "noise" or "representatives"
+    if kind == "representatives":
+        return pd.read_csv(os.path.join(out_dir, "cluster_representatives.csv"), dtype={"commentId": str})
+    part_dir = os.path.join(out_dir, "clusters" if kind == "clusters" else "noise")
+    parts = [pd.read_csv(os.path.join(part_dir, name), dtype={"commentId": str}) for name in sorted(os.listdir(part_dir)) if name.endswith(".csv")]
+    if kind == "clusters" and min_cluster_size:
+        parts = [p for p in parts if len(p) > min_cluster_size]
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
@@ -0,0 +1,189 @@
+"""
+Near-duplicate prefilter for the comment embedding pipeline (CPU only).
+
+Form-letter campaigns make most comments copies of a few texts, so embedding every row
+repeats the same SBERT work thousands of times. This module groups the rows first:
+
+1) Exact duplicates: rows whose normalized text (lowercased, punctuation and extra
+   whitespace removed) has the same hash.
+2) Near duplicates: one row per exact group is shingled (word n-grams), MinHashed, and
+   bucketed with LSH banding; rows sharing a bucket whose estimated Jaccard similarity
+   is >= threshold are merged (union-find).
+
+With threshold=None only rows whose text is identical up to whitespace are grouped: the
+embedder sees exactly the same input, so each copy would get the same embedding anyway and
+DBSCAN on the weighted representatives gives every comment the label it gets unpruned.
+With a threshold, near duplicates (and case / punctuation variants) take their
+representative's embedding, which is faster but can change labels.
+
+Each group is represented by its first row. Embed only the representatives, then fan the
+embeddings / cluster labels back out to every member:
+
+    group_rep = find_near_duplicate_groups(texts)
+    rep_rows, members = representatives(group_rep)
+    rep_emb = embed(texts[rep_rows])
+    embeddings = rep_emb[members]                      # (N, dim) again
+    labels = DBSCAN(...).fit_predict(rep_emb, sample_weight=group_sizes(group_rep))[members]
+"""
+
+from __future__ import annotations
+import hashlib
+import re
+
+import numpy as np
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+
+def normalize_for_hash(text) -> str:
+    # Case, punctuation and spacing differences don't make a different letter
+    if text is None or (isinstance(text, float) and np.isnan(text)):
+        return ""
+    text = str(text)
+    return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+
+
+def normalize_whitespace(text) -> str:
+    # What embed_document_sentence_level does before splitting: same result, same embedding
+    if text is None or (isinstance(text, float) and np.isnan(text)):
+        return ""
+    return " ".join(str(text).split())
+
+
+def exact_duplicate_groups(texts, normalize=normalize_for_hash) -> np.ndarray:
+    # For each row, the index of the first row with the same normalized text
+    first_seen = {}
+    group_rep = np.empty(len(texts), dtype=np.int64)
+    for i, text in enumerate(texts):
+        digest = hashlib.blake2b(normalize(text).encode("utf-8"), digest_size=16).digest()
+        group_rep[i] = first_seen.setdefault(digest, i)
+    return group_rep
+
+
+class MinHasher:
+    """MinHash signatures of word shingles, num_perm multiply-add-shift hashes ((a * h + b) mod 2^64) >> 32."""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 0, chunk_shingles: int = 200_000):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.chunk_shingles = chunk_shingles  # bounds the (num_perm, shingles) temporary
+        self.a = rng.randint(0, 2 ** 63, size=num_perm, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.randint(0, 2 ** 63, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self.vocab = {}
+
+    def shingle_hashes(self, normalized: str) -> np.ndarray:
+        # 32-bit hashes of the distinct word shingles (a short text is one shingle), computed
+        # with numpy over word ids instead of hashing every shingle string
+        vocab = self.vocab
+        ids = np.array([vocab.setdefault(w, len(vocab)) for w in normalized.split()], dtype=np.uint64)
+        if len(ids) == 0:
+            return np.zeros(1, dtype=np.uint64)
+        k = min(self.shingle_size, len(ids))
+        windows = np.lib.stride_tricks.sliding_window_view(ids + np.uint64(1), k)
+        powers = np.uint64(0x100000001B3) ** np.arange(k, dtype=np.uint64)  # wraps mod 2^64
+        mixed = (windows * powers).sum(axis=1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        return np.unique(mixed >> np.uint64(32))
+
+    def signatures(self, normalized_texts) -> np.ndarray:
+        sigs = np.empty((len(normalized_texts), self.num_perm), dtype=np.uint32)
+        start = 0
+        while start < len(normalized_texts):
+            # Docs whose shingles fit in one chunk are permuted together, min per doc via reduceat
+            hashes, total, stop = [], 0, start
+            while stop < len(normalized_texts) and (total == 0 or total < self.chunk_shingles):
+                hashes.append(self.shingle_hashes(normalized_texts[stop]))
+                total += len(hashes[-1])
+                stop += 1
+            offsets = np.cumsum([0] + [len(h) for h in hashes[:-1]])
+            # uint64 arithmetic wraps mod 2^64, the top 32 bits are the hash
+            permuted = (np.outer(self.a, np.concatenate(hashes)) + self.b[:, None]) >> np.uint64(32)
+            sigs[start:stop] = np.minimum.reduceat(permuted, offsets, axis=1).T
+            start = stop
+        return sigs
+
+
+def _find(parent: np.ndarray, i: int) -> int:
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+
+def _union(parent: np.ndarray, i: int, j: int):
+    ri, rj = _find(parent, i), _find(parent, j)
+    if ri != rj:
+        # The smaller index stays the root, so a group is represented by its first row
+        parent[max(ri, rj)] = min(ri, rj)
+
+
+def near_duplicate_pairs_lsh(signatures: np.ndarray, bands: int = 16, threshold: float = 0.8):
+    # Yield (leader, i) pairs from LSH buckets whose signatures agree on >= threshold of positions.
+    # Within a bucket rows are compared to a leader at a time (the first row not matched yet), so a
+    # bucket of 10,000 copies costs one vectorized comparison, not 50 million pairs.
+    n, num_perm = signatures.shape
+    rows = num_perm // bands
+    if rows == 0:
+        raise ValueError(f"bands={bands} is larger than num_perm={num_perm}")
+    need = int(np.ceil(threshold * num_perm))
+    for band in range(bands):
+        block = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        keys = block.view(np.dtype((np.void, block.dtype.itemsize * rows))).ravel()
+        _, bucket = np.unique(keys, return_inverse=True)
+        order = np.argsort(bucket.reshape(-1), kind="stable")
+        bounds = np.flatnonzero(np.diff(bucket.reshape(-1)[order])) + 1
+        for members in np.split(order, bounds):
+            while len(members) > 1:
+                leader = members[0]
+                agree = np.count_nonzero(signatures[members] == signatures[leader], axis=1)
+                matched = agree >= need
+                for i in members[matched][1:]:
+                    yield leader, i
+                members = members[~matched]
+
+
+def find_near_duplicate_groups(
+    texts,
+    threshold: float = 0.8,
+    num_perm: int = 128,
+    bands: int = 16,
+    shingle_size: int = 5,
+    seed: int = 0,
+) -> np.ndarray:
+    # For each row, the index of its group's representative (the group's first row).
+    # threshold: minimum estimated Jaccard similarity of word shingles; None = only texts identical
+    # up to whitespace (label-preserving, see the module docstring).
+    texts = list(texts)
+    if threshold is None:
+        return exact_duplicate_groups(texts, normalize=normalize_whitespace)
+    group_rep = exact_duplicate_groups(texts)
+    if len(texts) < 2:
+        return group_rep
+
+    exact_reps = np.flatnonzero(group_rep == np.arange(len(texts)))
+    hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size, seed=seed)
+    signatures = hasher.signatures([normalize_for_hash(texts[i]) for i in exact_reps])
+
+    parent = np.arange(len(exact_reps))
+    for i, j in near_duplicate_pairs_lsh(signatures, bands=bands, threshold=threshold):
+        _union(parent, i, j)
+    roots = np.array([_find(parent, i) for i in range(len(exact_reps))], dtype=np.int64)
+
+    # exact rep -> near-duplicate group's first row, then every row through its exact rep
+    near_rep = np.empty(len(texts), dtype=np.int64)
+    near_rep[exact_reps] = exact_reps[roots]
+    return near_rep[group_rep]
+
+
+def representatives(group_rep: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # rep_rows: row index of each group's representative (ascending);
+    # members: for every row, the position of its group in rep_rows (rep_values[members] fans out)
+    rep_rows, members = np.unique(group_rep, return_inverse=True)
+    return rep_rows, members.reshape(-1)
+
+
+def group_sizes(group_rep: np.ndarray) -> np.ndarray:
+    # Rows per group, aligned with rep_rows (DBSCAN sample_weight for the representatives)
+    return np.unique(group_rep, return_counts=True)[1]
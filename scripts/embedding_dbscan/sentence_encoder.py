@@ -0,0 +1,91 @@
+"""
+Corpus-level batched version of the notebook's embed_document_sentence_level.
+
+embed_document_sentence_level calls model.encode once per comment, so a 3-sentence comment
+is a 3-sentence batch and most of the time goes to Python overhead between tiny forward passes.
+Here the sentences of many comments are split first, flattened (identical sentences, common
+in form letters, are encoded once) and encoded in one model.encode call per chunk, which sorts
+them by length into full batch_size batches. Sentence embeddings are then mean-pooled back to
+documents with a segment sum over each document's sentence offsets.
+
+The result is the same per-document mean of sentence embeddings (documents with no sentence
+left after filtering get zeros). Batching pads sentences together, which can move values by
+float rounding (~1e-6), not more.
+
+    from sentence_encoder import encode_documents_sentence_level
+    X = encode_documents_sentence_level(model, texts)  # (len(texts), dim) float32
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+
+def split_sentences(text, min_sent_len: int = 5, sent_tokenize=None) -> list[str]:
+    # Same steps as embed_document_sentence_level: normalize whitespace, split, drop short sentences
+    if sent_tokenize is None:
+        from nltk.tokenize import sent_tokenize
+    text = " ".join(str(text).split())
+    if not text:
+        return []
+    return [s.strip() for s in sent_tokenize(text) if len(s.strip()) >= min_sent_len]
+
+
+def encode_documents_sentence_level(
+    model,
+    texts,
+    min_sent_len: int = 5,
+    batch_size: int = 128,
+    chunk_sentences: int = 50_000,
+    sent_tokenize=None,
+    progress=None,
+) -> np.ndarray:
+    # (len(texts), dim) float32 document embeddings: mean of each text's sentence embeddings.
+    # chunk_sentences bounds memory: documents are encoded in groups of about that many sentences.
+    # progress: optional wrapper for the chunk loop (e.g. tqdm)
+    if sent_tokenize is None:
+        from nltk.tokenize import sent_tokenize
+    texts = list(texts)
+    dim = model.get_sentence_embedding_dimension()
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+
+    # Split every document, then cut the corpus into chunks of whole documents
+    doc_sentences = [split_sentences(t, min_sent_len, sent_tokenize) for t in texts]
+    chunks, start, total = [], 0, 0
+    for i, sents in enumerate(doc_sentences):
+        total += len(sents)
+        if total >= chunk_sentences:
+            chunks.append((start, i + 1))
+            start, total = i + 1, 0
+    if start < len(texts):
+        chunks.append((start, len(texts)))
+
+    for start, stop in (progress(chunks) if progress else chunks):
+        docs = [i for i in range(start, stop) if doc_sentences[i]]
+        if not docs:
+            continue
+
+        # Flatten, encoding each distinct sentence once
+        unique = {}
+        sentence_rows = [unique.setdefault(s, len(unique)) for i in docs for s in doc_sentences[i]]
+        counts = np.array([len(doc_sentences[i]) for i in docs])
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        # One encode call: sentence-transformers sorts the sentences by length and batches them
+        unique_embeddings = model.encode(
+            list(unique),
+            batch_size=batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        ).astype(np.float32, copy=False)
+
+        # Segment mean over each document's sentences. Rows are added in order, one sentence
+        # position at a time across all documents, which is the float32 summation order of
+        # .mean(axis=0) (np.add.reduceat groups the additions differently and drifts by an ulp)
+        rows = unique_embeddings[sentence_rows]
+        sums = rows[offsets].copy()
+        for k in range(1, counts.max()):
+            longer = np.flatnonzero(counts > k)
+            sums[longer] += rows[offsets[longer] + k]
+        out[docs] = sums / counts[:, None].astype(np.float32)
+    return out
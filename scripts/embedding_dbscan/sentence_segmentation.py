@@ -0,0 +1,134 @@
+"""
+Sentence segmentation as its own, cached stage of the embedding pipeline.
+
+Splitting comments into sentences (whitespace normalization + nltk.sent_tokenize) doesn't depend
+on the embedding model, but it used to be redone inside every embedding run, in one Python loop,
+and long comments with [PDF_TEXT] attachments make it a real share of the runtime. Here it runs
+on a process pool and is saved to disk as sentence (start, end) offsets over each comment's
+whitespace-normalized text, keyed by a hash of that text. Any later embedding run, whatever the
+model or min_sent_len, reads the offsets instead of tokenizing again; new comments are segmented
+and added to the cache.
+
+    segments = SentenceSegmentCache(SENT_CACHE_PATH)
+    segments.segment(texts, workers=4)      # only texts not cached yet are tokenized
+    encode_documents_sentence_level(model, texts, sent_tokenize=segments.sent_tokenize)
+
+Cache file (.npz): keys (16-byte blake2b of the normalized text, as uint8 rows), doc_offsets
+(n_docs + 1, into the span arrays), starts / ends (sentence offsets, stripped of surrounding
+whitespace).
+"""
+
+from __future__ import annotations
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+KEY_BYTES = 16
+SEGMENT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+SEGMENT_CHUNK_SIZE = 2_000
+
+
+def normalize_whitespace(text) -> str:
+    # Same normalization as embed_document_sentence_level, offsets refer to this string
+    return " ".join(str(text).split())
+
+
+def text_key(normalized: str) -> bytes:
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+def sentence_spans(normalized: str, sent_tokenize=None) -> np.ndarray:
+    # (n_sentences, 2) start/end offsets of the stripped sentences of a normalized text
+    if sent_tokenize is None:
+        from nltk.tokenize import sent_tokenize
+    spans, pos = [], 0
+    for sentence in (sent_tokenize(normalized) if normalized else []):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        start = normalized.find(sentence, pos)
+        if start < 0:
+            raise ValueError(f"sentence not found in text at offset {pos}: {sentence[:80]!r}")
+        pos = start + len(sentence)
+        spans.append((start, pos))
+    return np.array(spans, dtype=np.int32).reshape(-1, 2)
+
+
+def _segment_chunk(normalized_texts: list) -> list:
+    return [sentence_spans(t) for t in normalized_texts]
+
+
+class SentenceSegmentCache:
+    """Sentence offsets per normalized comment text, saved to an .npz file."""
+
+    def __init__(self, path: str | None = None):
+        # path=None keeps the cache in memory only
+        self.path = path
+        self._spans = {}  # key -> (n_sentences, 2) offsets
+        if path and os.path.exists(path):
+            with np.load(path) as data:
+                keys, doc_offsets = data["keys"].tobytes(), data["doc_offsets"]
+                spans = np.stack([data["starts"], data["ends"]], axis=1)
+            for i in range(len(doc_offsets) - 1):
+                key = keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]
+                self._spans[key] = spans[doc_offsets[i]:doc_offsets[i + 1]]
+            print(f"[INFO] Loaded sentence offsets of {len(self._spans):,} texts from {path}")
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def segment(self, texts, workers: int = SEGMENT_WORKERS, chunk_size: int = SEGMENT_CHUNK_SIZE):
+        # Tokenize texts that aren't cached yet (across worker processes) and save the cache
+        todo = {}
+        for text in texts:
+            normalized = normalize_whitespace(text)
+            key = text_key(normalized)
+            if key not in self._spans:
+                todo.setdefault(key, normalized)
+        if not todo:
+            return
+
+        print(f"[INFO] Segmenting {len(todo):,} texts into sentences ({workers} workers)")
+        normalized_texts = list(todo.values())
+        chunks = [normalized_texts[i:i + chunk_size] for i in range(0, len(normalized_texts), chunk_size)]
+        if workers <= 1 or len(chunks) == 1:
+            results = [_segment_chunk(chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_segment_chunk, chunks))
+        for key, spans in zip(todo, (s for part in results for s in part)):
+            self._spans[key] = spans
+        if self.path:
+            self.save()
+
+    def save(self):
+        keys = list(self._spans)
+        spans = [self._spans[k] for k in keys]
+        counts = np.array([len(s) for s in spans], dtype=np.int64)
+        flat = np.concatenate(spans) if spans else np.empty((0, 2), dtype=np.int32)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                # raw bytes: a numpy "S" array would drop trailing NUL bytes of a digest
+                keys=np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(-1, KEY_BYTES),
+                doc_offsets=np.concatenate(([0], np.cumsum(counts))),
+                starts=flat[:, 0],
+                ends=flat[:, 1],
+            )
+        os.replace(tmp_path, self.path)
+        print(f"[INFO] Saved sentence offsets of {len(keys):,} texts to {self.path}")
+
+    def spans(self, text) -> np.ndarray | None:
+        return self._spans.get(text_key(normalize_whitespace(text)))
+
+    def sent_tokenize(self, text) -> list[str]:
+        # Drop-in for nltk's sent_tokenize: cached sentences, tokenizing texts that aren't cached
+        normalized = normalize_whitespace(text)
+        spans = self._spans.get(text_key(normalized))
+        if spans is None:
+            spans = sentence_spans(normalized)
+        return [normalized[start:end] for start, end in spans.tolist()]
@@ -0,0 +1,236 @@
+"""
+Sweep the number of LDA topics K on one shared document-term matrix.
+
+healthcare_lda_wordfish.qmd chooses K (output/lda_choosek.png) by fitting a Gibbs LDA for every K
+in seq(10, 210, 20) one after another in a single R session. This runs the sweep from a matrix
+prebuilt by sparse_dtm.py (e.g. --preset lda on data/dbscan_healthcare_unique.csv):
+
+- the matrix is written once as .npy arrays and opened memory-mapped by every worker process,
+  so workers share it instead of each loading or converting the corpus
+- each K is fitted with online (mini-batch) variational LDA (sklearn LatentDirichletAllocation,
+  learning_method="online"), one pass over the training documents at a time, stopping when the
+  held-out perplexity improves by less than PERPLEXITY_TOL
+- the K grid is split into contiguous runs, one per worker; within a run each K starts from the
+  topics of the previous K (the heaviest topics are split to add topics, the lightest dropped to
+  remove them), so it converges in fewer passes than a random start
+
+One table gets, per K, the UMass topic coherence (top TOP_WORDS words, training documents) and
+the perplexity on HOLDOUT_FRACTION of the documents left out of training:
+
+    python scripts/lda_wordfish/lda_k_sweep.py output/dtm/healthcare_lda output/lda_k_sweep.csv --k 10 210 20
+"""
+
+from __future__ import annotations
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import sklearn
+from scipy.special import digamma
+from sklearn.decomposition import LatentDirichletAllocation
+
+from sparse_dtm import DocumentTermMatrix
+
+K_VALUES = list(range(10, 211, 20))  # seq(10, 210, 20)
+SWEEP_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+HOLDOUT_FRACTION = 0.1
+BATCH_SIZE = 128
+MAX_PASSES = 10
+PERPLEXITY_TOL = 1e-2
+LEARNING_DECAY = 0.7
+LEARNING_OFFSET = 10.0
+TOP_WORDS = 10
+SEED = 123
+# Learning-rate schedule position of a warm-started K: the first mini-batch weighs in with
+# (LEARNING_OFFSET + WARM_START_BATCH_ITER) ** -LEARNING_DECAY. Restarting at 1 keeps the split
+# topics and converged in the fewest passes on synthetic corpora; continuing the previous K's
+# schedule (its n_batch_iter_) froze the warm start and ended at a worse held-out perplexity
+WARM_START_BATCH_ITER = 1
+
+# LatentDirichletAllocation has no public way to start from given topics; _warm_start sets the
+# fitted state that partial_fit continues from (written against scikit-learn 1.9;
+# it raises instead of silently cold-starting if a later version changes that state)
+WARM_START_STATE = ("components_", "exp_dirichlet_component_", "n_batch_iter_", "doc_topic_prior_", "topic_word_prior_")
+
+_shared = None  # (train, heldout) matrices of the worker process
+
+
+# ---- shared matrix ----
+def share_matrix(matrix: sp.csr_matrix, directory: str):
+    # CSR arrays as .npy files that workers open with mmap_mode="r"
+    os.makedirs(directory, exist_ok=True)
+    matrix = matrix.tocsr()
+    np.save(os.path.join(directory, "data.npy"), matrix.data.astype(np.float64))
+    np.save(os.path.join(directory, "indices.npy"), matrix.indices)
+    np.save(os.path.join(directory, "indptr.npy"), matrix.indptr)
+    np.save(os.path.join(directory, "shape.npy"), np.array(matrix.shape))
+
+
+def open_shared_matrix(directory: str) -> sp.csr_matrix:
+    arrays = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in ("data", "indices", "indptr")]
+    shape = tuple(np.load(os.path.join(directory, "shape.npy")).tolist())
+    return sp.csr_matrix(tuple(arrays), shape=shape, copy=False)
+
+
+def _init_worker(train_dir: str, heldout_dir: str):
+    global _shared
+    _shared = open_shared_matrix(train_dir), open_shared_matrix(heldout_dir)
+
+
+# ---- topics ----
+def _resize_topics(components: np.ndarray, k: int, rng: np.random.RandomState) -> np.ndarray:
+    # Warm start for k topics from a fitted topic-word matrix (sklearn's components_)
+    components = components.copy()
+    while len(components) < k:
+        # Split the heaviest topic in two slightly different halves
+        i = int(np.argmax(components.sum(axis=1)))
+        noise = rng.gamma(100.0, 0.01, components.shape[1])
+        half = components[i] / 2
+        components[i] = half * noise
+        components = np.vstack([components, half / noise])
+    if len(components) > k:
+        components = components[np.sort(np.argsort(-components.sum(axis=1))[:k])]
+    return components
+
+
+def umass_coherence(components: np.ndarray, X: sp.csr_matrix, top_words: int = TOP_WORDS) -> np.ndarray:
+    # Per topic: sum over pairs of its top words (w_m ranked below w_l) of log((D(w_m, w_l) + 1) / D(w_l))
+    top = np.argsort(-components, axis=1)[:, :top_words]
+    words, position = np.unique(top, return_inverse=True)
+    position = position.reshape(top.shape)
+    B = (X[:, words] > 0).astype(np.float64)
+    co = (B.T @ B).toarray()
+    doc_freq = np.diag(co)
+    scores = np.zeros(len(top))
+    for m in range(1, top.shape[1]):
+        for l in range(m):
+            a, b = position[:, m], position[:, l]
+            scores += np.log((co[a, b] + 1) / np.maximum(doc_freq[b], 1))
+    return scores
+
+
+def _warm_start(lda: LatentDirichletAllocation, init: np.ndarray, n_batch_iter: int = WARM_START_BATCH_ITER):
+    # Fitted state for topics init, as partial_fit would have left it after n_batch_iter - 1 mini-batches
+    if not hasattr(lda, "_init_latent_vars"):
+        raise RuntimeError(
+            f"scikit-learn {sklearn.__version__}: LatentDirichletAllocation._init_latent_vars is gone, update _warm_start"
+        )
+    lda._init_latent_vars(init.shape[1])
+    missing = [name for name in WARM_START_STATE if not hasattr(lda, name)]
+    if missing or lda.components_.shape != init.shape:
+        raise RuntimeError(
+            f"scikit-learn {sklearn.__version__}: unexpected LatentDirichletAllocation state "
+            f"({missing or 'components_ shape'}), update _warm_start"
+        )
+    lda.n_features_in_ = init.shape[1]
+    lda.components_ = init
+    lda.exp_dirichlet_component_ = np.exp(digamma(init) - digamma(init.sum(axis=1))[:, None])
+    lda.n_batch_iter_ = n_batch_iter
+
+
+def _fit_k(k: int, X: sp.csr_matrix, X_heldout: sp.csr_matrix, init: np.ndarray | None):
+    lda = LatentDirichletAllocation(
+        n_components=k,
+        learning_method="online",
+        learning_decay=LEARNING_DECAY,
+        learning_offset=LEARNING_OFFSET,
+        batch_size=BATCH_SIZE,
+        total_samples=X.shape[0],
+        random_state=SEED + k,
+    )
+    if init is not None:
+        _warm_start(lda, init)
+
+    perplexity, passes = np.inf, 0
+    while passes < MAX_PASSES:
+        passes += 1
+        for start in range(0, X.shape[0], BATCH_SIZE):
+            lda.partial_fit(X[start:start + BATCH_SIZE])
+        last, perplexity = perplexity, lda.perplexity(X_heldout)
+        if (last - perplexity) / perplexity < PERPLEXITY_TOL:
+            break
+    return lda, perplexity, passes
+
+
+def sweep_chain(k_values: list) -> list:
+    # Fit k_values in order in this worker, each K warm-started from the previous one
+    X, X_heldout = _shared
+    rows, previous = [], None
+    for k in k_values:
+        start = time.perf_counter()
+        init = None if previous is None else _resize_topics(previous.components_, k, np.random.RandomState(SEED + k))
+        lda, perplexity, passes = _fit_k(k, X, X_heldout, init)
+        rows.append({
+            "K": k,
+            "coherence_umass": float(umass_coherence(lda.components_, X).mean()),
+            "heldout_perplexity": float(perplexity),
+            "passes": passes,
+            "seconds": round(time.perf_counter() - start, 2),
+            "warm_start_from": previous.n_components if previous is not None else None,
+        })
+        print(f"[INFO] K={k}: perplexity {perplexity:,.1f}, coherence {rows[-1]['coherence_umass']:.2f}, {passes} passes")
+        previous = lda
+    return rows
+
+
+def sweep_k(
+    dtm: DocumentTermMatrix,
+    k_values=K_VALUES,
+    workers: int = SWEEP_WORKERS,
+    holdout_fraction: float = HOLDOUT_FRACTION,
+    shared_dir: str | None = None,
+) -> pd.DataFrame:
+    # Coherence and held-out perplexity for each K; shared_dir keeps the memory-mapped matrix
+    # (default: a temporary directory removed afterwards)
+    X = dtm.matrix.tocsr()
+    X = X[np.flatnonzero(np.diff(X.indptr) > 0)]  # LDA needs documents with at least one term
+    order = np.random.RandomState(SEED).permutation(X.shape[0])
+    n_heldout = int(round(holdout_fraction * X.shape[0]))
+    k_values = sorted(k_values)
+    workers = max(1, min(workers, len(k_values)))
+
+    directory = shared_dir or tempfile.mkdtemp(prefix="lda_k_sweep_")
+    try:
+        share_matrix(X[order[n_heldout:]], os.path.join(directory, "train"))
+        share_matrix(X[order[:n_heldout]], os.path.join(directory, "heldout"))
+        del X
+        print(f"[INFO] Sweeping K over {k_values} with {workers} workers ({n_heldout:,} held-out documents)")
+        chains = [chain.tolist() for chain in np.array_split(k_values, workers)]
+        init_args = (os.path.join(directory, "train"), os.path.join(directory, "heldout"))
+        if workers == 1:
+            _init_worker(*init_args)
+            results = [sweep_chain(chains[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as pool:
+                results = list(pool.map(sweep_chain, chains))
+    finally:
+        if shared_dir is None:
+            shutil.rmtree(directory, ignore_errors=True)
+    table = pd.DataFrame([row for chain in results for row in chain]).sort_values("K", ignore_index=True)
+    return table.astype({"warm_start_from": "Int64"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dtm", help="prefix of a matrix saved by sparse_dtm.py, e.g. output/dtm/healthcare_lda")
+    parser.add_argument("out", help="output CSV, e.g. output/lda_k_sweep.csv")
+    parser.add_argument("--k", type=int, nargs=3, metavar=("FROM", "TO", "BY"), help="K grid as R's seq(from, to, by)")
+    parser.add_argument("--workers", type=int, default=SWEEP_WORKERS)
+    args = parser.parse_args()
+
+    k_values = list(range(args.k[0], args.k[1] + 1, args.k[2])) if args.k else K_VALUES
+    table = sweep_k(DocumentTermMatrix.load(args.dtm), k_values, workers=args.workers)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    table.to_csv(args.out, index=False)
+    print(table.to_string(index=False))
+    print(f"[INFO] Saved K sweep to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Document-term matrix builder for the LDA / Wordfish analyses.
+
+Every .qmd in this folder retokenizes the de-duplicated comment CSVs with quanteda (tokens ->
+dfm -> dfm_remove(stopwords("en")) -> dfm_trim(min_docfreq = 2)), once per script and docket.
+This builds the same matrix once, streaming the CSV in chunks, as a SciPy CSR matrix (documents x
+terms, integer counts) with its vocabulary and commentId index, and saves it as .npz (Python) and
+Matrix Market .mtx (R: Matrix::readMM) so the models load a prebuilt matrix:
+
+    python scripts/lda_wordfish/sparse_dtm.py data/dbscan_healthcare_unique.csv output/dtm/healthcare_lda --preset lda
+    dtm = DocumentTermMatrix.load("output/dtm/healthcare_lda")    # .matrix, .vocabulary, .doc_ids
+
+    # R (quanteda)
+    m <- as(Matrix::readMM("output/dtm/healthcare_lda.mtx"), "CsparseMatrix")
+    dimnames(m) <- list(readLines("output/dtm/healthcare_lda_docs.txt"),
+                        readLines("output/dtm/healthcare_lda_vocab.txt", encoding = "UTF-8"))
+    dfm_data <- as.dfm(m)
+
+Preprocessing follows quanteda's defaults as used in the scripts: words are lowercased (dfm),
+hyphenated words and contractions stay one token, punctuation and symbols are dropped,
+remove_numbers drops number tokens, stopwords are quanteda's stopwords("en") (Snowball list),
+min_nchar and stem (Snowball English stemmer, nltk) match tokens_keep / tokens_wordstem, and
+min_docfreq matches dfm_trim. Tokens come from a regex instead of ICU word boundaries, so counts
+can differ slightly for unusual strings (URLs and emails are split into words, hashtags,
+non-Latin scripts).
+
+n_features switches to a hashing vocabulary (crc32 of the term modulo n_features): memory for
+terms is capped at n_features whatever the corpus size, terms that collide share a column, and
+each column is named after the first term seen in it.
+"""
+
+from __future__ import annotations
+import argparse
+import os
+import re
+import zlib
+from array import array
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import scipy.io
+import scipy.sparse as sp
+
+ID_COL = "commentId"
+TEXT_COL = "text_clean"
+CSV_CHUNK_ROWS = 50_000
+
+# quanteda stopwords("en") (stopwords package, Snowball source)
+STOPWORDS_EN = frozenset("""
+i me my myself we our ours ourselves you your yours yourself yourselves he him his himself she
+her hers herself it its itself they them their theirs themselves what which who whom this that
+these those am is are was were be been being have has had having do does did doing would should
+could ought i'm you're he's she's it's we're they're i've you've we've they've i'd you'd he'd
+she'd we'd they'd i'll you'll he'll she'll we'll they'll isn't aren't wasn't weren't hasn't
+haven't hadn't doesn't don't didn't won't wouldn't shan't shouldn't can't cannot couldn't
+mustn't let's that's who's what's here's there's when's where's why's how's a an the and but if
+or because as until while of at by for with about against between into through during before
+after above below to from up down in out on off over under again further then once here there
+when where why how all any both each few more most other some such no nor not only own same so
+than too very will
+""".split())
+
+# Settings of the quanteda pipelines in this folder
+PRESETS = {
+    # energy_lda.qmd / healthcare_lda_wordfish.qmd LDA: numbers removed, min_docfreq 2, empty docs dropped
+    "lda": dict(remove_numbers=True, min_docfreq=2, drop_empty=True),
+    # healthcare_lda_wordfish.qmd Wordfish: numbers and URLs removed, stemmed, min_docfreq 2
+    "wordfish": dict(remove_numbers=True, remove_url=True, stem=True, min_docfreq=2),
+    # energy_wordfish_bootlegger_baptist_analysis.qmd: terms of 2+ characters, stemmed
+    "wordfish_energy": dict(min_nchar=2, stem=True),
+}
+
+# ---- tokenizer ----
+# Numbers with separators ("1,000", "3.5") first, then words, joined by inner hyphens/apostrophes
+TOKEN_RE = re.compile(r"\d+(?:[.,]\d+)+|[^\W_]+(?:[-'][^\W_]+)*")
+NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+URL_RE = re.compile(r"(?:https?://|www\.)\S+", re.IGNORECASE)
+
+
+def make_tokenizer(
+    remove_numbers: bool = False,
+    remove_url: bool = False,
+    stopwords=STOPWORDS_EN,
+    min_nchar: int = 1,
+    stem: bool = False,
+):
+    # Returns tokenize(text) -> list of terms, with the quanteda steps above applied in order
+    stopwords = frozenset(stopwords or ())
+    stemmer = None
+    if stem:
+        from nltk.stem.snowball import SnowballStemmer
+        stemmer = SnowballStemmer("english").stem
+    stems = {}
+
+    def tokenize(text) -> list:
+        if not isinstance(text, str):
+            return []
+        text = text.lower().replace("’", "'")  # stopwords("en") spells contractions with '
+        if remove_url:
+            text = URL_RE.sub(" ", text)
+        terms = []
+        for token in TOKEN_RE.findall(text):
+            if remove_numbers and NUMBER_RE.fullmatch(token):
+                continue
+            if token in stopwords or len(token) < min_nchar:
+                continue
+            if stemmer is not None:
+                stemmed = stems.get(token)
+                if stemmed is None:
+                    stemmed = stems[token] = stemmer(token)
+                token = stemmed
+            terms.append(token)
+        return terms
+
+    return tokenize
+
+
+def iter_csv_documents(path: str, id_col: str = ID_COL, text_col: str = TEXT_COL, chunksize: int = CSV_CHUNK_ROWS):
+    # (doc_id, text) pairs of a comments CSV, read chunksize rows at a time
+    for chunk in pd.read_csv(path, usecols=[id_col, text_col], dtype={id_col: str}, chunksize=chunksize):
+        yield from zip(chunk[id_col].tolist(), chunk[text_col].tolist())
+
+
+# ---- matrix ----
+class DocumentTermMatrix:
+    """CSR document-term counts with the vocabulary (columns) and document ids (rows)."""
+
+    def __init__(self, matrix: sp.csr_matrix, vocabulary: list, doc_ids: list):
+        if matrix.shape != (len(doc_ids), len(vocabulary)):
+            raise ValueError(f"matrix shape {matrix.shape} != ({len(doc_ids)} docs, {len(vocabulary)} terms)")
+        self.matrix = matrix
+        self.vocabulary = list(vocabulary)
+        self.doc_ids = list(doc_ids)
+
+    @property
+    def shape(self) -> tuple:
+        return self.matrix.shape
+
+    @classmethod
+    def build(
+        cls,
+        documents,
+        min_docfreq: int = 1,
+        drop_empty: bool = False,
+        n_features: int | None = None,
+        exclude_ids=(),
+        tokenize=None,
+        progress_every: int = 100_000,
+        **tokenizer_options,
+    ) -> "DocumentTermMatrix":
+        # documents: iterable of (doc_id, text), e.g. iter_csv_documents(path); read once, in order.
+        # n_features: hashing vocabulary of that many columns instead of one column per term
+        tokenize = tokenize or make_tokenizer(**tokenizer_options)
+        exclude_ids = set(exclude_ids)
+        columns = {}  # term -> column (exact vocabulary)
+        bucket_names = {}  # column -> first term hashed to it (hashing vocabulary)
+        indptr, indices, data = array("q", [0]), array("i"), array("i")
+        doc_ids = []
+
+        for doc_id, text in documents:
+            if doc_id in exclude_ids:
+                continue
+            terms = tokenize(text)
+            if n_features is None:
+                counts = Counter(columns.setdefault(t, len(columns)) for t in terms)
+            else:
+                counts = Counter()
+                for t in terms:
+                    col = zlib.crc32(t.encode("utf-8")) % n_features
+                    counts[col] += 1
+                    bucket_names.setdefault(col, t)
+            indices.extend(counts.keys())
+            data.extend(counts.values())
+            indptr.append(len(indices))
+            doc_ids.append(doc_id)
+            if progress_every and len(doc_ids) % progress_every == 0:
+                print(f"[INFO] Tokenized {len(doc_ids):,} documents, {len(columns) or len(bucket_names):,} terms")
+
+        if n_features is None:
+            n_cols, vocabulary = len(columns), list(columns)  # terms in order of first appearance
+        else:
+            n_cols = n_features
+            vocabulary = [bucket_names.get(col, "") for col in range(n_features)]
+        matrix = sp.csr_matrix(
+            (np.frombuffer(data, dtype=np.int32), np.frombuffer(indices, dtype=np.int32), np.frombuffer(indptr, dtype=np.int64)),
+            shape=(len(doc_ids), n_cols),
+        )
+        matrix.sort_indices()
+        dtm = cls(matrix, vocabulary, doc_ids)
+
+        # Hashing columns nothing was hashed to have docfreq 0 and are always dropped
+        dtm = dtm.trim(min_docfreq=max(min_docfreq, 1))
+        if drop_empty:
+            dtm = dtm.drop_empty()
+        print(f"[INFO] Document-term matrix: {dtm.shape[0]:,} documents x {dtm.shape[1]:,} terms, {dtm.matrix.nnz:,} non-zeros")
+        return dtm
+
+    def docfreq(self) -> np.ndarray:
+        return np.bincount(self.matrix.indices, minlength=self.shape[1])
+
+    def trim(self, min_docfreq: int = 2) -> "DocumentTermMatrix":
+        # dfm_trim(min_docfreq = ...): keep terms that occur in at least min_docfreq documents
+        keep = np.flatnonzero(self.docfreq() >= min_docfreq)
+        if len(keep) == self.shape[1]:
+            return self
+        return DocumentTermMatrix(self.matrix[:, keep], [self.vocabulary[i] for i in keep], self.doc_ids)
+
+    def drop_empty(self) -> "DocumentTermMatrix":
+        # dfm[rowSums(dfm) > 0, ]: drop documents left without any term
+        keep = np.flatnonzero(np.diff(self.matrix.indptr) > 0)
+        if len(keep) == self.shape[0]:
+            return self
+        print(f"[INFO] Dropped {self.shape[0] - len(keep):,} empty documents")
+        return DocumentTermMatrix(self.matrix[keep], self.vocabulary, [self.doc_ids[i] for i in keep])
+
+    # ---- export ----
+    def save(self, prefix: str, formats=("npz", "mtx")):
+        # <prefix>.npz / <prefix>.mtx plus <prefix>_vocab.txt and <prefix>_docs.txt (one per line)
+        os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+        for fmt in formats:
+            if fmt == "npz":
+                sp.save_npz(prefix + ".npz", self.matrix)
+            elif fmt == "mtx":
+                scipy.io.mmwrite(prefix + ".mtx", self.matrix, field="integer")
+            else:
+                raise ValueError(f'format must be "npz" or "mtx", got {fmt!r}')
+        _write_lines(prefix + "_vocab.txt", self.vocabulary)
+        _write_lines(prefix + "_docs.txt", self.doc_ids)
+        print(f"[INFO] Saved {self.shape[0]:,} x {self.shape[1]:,} matrix to {prefix} ({', '.join(formats)})")
+
+    @classmethod
+    def load(cls, prefix: str) -> "DocumentTermMatrix":
+        if os.path.exists(prefix + ".npz"):
+            matrix = sp.load_npz(prefix + ".npz").tocsr()
+        else:
+            matrix = sp.csr_matrix(scipy.io.mmread(prefix + ".mtx"))
+        return cls(matrix, _read_lines(prefix + "_vocab.txt"), _read_lines(prefix + "_docs.txt"))
+
+
+def _write_lines(path: str, values):
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        for value in values:
+            f.write(f"{value}\n")
+
+
+def _read_lines(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv", help="comments CSV (commentId, text_clean), e.g. data/dbscan_healthcare_unique.csv")
+    parser.add_argument("prefix", help="output path prefix, e.g. output/dtm/healthcare_lda")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="lda")
+    parser.add_argument("--min-docfreq", type=int, help="override the preset's min_docfreq")
+    parser.add_argument("--n-features", type=int, help="hashing vocabulary with this many columns")
+    parser.add_argument("--exclude-ids", help="file with commentIds to leave out, one per line")
+    parser.add_argument("--formats", nargs="+", default=["npz", "mtx"], choices=["npz", "mtx"])
+    args = parser.parse_args()
+
+    options = dict(PRESETS[args.preset])
+    if args.min_docfreq is not None:
+        options["min_docfreq"] = args.min_docfreq
+    exclude_ids = _read_lines(args.exclude_ids) if args.exclude_ids else ()
+    dtm = DocumentTermMatrix.build(
+        iter_csv_documents(args.csv), n_features=args.n_features, exclude_ids=exclude_ids, **options
+    )
+    dtm.save(args.prefix, formats=args.formats)
+
+
+if __name__ == "__main__":
+    main()
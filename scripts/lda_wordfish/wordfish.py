@@ -0,0 +1,301 @@
+"""
+Wordfish scaling on a sparse document-term matrix (quanteda.textmodels::textmodel_wordfish in Python).
+
+The R scripts run textmodel_wordfish on a dense copy of dfm_fish, which only fits the deduplicated
+dbscan_*_combined.csv subsets. This fits the same Poisson model,
+
+    counts[i, j] ~ Poisson(exp(alpha[i] + psi[j] + beta[j] * theta[i]))
+
+with the same algorithm (start values from the SVD of the chi-square residuals, alternating
+Newton updates of the word (psi, beta) and document (alpha, theta) parameters, priors
+c(Inf, Inf, 3, 1), stop when the log posterior changes by less than tol[0] relative, direction
+fixed by dir) on a scipy CSR matrix, so it scales to the full raw corpus:
+
+- each Newton update is done for all words (then all documents) at once; the parameters of one
+  word only depend on the documents' and vice versa, so this is the same fit as R's loops
+- the count terms use sparse products; the expected counts exp(...) are summed over blocks of
+  documents x words on n_threads threads, never holding a dense documents x words matrix
+- identical documents (form letters) have identical parameters at every step, so each distinct
+  row of counts is fitted once with its number of copies as weight
+
+    dtm = DocumentTermMatrix.load("output/dtm/healthcare_wordfish")
+    fit = textmodel_wordfish(dtm, dir=(63, 131))    # R: textmodel_wordfish(dfm_fish, dir = c(64, 132))
+    fit.theta, fit.beta, fit.save("output/wordfish/healthcare")
+
+Iterations run until that tolerance is met or max_iter (MAX_OUTER_ITER) is reached, with a warning
+in that case. Large or weakly identified matrices can need several hundred iterations, and a fit
+cut off early returns positions that are not converged.
+
+dir is 0-based here (the CLI's --dir takes R's 1-based indices). As in R, documents and words
+without any count are dropped first and dir refers to the remaining documents. Only the Poisson
+model (R's default dispersion = "poisson") is implemented.
+"""
+
+from __future__ import annotations
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.linalg import LinearOperator, svds
+from scipy.special import gammaln
+
+from sparse_dtm import DocumentTermMatrix
+
+PRIORS = (np.inf, np.inf, 3.0, 1.0)  # prior sd of alpha, psi, beta, theta
+TOL = (1e-6, 1e-8)  # log posterior (relative), Newton step
+MAX_OUTER_ITER = 1000
+MAX_INNER_ITER = 10
+TILE_ELEMENTS = 2 ** 21  # documents x words per block of expected counts (16 MB of float64)
+DENSE_SVD_ELEMENTS = 2 ** 22
+WORDFISH_THREADS = os.cpu_count() or 1
+
+
+class WordfishFit:
+    """Estimated Wordfish parameters; document arrays follow docs, word arrays follow features."""
+
+    def __init__(self, docs, features, theta, alpha, se_theta, beta, psi, n_iter, log_posterior):
+        self.docs, self.features = list(docs), list(features)
+        self.theta, self.alpha, self.se_theta = theta, alpha, se_theta
+        self.beta, self.psi = beta, psi
+        self.n_iter, self.log_posterior = n_iter, log_posterior
+
+    def documents(self) -> pd.DataFrame:
+        return pd.DataFrame({"docname": self.docs, "theta": self.theta, "se_theta": self.se_theta, "alpha": self.alpha})
+
+    def words(self) -> pd.DataFrame:
+        return pd.DataFrame({"feature": self.features, "beta": self.beta, "psi": self.psi})
+
+    def save(self, prefix: str):
+        # <prefix>_documents.csv (docname, theta, se_theta, alpha), <prefix>_words.csv (feature, beta, psi)
+        os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+        self.documents().to_csv(prefix + "_documents.csv", index=False)
+        self.words().to_csv(prefix + "_words.csv", index=False)
+        print(f"[INFO] Saved Wordfish positions of {len(self.docs):,} documents and {len(self.features):,} words to {prefix}_*.csv")
+
+
+# ---- expected counts ----
+def _row_blocks(n_rows: int, n_cols: int) -> list:
+    size = max(1, TILE_ELEMENTS // max(n_cols, 1))
+    return [(start, min(start + size, n_rows)) for start in range(0, n_rows, size)]
+
+
+def _word_sums(pool, alpha, theta, weights, psi, beta) -> np.ndarray:
+    # (3, n_words): sum over documents of weight * theta^m * exp(alpha + psi + beta * theta), m = 0, 1, 2
+    def block(span):
+        r0, r1 = span
+        E = np.exp(alpha[r0:r1, None] + psi[None, :] + theta[r0:r1, None] * beta[None, :])
+        w = weights[r0:r1]
+        t = theta[r0:r1]
+        return np.stack([w, w * t, w * t * t]) @ E
+
+    return sum(pool.map(block, _row_blocks(len(alpha), len(psi))), np.zeros((3, len(psi))))
+
+
+def _doc_sums(pool, alpha, theta, psi, beta) -> np.ndarray:
+    # (n_docs, 3): sum over words of beta^m * exp(alpha + psi + beta * theta), m = 0, 1, 2
+    B = np.stack([np.ones_like(beta), beta, beta * beta], axis=1)
+
+    def block(span):
+        r0, r1 = span
+        return np.exp(alpha[r0:r1, None] + psi[None, :] + theta[r0:r1, None] * beta[None, :]) @ B
+
+    return np.concatenate(list(pool.map(block, _row_blocks(len(alpha), len(psi)))) or [np.zeros((0, 3))])
+
+
+def _newton_2x2(G0, G1, H00, H01, H11, step):
+    det = H00 * H11 - H01 * H01
+    return step * (H11 * G0 - H01 * G1) / det, step * (H00 * G1 - H01 * G0) / det
+
+
+# ---- start values ----
+def _collapse_duplicate_rows(Y: sp.csr_matrix):
+    # Distinct rows of Y, their number of copies, and the distinct row of every original row
+    Y = Y.tocsr()
+    Y.sort_indices()
+    keys = [
+        Y.indices[Y.indptr[i]:Y.indptr[i + 1]].tobytes() + b"|" + Y.data[Y.indptr[i]:Y.indptr[i + 1]].tobytes()
+        for i in range(Y.shape[0])
+    ]
+    first, inverse = {}, np.empty(len(keys), dtype=np.int64)
+    for i, key in enumerate(keys):
+        inverse[i] = first.setdefault(key, len(first))
+    unique_rows = np.unique(inverse, return_index=True)[1]
+    weights = np.bincount(inverse).astype(np.float64)
+    return Y[unique_rows], weights, inverse
+
+
+def _leading_left_singular_vector(Yu, weights, rsum, csum, total):
+    # First left singular vector of the chi-square residuals C = (Y - r c' / total) / sqrt(r c' / total)
+    # of the full matrix (every copy of a row included), given per distinct row
+    # C = Dr Y Dc - er ec' with Dr = diag(1 / er), Dc = diag(1 / ec)
+    expected_r, expected_c = np.sqrt(rsum / total), np.sqrt(csum)
+    dr, dc = 1 / expected_r, 1 / expected_c
+    sw = np.sqrt(weights)
+
+    def Cw_mv(v):  # (W^1/2 C) v
+        v = np.ravel(v)
+        return sw * (dr * (Yu @ (dc * v)) - expected_r * (expected_c @ v))
+
+    def Cw_rmv(u):  # (W^1/2 C)' u
+        u = np.ravel(u) * sw
+        return dc * (Yu.T @ (dr * u)) - expected_c * (expected_r @ u)
+
+    n, k = Yu.shape
+    if n * k <= DENSE_SVD_ELEMENTS or min(n, k) < 3:
+        Cw = sw[:, None] * (dr[:, None] * Yu.toarray() * dc[None, :] - np.outer(expected_r, expected_c))
+        _, s, Vt = np.linalg.svd(Cw, full_matrices=False)
+        v, s0 = Vt[0], s[0]
+    else:
+        op = LinearOperator((n, k), matvec=Cw_mv, rmatvec=Cw_rmv, dtype=np.float64)
+        _, s, Vt = svds(op, k=1, v0=np.ones(min(n, k)), random_state=0)
+        v, s0 = Vt[0], s[0]
+    # Same right singular vectors with or without duplicate rows; u_i = C_i v / s
+    return (dr * (Yu @ (dc * v)) - expected_r * (expected_c @ v)) / s0
+
+
+def textmodel_wordfish(
+    dtm,
+    dir=(0, 1),
+    priors=PRIORS,
+    tol=TOL,
+    max_iter: int = MAX_OUTER_ITER,
+    n_threads: int = WORDFISH_THREADS,
+    verbose: bool = True,
+) -> WordfishFit:
+    # dtm: DocumentTermMatrix or a (documents x words) scipy sparse matrix of counts
+    if isinstance(dtm, DocumentTermMatrix):
+        Y, docs, features = dtm.matrix, dtm.doc_ids, dtm.vocabulary
+    else:
+        Y = sp.csr_matrix(dtm)
+        docs, features = list(range(Y.shape[0])), list(range(Y.shape[1]))
+    Y = sp.csr_matrix(Y, dtype=np.float64)
+
+    # Drop documents and words without counts, as textmodel_wordfish does
+    keep_docs = np.flatnonzero(np.asarray(Y.sum(axis=1)).ravel() > 0)
+    keep_words = np.flatnonzero(np.asarray(Y.sum(axis=0)).ravel() > 0)
+    if len(keep_docs) < Y.shape[0] or len(keep_words) < Y.shape[1]:
+        print(f"[INFO] Dropped {Y.shape[0] - len(keep_docs):,} empty documents and {Y.shape[1] - len(keep_words):,} zero-count words")
+        Y = Y[keep_docs][:, keep_words]
+        docs, features = [docs[i] for i in keep_docs], [features[j] for j in keep_words]
+    n_docs = Y.shape[0]
+    if not all(0 <= d < n_docs for d in dir) or len(dir) != 2:
+        raise ValueError(f"dir must be two document indices below {n_docs}, got {dir}")
+    prec_alpha, prec_psi, prec_beta, prec_theta = (1 / np.asarray(priors, dtype=np.float64) ** 2).tolist()
+
+    Yu, weights, inverse = _collapse_duplicate_rows(Y)
+    n = Yu.shape[0]
+    if verbose:
+        print(f"[INFO] Wordfish on {n_docs:,} documents ({n:,} distinct) x {Y.shape[1]:,} words, {n_threads} threads")
+
+    # Count terms that don't depend on the parameters
+    rsum = np.asarray(Yu.sum(axis=1)).ravel()
+    csum = np.asarray(Yu.T @ weights).ravel()
+    total = float(weights @ rsum)
+    YuT = Yu.T.tocsr()
+    log_factorials = Yu.copy()
+    log_factorials.data = gammaln(log_factorials.data + 1)
+    log_factorials = float(weights @ np.asarray(log_factorials.sum(axis=1)).ravel())
+
+    # Start values
+    theta = np.sqrt(total / rsum) * _leading_left_singular_vector(Yu, weights, rsum, csum, total)
+    mean = (weights @ theta) / n_docs
+    sd = np.sqrt((weights @ (theta - mean) ** 2) / (n_docs - 1))
+    theta = (theta - mean) / sd
+    alpha = np.log(rsum) - np.log(total / n_docs)
+    psi = np.log(csum / n_docs)
+    beta = np.zeros(len(psi))
+
+    def log_posterior(word_sums):
+        lp = -0.5 * (
+            (prec_alpha * (weights @ alpha ** 2) if prec_alpha else 0.0)
+            + (prec_psi * (psi @ psi) if prec_psi else 0.0)
+            + prec_beta * (beta @ beta)
+            + prec_theta * (weights @ theta ** 2)
+        )
+        # sum of counts * log(mu) - mu - log(counts!)
+        lp += (weights * rsum) @ alpha + csum @ psi + beta @ (YuT @ (weights * theta))
+        return lp - word_sums[0].sum() - log_factorials
+
+    with ThreadPoolExecutor(max_workers=max(1, n_threads)) as pool:
+        word_sums = _word_sums(pool, alpha, theta, weights, psi, beta)
+        lp, last_lp, outer = log_posterior(word_sums), -2e12, 0
+        err = abs((lp - last_lp) / lp)
+        while err > tol[0] and outer < max_iter:
+            outer += 1
+            first_step = 0.5 if outer == 1 else 1.0
+
+            # Word parameters; words whose Newton step falls below tol[1] stop updating
+            active = np.arange(len(psi))
+            Yt_theta = YuT @ (weights * theta)
+            sums, step = word_sums, first_step
+            for _ in range(MAX_INNER_ITER):
+                d_psi, d_beta = _newton_2x2(
+                    csum[active] - sums[0] - psi[active] * prec_psi,
+                    Yt_theta[active] - sums[1] - beta[active] * prec_beta,
+                    -sums[0] - prec_psi, -sums[1], -sums[2] - prec_beta, step,
+                )
+                psi[active] -= d_psi
+                beta[active] -= d_beta
+                active = active[np.maximum(np.abs(d_psi), np.abs(d_beta)) > tol[1]]
+                if not len(active):
+                    break
+                sums, step = _word_sums(pool, alpha, theta, weights, psi[active], beta[active]), 1.0
+
+            # Document parameters
+            active = np.arange(n)
+            Y_beta = Yu @ beta
+            step = first_step
+            for _ in range(MAX_INNER_ITER):
+                sums = _doc_sums(pool, alpha[active], theta[active], psi, beta).T
+                d_alpha, d_theta = _newton_2x2(
+                    rsum[active] - sums[0] - alpha[active] * prec_alpha,
+                    Y_beta[active] - sums[1] - theta[active] * prec_theta,
+                    -sums[0] - prec_alpha, -sums[1], -sums[2] - prec_theta, step,
+                )
+                alpha[active] -= d_alpha
+                theta[active] -= d_theta
+                active = active[np.maximum(np.abs(d_alpha), np.abs(d_theta)) > tol[1]]
+                if not len(active):
+                    break
+                step = 1.0
+
+            word_sums = _word_sums(pool, alpha, theta, weights, psi, beta)
+            last_lp, lp = lp, log_posterior(word_sums)
+            err = abs((lp - last_lp) / lp)
+            if verbose:
+                print(f"[INFO] iteration {outer}: log posterior {lp:,.2f}")
+
+        # Global polarity: the first dir document gets the lower position
+        if theta[inverse[dir[0]]] > theta[inverse[dir[1]]]:
+            beta, theta = -beta, -theta
+
+        # Standard errors of theta from the document Hessian
+        sums = _doc_sums(pool, alpha, theta, psi, beta).T
+        H00, H01, H11 = -sums[0] - prec_alpha, -sums[1], -sums[2] - prec_theta
+        se_theta = np.sqrt(-H00 / (H00 * H11 - H01 * H01))
+
+    if outer == max_iter and err > tol[0]:
+        print(f"[WARN] Wordfish stopped after {max_iter} iterations without converging (raise max_iter)")
+    return WordfishFit(docs, features, theta[inverse], alpha[inverse], se_theta[inverse], beta, psi, outer, lp)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dtm", help="prefix of a matrix saved by sparse_dtm.py, e.g. output/dtm/healthcare_wordfish")
+    parser.add_argument("out", help="output prefix, e.g. output/wordfish/healthcare")
+    parser.add_argument("--dir", type=int, nargs=2, default=[1, 2], help="anchor documents, 1-based as R's dir")
+    parser.add_argument("--threads", type=int, default=WORDFISH_THREADS)
+    parser.add_argument("--max-iter", type=int, default=MAX_OUTER_ITER)
+    args = parser.parse_args()
+
+    fit = textmodel_wordfish(
+        DocumentTermMatrix.load(args.dtm), dir=(args.dir[0] - 1, args.dir[1] - 1), max_iter=args.max_iter, n_threads=args.threads
+    )
+    fit.save(args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,622 @@
+"""
+Run the comment pipeline as a DAG of stages, rerunning only what is out of date.
+
+    scrape:{docket} (one per docket) -> combine -> embed -> cluster -> postprocess
+                                           combine -> search_index (with FTS_INDEX)
+
+Each stage declares the files it reads (inputs), the files or directories it writes (outputs) and
+the settings that change its result (params). Its fingerprint is a hash of the params, of the
+content of its inputs and of its code (the stage function and the modules it calls). After a stage
+runs, the fingerprint and the hashes of its outputs are saved to pipeline_state.json in DATA_DIR;
+a later run skips the stage while a saved run has the same fingerprint and unchanged outputs.
+Downstream stages see the new output hashes, so changing e.g. EPS reruns cluster and postprocess
+only, and a stage whose rerun writes identical output does not invalidate anything below it.
+File hashes are cached by size + mtime, so unchanged files are not read again.
+
+Stages that don't depend on each other (the dockets) run at the same time on PIPELINE_WORKERS
+threads; the scrape stages share the scraper's request budget (RATE_LIMITER) as in crawl_dockets.
+The remote docket can't be hashed, so scrape stages only rerun (a delta sync) when forced: their
+fingerprint leaves out the scraper's code, since an edit to 01 shouldn't spend API quota re-syncing.
+
+    python scripts/run_pipeline.py                       # run what is out of date
+    python scripts/run_pipeline.py --dry-run             # show what would run and why
+    python scripts/run_pipeline.py --set EPS=0.07        # only cluster + postprocess rerun
+    python scripts/run_pipeline.py --force scrape        # delta-sync every docket, then what changed
+    python scripts/run_pipeline.py --until embed         # embed and what it depends on
+"""
+
+from __future__ import annotations
+import argparse
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from graphlib import TopologicalSorter
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPTS_DIR / "scraping_clean_combine"))
+sys.path.insert(0, str(SCRIPTS_DIR / "embedding_dbscan"))
+
+# ---- config ----
+DATA_DIR = "data/pipeline"  # <<< !!! Change your data directory here !!!
+PREFIX = "irs_multi"
+# (docket ID, priority) as in 01: higher priority dockets get the shared request budget first
+DOCKETS = [("IRS-2023-0042", 1), ("IRS-2023-0066", 1)]  # <<< !!! Change your docket IDs here !!!
+API_KEY = ""  # regulations.gov API key (empty: the one set in 01_scrape_docket_metadata_and_pdfs.py)
+
+# scrape
+PAGE_SIZE = 250
+FETCH_WORKERS = 8
+PDF_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+HTTP_CACHE = True  # 01's content cache of details + PDFs in scrape/http_cache (False: none)
+
+# combine / clean
+SECTION_CODES = []  # e.g. ["45Q", "45V", "179D"], as in 02_combine_clean_ira_comments.py
+CLEAN_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+COMBINE_FORMATS = ["csv"]  # 02's OUTPUT_FORMATS; the next stages read the CSV
+FTS_INDEX = True  # full-text index of the clean comments (comments_fts_index.py)
+
+# embed
+MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+MAX_SEQ_LENGTH = 128
+MIN_SENT_LEN = 5
+# None: identical texts only, same labels as clustering every comment; a Jaccard threshold
+# (e.g. 0.8) opts into near-duplicate grouping: fewer to embed, but labels can differ
+NEAR_DUP_THRESHOLD = None
+EMBED_DTYPE = "float32"
+EMBED_BATCH_SIZE = 4096
+
+# cluster
+EPS = 0.05
+MIN_SAMPLES = 5
+DBSCAN_METHOD = "exact"
+
+# Stages running at the same time
+PIPELINE_WORKERS = 4
+STATE_FILE = "pipeline_state.json"
+RUNS_KEPT = 8  # saved runs per stage (fingerprint + output hashes)
+HASH_CHUNK_SIZE = 1024 ** 2
+
+
+# ---- hashing ----
+class FileHashes:
+    """sha256 of files and directories, cached by (size, mtime) so unchanged files aren't reread."""
+
+    def __init__(self, cache: dict | None = None, lock: threading.Lock | None = None):
+        # lock: shared with whoever saves the cache while hashing goes on in other threads
+        self.cache = cache if cache is not None else {}
+        self._lock = lock or threading.Lock()
+
+    def _file(self, path: str) -> str:
+        st = os.stat(path)
+        with self._lock:
+            cached = self.cache.get(path)
+        if cached and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+            return cached["sha256"]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                h.update(chunk)
+        with self._lock:
+            self.cache[path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": h.hexdigest()}
+        return h.hexdigest()
+
+    def path(self, path: str) -> str | None:
+        # None if missing; a directory hashes its files' relative paths and contents
+        path = os.path.abspath(path)
+        if os.path.isfile(path):
+            return self._file(path)
+        if not os.path.isdir(path):
+            return None
+        h = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(".tmp"):
+                    continue
+                full = os.path.join(root, name)
+                h.update(os.path.relpath(full, path).encode() + b"\0" + self._file(full).encode() + b"\n")
+        return h.hexdigest()
+
+
+def _write_json_atomic(path: str, obj):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# ---- DAG ----
+class Stage:
+    """One pipeline step: func(**params, **options) reads inputs and writes outputs.
+
+    params are part of the fingerprint, options (workers, batch sizes) are not. code lists module
+    files whose changes should rerun the stage, in addition to the source of func itself;
+    track_code=False leaves code out of the fingerprint (stages that only rerun when forced).
+    """
+
+    def __init__(self, name: str, func, inputs=(), outputs=(), params=None, options=None, code=(), track_code: bool = True):
+        self.name = name
+        self.func = func
+        self.inputs = [os.path.abspath(p) for p in inputs]
+        self.outputs = [os.path.abspath(p) for p in outputs]
+        self.params = dict(params or {})
+        self.options = dict(options or {})
+        self.code = [os.path.abspath(p) for p in code]
+        self.track_code = track_code
+
+    def matches(self, pattern: str) -> bool:
+        # "scrape" matches every scrape:{docket} stage
+        return self.name == pattern or self.name.startswith(pattern + ":")
+
+
+class Pipeline:
+    """Stages linked by their files: a stage depends on the stages that write its inputs."""
+
+    def __init__(self, stages: list, state_dir: str, workers: int = PIPELINE_WORKERS):
+        self.stages = {s.name: s for s in stages}
+        self.workers = workers
+        self.state_path = os.path.join(state_dir, STATE_FILE)
+        producer = {}
+        for s in stages:
+            for out in s.outputs:
+                if out in producer:
+                    raise ValueError(f"{out} is written by both {producer[out]} and {s.name}")
+                producer[out] = s.name
+        self.upstream = {s.name: sorted({producer[p] for p in s.inputs if p in producer}) for s in stages}
+        self.order = list(TopologicalSorter(self.upstream).static_order())  # raises CycleError
+
+        self.state = {"stages": {}, "hashes": {}}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, encoding="utf-8") as f:
+                self.state = json.load(f)
+        self._state_lock = threading.Lock()
+        self.hashes = FileHashes(self.state.setdefault("hashes", {}), self._state_lock)
+
+    def select(self, until=None) -> list:
+        # Names of the `until` stages and everything upstream of them (default: all stages)
+        if not until:
+            return list(self.order)
+        wanted = set()
+        todo = [n for n in self.stages if any(self.stages[n].matches(p) for p in until)]
+        if not todo:
+            raise ValueError(f"No stage matches {until}; stages: {', '.join(self.order)}")
+        while todo:
+            name = todo.pop()
+            if name not in wanted:
+                wanted.add(name)
+                todo.extend(self.upstream[name])
+        return [n for n in self.order if n in wanted]
+
+    def fingerprint(self, stage: Stage) -> dict:
+        missing = [p for p in stage.inputs if self.hashes.path(p) is None]
+        if missing:
+            raise FileNotFoundError(f"{stage.name}: missing input(s) {', '.join(missing)}")
+        code = {}
+        if stage.track_code:
+            code = {p: self.hashes.path(p) for p in stage.code}
+            code["func"] = hashlib.sha256(inspect.getsource(stage.func).encode()).hexdigest()
+        parts = {
+            "params": json.loads(json.dumps(stage.params, default=str)),
+            "inputs": {p: self.hashes.path(p) for p in stage.inputs},
+            "code": code,
+        }
+        parts["fingerprint"] = hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+        return parts
+
+    def why_stale(self, stage: Stage, current: dict) -> str | None:
+        # None if a saved run with this fingerprint still has its outputs, else the reason to rerun.
+        # Earlier runs count too: going back to EPS=0.05 reuses its files if nothing overwrote them
+        runs = self.state["stages"].get(stage.name, [])
+        if not runs:
+            return "never run"
+        saved = next((r for r in reversed(runs) if r["fingerprint"] == current["fingerprint"]), None)
+        if saved is None:
+            last = runs[-1]
+            changed = [f"param {k}" for k in sorted(set(last["params"]) | set(current["params"]))
+                       if last["params"].get(k) != current["params"].get(k)]
+            changed += [f"input {os.path.basename(p)}" for p in current["inputs"] if last["inputs"].get(p) != current["inputs"][p]]
+            changed += ["code"] * (last["code"] != current["code"])
+            return "changed: " + ", ".join(changed or ["inputs"])
+        for out in stage.outputs:
+            if self.hashes.path(out) != saved["outputs"].get(out):
+                return f"output {os.path.basename(out)} missing or modified"
+        return None
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        _write_json_atomic(self.state_path, self.state)
+
+    def _run_stage(self, stage: Stage, forced: bool) -> dict:
+        start = time.perf_counter()
+        try:
+            current = self.fingerprint(stage)
+            reason = "forced" if forced else self.why_stale(stage, current)
+            if reason is None:
+                print(f"[INFO] {stage.name}: up to date, skipped")
+                return {"status": "skipped"}
+            print(f"[INFO] {stage.name}: running ({reason})")
+            for out in stage.outputs:
+                os.makedirs(os.path.dirname(out), exist_ok=True)
+            stage.func(**stage.params, **stage.options)
+            outputs = {out: self.hashes.path(out) for out in stage.outputs}
+            missing = [out for out, h in outputs.items() if h is None]
+            if missing:
+                raise RuntimeError(f"stage did not write {', '.join(missing)}")
+        except Exception as e:
+            print(f"[WARN] {stage.name} failed: {e!r}")
+            return {"status": "failed", "error": repr(e)}
+        seconds = round(time.perf_counter() - start, 2)
+        with self._state_lock:
+            runs = [r for r in self.state["stages"].get(stage.name, []) if r["fingerprint"] != current["fingerprint"]]
+            runs.append({**current, "outputs": outputs, "seconds": seconds, "finishedAt": time.strftime("%Y-%m-%dT%H:%M:%S")})
+            self.state["stages"][stage.name] = runs[-RUNS_KEPT:]
+            self._save_state()
+        print(f"[INFO] {stage.name}: done in {seconds:.1f} s")
+        return {"status": "done", "seconds": seconds}
+
+    def run(self, until=None, force=()) -> dict:
+        # Run the selected stages in dependency order, independent ones in parallel.
+        # force: stage names (or prefixes like "scrape") to rerun even if up to date
+        names = set(self.select(until))
+        graph = TopologicalSorter({n: [u for u in self.upstream[n] if u in names] for n in names})
+        graph.prepare()
+        results, running = {}, {}
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            while graph.is_active():
+                for name in graph.get_ready():
+                    failed = [u for u in self.upstream[name] if results.get(u, {}).get("status") in ("failed", "blocked")]
+                    if failed:
+                        print(f"[WARN] {name}: not run, upstream {', '.join(failed)} did not finish")
+                        results[name] = {"status": "blocked"}
+                        graph.done(name)
+                        continue
+                    forced = any(self.stages[name].matches(p) for p in force)
+                    running[pool.submit(self._run_stage, self.stages[name], forced)] = name
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    results[name] = future.result()
+                    graph.done(name)
+        with self._state_lock:
+            self._save_state()  # keeps the hash cache of skipped stages too
+        return {n: results[n] for n in self.order if n in results}
+
+    def plan(self, until=None, force=()) -> dict:
+        # What run() would do, without running anything
+        plan = {}
+        for name in self.select(until):
+            stage = self.stages[name]
+            stale_upstream = [u for u in self.upstream[name] if plan.get(u, "").startswith(("run", "blocked"))]
+            if any(stage.matches(p) for p in force):
+                plan[name] = "run (forced)"
+            elif stale_upstream:
+                plan[name] = f"run if {', '.join(stale_upstream)} output changes"
+            else:
+                try:
+                    reason = self.why_stale(stage, self.fingerprint(stage))
+                except FileNotFoundError as e:
+                    reason = str(e)
+                plan[name] = "up to date" if reason is None else f"run ({reason})"
+        return plan
+
+
+# ---- stages ----
+def _module(name: str):
+    return importlib.import_module(name)
+
+
+_scraper_lock = threading.Lock()
+
+
+def scrape_docket(
+    docket_id: str, output_dir: str, page_size: int, priority: int = 1, max_workers: int = FETCH_WORKERS,
+    pdf_workers: int = PDF_WORKERS, cache_dir: str | None = None,
+):
+    # Full crawl on the first run, delta sync by lastModifiedDate afterwards (01's sync_docket), set up
+    # as crawl_dockets sets up each docket: content cache, request priority, PDF quarantine
+    scraper = _module("01_scrape_docket_metadata_and_pdfs")
+    with _scraper_lock:  # docket stages run on several threads, the cache is shared
+        if API_KEY:
+            scraper.API_KEY = API_KEY
+        if cache_dir and scraper.CACHE is None:
+            scraper.configure_cache(cache_dir, max_bytes=scraper.CACHE_MAX_BYTES)
+    quarantine_dir = scraper.PDF_QUARANTINE_DIR or os.path.join(output_dir, "pdf_quarantine")
+    pdf_pool = scraper.PdfExtractionPool(workers=pdf_workers, quarantine_dir=quarantine_dir) if pdf_workers > 0 else None
+    scraper._set_request_priority(priority)
+    try:
+        state = scraper.sync_docket(
+            docket_id, output_dir, page_size=page_size, max_workers=max_workers, pdf_workers=pdf_workers, pdf_pool=pdf_pool,
+        )
+    finally:
+        scraper._set_request_priority(0)  # pipeline threads go on to run other stages
+        if pdf_pool is not None:
+            pdf_pool.shutdown()
+            if pdf_pool.quarantine:
+                print(f"[WARN] {docket_id}: {len(pdf_pool.quarantine)} PDFs quarantined, see {quarantine_dir}/quarantine.jsonl")
+    if not state.get("done"):
+        raise RuntimeError(f"crawl of {docket_id} stopped before the end (quota?), rerun to resume")
+
+
+def combine_clean(csv_files: list, root_dir: str, section_codes: list, output_formats: list = COMBINE_FORMATS, clean_workers: int = CLEAN_WORKERS):
+    # 02's streaming combine with this pipeline's files and settings
+    combine = _module("02_combine_clean_ira_comments")
+    combine.ROOT_DIR = Path(root_dir)
+    combine.CSV_FILES = list(csv_files)
+    combine.SECTION_CODES = list(section_codes)
+    combine.OUTPUT_FORMATS = list(output_formats)
+    combine.CLEAN_WORKERS = clean_workers
+    combine.main_streaming()
+
+
+def search_index(csv_path: str, index_path: str, section_codes: list):
+    # Upsert the clean comments into the full-text index; only new / changed comments are written
+    from comments_fts_index import CommentIndex
+
+    try:
+        index = CommentIndex(index_path, section_codes=section_codes)
+    except ValueError as e:
+        # Built with other SECTION_CODES: rebuild from scratch
+        print(f"[WARN] {e}")
+        os.remove(index_path)
+        index = CommentIndex(index_path, section_codes=section_codes)
+    try:
+        index.add_csv(csv_path, force=True)
+        index.optimize()
+    finally:
+        index.close()
+
+
+def embed(
+    csv_path: str,
+    store_dir: str,
+    index_path: str,
+    sent_cache_path: str,
+    model_name: str,
+    max_seq_length: int,
+    min_sent_len: int,
+    near_dup_threshold: float | None,
+    dtype: str,
+    batch_size: int = EMBED_BATCH_SIZE,
+):
+    # Notebook section 3: embed one comment per (near-)duplicate group into the embedding store,
+    # save the commentId -> store row index
+    import numpy as np
+    import pandas as pd
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    from embedding_store import EmbeddingStore
+    from near_duplicate_prefilter import find_near_duplicate_groups, representatives
+    from sentence_encoder import encode_documents_sentence_level
+    from sentence_segmentation import SentenceSegmentCache
+
+    df = pd.read_csv(csv_path, usecols=["commentId", "text_clean"], dtype={"commentId": str})
+    comment_ids = df["commentId"].tolist()
+    texts = df["text_clean"].fillna("").astype(str).tolist()
+
+    group_rep = find_near_duplicate_groups(texts, threshold=near_dup_threshold)
+    rep_rows, members = representatives(group_rep)
+    rep_texts = [texts[i] for i in rep_rows]
+    print(f"[INFO] {len(texts):,} comments -> {len(rep_rows):,} (near-)duplicate groups")
+
+    model = SentenceTransformer(model_name, device="cuda" if torch.cuda.is_available() else "cpu")
+    model.max_seq_length = max_seq_length
+    store = EmbeddingStore(store_dir, model_name, dim=model.get_sentence_embedding_dimension(), dtype=dtype)
+    segments = SentenceSegmentCache(sent_cache_path)
+    not_stored = store.lookup(store.keys_for(rep_texts)) < 0
+    segments.segment([t for t, todo in zip(rep_texts, not_stored) if todo])
+
+    rep_store_rows = store.embed_missing(
+        rep_texts,
+        lambda batch: encode_documents_sentence_level(model, batch, min_sent_len=min_sent_len, sent_tokenize=segments.sent_tokenize),
+        batch_size=batch_size,
+    )
+    embed_df = pd.DataFrame({
+        "commentId": comment_ids,
+        "dupGroupId": [comment_ids[i] for i in group_rep],
+        "embedRow": np.asarray(rep_store_rows)[members],
+    })
+    tmp_path = index_path + ".tmp"
+    embed_df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, index_path)
+    print(f"[INFO] Saved embedding index to {index_path} ({len(store):,} texts in the store)")
+
+
+def cluster(
+    csv_path: str,
+    store_dir: str,
+    index_path: str,
+    model_dir: str,
+    dbscan_csv_path: str,
+    dbscan_full_csv_path: str,
+    eps: float,
+    min_samples: int,
+    method: str,
+):
+    # Notebook section 4: DBSCAN on one point per duplicate group weighted by the group size,
+    # labels fanned out to every comment and merged onto the cleaned CSV
+    import numpy as np
+    import pandas as pd
+
+    from cosine_dbscan import cosine_dbscan
+    from embedding_store import EmbeddingStore
+    from incremental_clusters import IncrementalDBSCAN
+
+    store = EmbeddingStore(store_dir)
+    df_embed = pd.read_csv(index_path, dtype={"commentId": str, "dupGroupId": str})
+    group_codes, _ = pd.factorize(df_embed["dupGroupId"])
+    group_first_row = np.unique(group_codes, return_index=True)[1]
+    group_size = np.bincount(group_codes)
+    rows = df_embed["embedRow"].to_numpy()[group_first_row]
+    X = np.asarray(store.vectors[rows], dtype=np.float32)
+
+    print(f"[INFO] DBSCAN ({method}) on {X.shape[0]:,} groups of {len(df_embed):,} comments")
+    if method == "exact":
+        shutil.rmtree(model_dir, ignore_errors=True)
+        group_labels = IncrementalDBSCAN.fit(model_dir, X, rows=rows, eps=eps, min_samples=min_samples, sample_weight=group_size).labels
+    else:
+        group_labels = cosine_dbscan(X, eps=eps, min_samples=min_samples, sample_weight=group_size, method=method)
+    df_embed["dbscan_cluster"] = group_labels[group_codes]
+
+    df_dbscan = df_embed[["commentId", "dbscan_cluster"]]
+    df_full = pd.read_csv(csv_path, dtype={"commentId": str})
+    df_dbscan.to_csv(dbscan_csv_path, index=False)
+    df_full.merge(df_dbscan, on="commentId", how="left").to_csv(dbscan_full_csv_path, index=False)
+    print(f"[INFO] Saved {dbscan_csv_path} and {dbscan_full_csv_path}")
+
+
+def postprocess(dbscan_full_csv_path: str, out_prefix: str, partition_dir: str | None):
+    # Notebook section 5: noise, cluster representatives, clusters > 5, noise + representatives,
+    # and the partitions incremental updates rewrite (exact method only)
+    import pandas as pd
+
+    from incremental_clusters import pick_representatives, write_partitions
+
+    df_full_out = pd.read_csv(dbscan_full_csv_path, dtype={"commentId": str})
+    is_noise = df_full_out["dbscan_cluster"] == -1
+    df_noise, df_nonnoise = df_full_out[is_noise], df_full_out[~is_noise]
+    df_reps = pick_representatives(df_nonnoise)
+    cluster_counts = df_nonnoise["dbscan_cluster"].value_counts()
+    df_big = df_nonnoise[df_nonnoise["dbscan_cluster"].isin(cluster_counts[cluster_counts > 5].index)]
+
+    df_noise.to_csv(f"{out_prefix}_noise_only.csv", index=False)
+    df_reps.to_csv(f"{out_prefix}_cluster_representatives.csv", index=False)
+    df_big.to_csv(f"{out_prefix}_clusters_gt5_full.csv", index=False)
+    pd.concat([df_noise, df_reps], ignore_index=True).to_csv(f"{out_prefix}_noise_plus_reps.csv", index=False)
+    print(f"[INFO] {len(df_noise):,} noise rows, {len(df_reps):,} clusters, {len(df_big):,} rows in clusters > 5")
+
+    if partition_dir:
+        shutil.rmtree(partition_dir, ignore_errors=True)
+        write_partitions(df_full_out.assign(noiseBatch=0), partition_dir)
+
+
+def build_stages(data_dir: str = DATA_DIR) -> list:
+    # The pipeline with the settings above; file names follow the notebook
+    data_dir = os.path.abspath(data_dir)
+    scrape_dir = os.path.join(data_dir, "scrape")
+    embedding_dir = SCRIPTS_DIR / "embedding_dbscan"
+    path = lambda name: os.path.join(data_dir, f"{PREFIX}_{name}")  # noqa: E731
+
+    stages, scraped = [], []
+    for docket_id, priority in DOCKETS:
+        scraped.append(os.path.join(scrape_dir, f"{docket_id}_comments_text_pdf_all.csv"))
+        stages.append(Stage(
+            f"scrape:{docket_id}", scrape_docket,
+            outputs=[scraped[-1]],
+            params={"docket_id": docket_id, "output_dir": scrape_dir, "page_size": PAGE_SIZE},
+            options={
+                "priority": priority, "max_workers": FETCH_WORKERS, "pdf_workers": max(1, PDF_WORKERS // len(DOCKETS)),
+                "cache_dir": os.path.join(scrape_dir, "http_cache") if HTTP_CACHE else None,
+            },
+            track_code=False,  # rerun with --force scrape
+        ))
+
+    clean_csv = os.path.join(data_dir, "tot_comments_all_clean_irs_multi.csv")
+    stages.append(Stage(
+        "combine", combine_clean,
+        inputs=scraped,
+        outputs=[os.path.join(data_dir, "comments_all_raw_irs_multi.csv"), clean_csv],
+        params={"csv_files": scraped, "root_dir": data_dir, "section_codes": SECTION_CODES},
+        options={"output_formats": COMBINE_FORMATS, "clean_workers": CLEAN_WORKERS},
+        code=[SCRIPTS_DIR / "scraping_clean_combine" / "02_combine_clean_ira_comments.py"],
+    ))
+
+    if FTS_INDEX:
+        stages.append(Stage(
+            "search_index", search_index,
+            inputs=[clean_csv],
+            outputs=[os.path.join(data_dir, "comments_fts.sqlite")],
+            params={"csv_path": clean_csv, "index_path": os.path.join(data_dir, "comments_fts.sqlite"), "section_codes": SECTION_CODES},
+            code=[SCRIPTS_DIR / "scraping_clean_combine" / "comments_fts_index.py"],
+        ))
+
+    store_dir, index_path = path("embeddings_allmpnet_SL"), path("comments_all_clean_irs_multi_embeddings_allmpnet_SL_index.csv")
+    stages.append(Stage(
+        "embed", embed,
+        inputs=[clean_csv],
+        outputs=[store_dir, index_path],
+        params={
+            "csv_path": clean_csv, "store_dir": store_dir, "index_path": index_path,
+            "sent_cache_path": path("comments_sentence_spans.npz"), "model_name": MODEL_NAME,
+            "max_seq_length": MAX_SEQ_LENGTH, "min_sent_len": MIN_SENT_LEN,
+            "near_dup_threshold": NEAR_DUP_THRESHOLD, "dtype": EMBED_DTYPE,
+        },
+        options={"batch_size": EMBED_BATCH_SIZE},
+        code=[embedding_dir / f for f in ("embedding_store.py", "near_duplicate_prefilter.py", "sentence_encoder.py", "sentence_segmentation.py")],
+    ))
+
+    tag = f"eps{EPS:g}_min{MIN_SAMPLES}"
+    model_dir = path(f"dbscan_{tag}_model")
+    dbscan_csv, dbscan_full_csv = path(f"comments_all_clean_irs_multi_dbscan_{tag}.csv"), path(f"comments_all_clean_irs_multi_dbscan_{tag}_full.csv")
+    stages.append(Stage(
+        "cluster", cluster,
+        inputs=[clean_csv, store_dir, index_path],
+        outputs=[dbscan_csv, dbscan_full_csv] + ([model_dir] if DBSCAN_METHOD == "exact" else []),
+        params={
+            "csv_path": clean_csv, "store_dir": store_dir, "index_path": index_path, "model_dir": model_dir,
+            "dbscan_csv_path": dbscan_csv, "dbscan_full_csv_path": dbscan_full_csv,
+            "eps": EPS, "min_samples": MIN_SAMPLES, "method": DBSCAN_METHOD,
+        },
+        code=[embedding_dir / "cosine_dbscan.py", embedding_dir / "incremental_clusters.py"],
+    ))
+
+    out_prefix = path(f"dbscan_{tag}")
+    partition_dir = path(f"dbscan_{tag}_partitions") if DBSCAN_METHOD == "exact" else None
+    stages.append(Stage(
+        "postprocess", postprocess,
+        inputs=[dbscan_full_csv],
+        outputs=[f"{out_prefix}_{name}.csv" for name in ("noise_only", "cluster_representatives", "clusters_gt5_full", "noise_plus_reps")]
+        + ([partition_dir] if partition_dir else []),
+        params={"dbscan_full_csv_path": dbscan_full_csv, "out_prefix": out_prefix, "partition_dir": partition_dir},
+        code=[embedding_dir / "incremental_clusters.py"],
+    ))
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=None, help=f"default: DATA_DIR ({DATA_DIR})")
+    parser.add_argument("--set", nargs="+", default=[], metavar="NAME=VALUE", help="override a setting above, e.g. EPS=0.07 (JSON values)")
+    parser.add_argument("--until", nargs="+", help="run only these stages and what they depend on")
+    parser.add_argument("--force", nargs="+", default=[], help='rerun these stages even if up to date, e.g. "scrape"')
+    parser.add_argument("--workers", type=int, default=None, help=f"stages at the same time (default {PIPELINE_WORKERS})")
+    parser.add_argument("--dry-run", action="store_true", help="print what would run and why")
+    args = parser.parse_args()
+
+    settings = globals()
+    for item in args.set:
+        name, _, value = item.partition("=")
+        if not name.isupper() or name not in settings:
+            parser.error(f"unknown setting {name}")
+        try:
+            settings[name] = json.loads(value)
+        except ValueError:
+            settings[name] = value  # plain string
+
+    data_dir = args.data_dir or DATA_DIR
+    pipeline = Pipeline(build_stages(data_dir), data_dir, workers=args.workers or PIPELINE_WORKERS)
+    if args.dry_run:
+        for name, what in pipeline.plan(args.until, args.force).items():
+            print(f"  {name:<28} {what}")
+        return
+
+    results = pipeline.run(args.until, args.force)
+    print("==== Pipeline ====")
+    for name, result in results.items():
+        print(f"  [{result['status']:>7}] {name}" + (f" ({result['seconds']} s)" if "seconds" in result else ""))
+    if any(r["status"] in ("failed", "blocked") for r in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
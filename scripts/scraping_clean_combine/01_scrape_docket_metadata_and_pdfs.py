@@ -1,16 +1,40 @@
 import json
 import csv
+import gzip
+import cProfile
+import hashlib
+import heapq
+import http.client
+import multiprocessing
+import pickle
+import queue
 import urllib.parse
-import urllib.request
 import re
 import html
 import os
+import shutil
+import sqlite3
+import tempfile
 import time
+import threading
+import itertools
+import sys
+import traceback
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from urllib.error import HTTPError, URLError
 from io import BytesIO
 from PyPDF2.errors import DependencyError
 from PyPDF2 import PdfReader
 
+try:
+    import resource
+except ImportError:  # Windows: no memory limit for the parser processes
+    resource = None
+
 # python -m pip install PyPDF2
 # python -m pip install pycryptodome
 # python -m pip install pandas
@@ -20,24 +44,515 @@ from PyPDF2 import PdfReader
     # OUTPUT_DIR = ""
     # docket_id = ""
 # ---- Adjustable parameters -----
-# ! API limit: 900/hr
+# ! API limit: 900/hr (REQUESTS_PER_HOUR, shared by all fetch threads)
 # Adjust based on the docket comment count
     # page_size = 
-    # CHUNK_START_PAGE = 
-    # CHUNK_END_PAGE   = 
+    # max_workers = 
+# Large dockets are split into date-window queries automatically (no page ranges to pick);
+# interrupted runs resume from {docket_id}_checkpoint.json, just rerun the script
 # Pre-processing function, adjust per your needs
     # clean_comment_html
 # ==============================================
 
-# Output: JSON + CSV with comment text (HTML cleaned) + PDF extracted text
+# Output: JSONL + CSV (written row by row) + JSON with comment text (HTML cleaned) + PDF extracted text
 
 # -------------------- Configurations -------------------- #
 API_KEY = ""  # !!! <<< API key
 BASE_URL = "https://api.regulations.gov/v4"
 
+# Request budget of the API key, every get_json/get_binary_to_file call takes one token
+REQUESTS_PER_HOUR = 900
+# Number of requests allowed to go out back to back before throttling kicks in
+RATE_LIMIT_BURST = 10
+# Keep-alive connections per host (api.regulations.gov / downloads.regulations.gov)
+HTTP_POOL_SIZE = 8
+# Local cache of detail JSON + PDFs, least recently used entries go first past the size cap
+CACHE_MAX_BYTES = 5 * 1024 ** 3
+# Processes parsing PDFs (CPU bound), separate from the fetch threads; 0 parses inline
+PDF_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# Downloaded PDFs waiting for a parser, downloads block once this many are queued
+PDF_QUEUE_SIZE = 16
+# Parser process sandbox: a PDF taking longer than PDF_PARSE_TIMEOUT seconds kills its worker,
+# each worker's address space is capped at PDF_WORKER_MAX_MEMORY bytes (None = no cap) and
+# workers are replaced after PDF_WORKER_MAX_TASKS documents
+PDF_PARSE_TIMEOUT = 120
+PDF_WORKER_MAX_MEMORY = 2 * 1024 ** 3
+PDF_WORKER_MAX_TASKS = 200
+# PDFs that time out / hit the memory cap / crash a worker are copied here for a retry
+# (crawl_dockets defaults to {output_dir}/pdf_quarantine)
+PDF_QUARANTINE_DIR = None
+# Attachments bigger than this are skipped (checked on Content-Length, then while streaming)
+PDF_MAX_BYTES = 50 * 1024 ** 2
+# Downloads are streamed to temp files here (None = system temp dir) and removed once parsed
+PDF_SPOOL_DIR = None
+DOWNLOAD_CHUNK_SIZE = 1024 ** 2
+# regulations.gov serves at most 20 pages per query (20 x 250 = 5000 comments)
+MAX_PAGES_PER_QUERY = 20
+# Date-window sub-queries listed ahead of the one being fetched
+LIST_WORKERS = 2
+# Upper bounds (seconds) of the per-stage latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+# -------------------- Metrics -------------------- #
+class Metrics:
+    """Thread-safe counters + latency histograms, dumped as JSON and Prometheus text format.
+
+    Series are keyed by name + labels, e.g. inc("http_retries_total", reason="429") or
+    observe("stage_seconds", 0.3, stage="detail").
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS, prefix: str = "regscraper"):
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> {"counts": per bucket + inf, "sum", "count", "max"}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        i = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0, "max": 0.0}
+            hist["counts"][i] += 1
+            hist["sum"] += seconds
+            hist["count"] += 1
+            hist["max"] = max(hist["max"], seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: dict(hist, counts=list(hist["counts"])) for key, hist in self.histograms.items()}
+        return {
+            "startedAt": datetime.fromtimestamp(self.started, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "uptimeSeconds": round(time.time() - self.started, 3),
+            "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(counters.items())],
+            "histograms": [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": hist["count"],
+                    "sum": hist["sum"],
+                    "mean": hist["sum"] / hist["count"],
+                    "max": hist["max"],
+                    "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], hist["counts"])),
+                }
+                for (name, labels), hist in sorted(histograms.items())
+            ],
+        }
+
+    def to_prometheus(self) -> str:
+        def series(name, labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return f"{self.prefix}_{name}"
+            escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs]
+            body = ",".join(f'{k}="{v}"' for k, v in escaped)
+            return f"{self.prefix}_{name}{{{body}}}"
+
+        snap = self.snapshot()
+        lines = []
+        declared = set()
+        for c in snap["counters"]:
+            if c["name"] not in declared:
+                declared.add(c["name"])
+                lines.append(f"# TYPE {self.prefix}_{c['name']} counter")
+            lines.append(f"{series(c['name'], c['labels'].items())} {c['value']}")
+        for h in snap["histograms"]:
+            if h["name"] not in declared:
+                declared.add(h["name"])
+                lines.append(f"# TYPE {self.prefix}_{h['name']} histogram")
+            cumulative = 0
+            for le, n in h["buckets"].items():
+                cumulative += n
+                lines.append(f"{series(h['name'] + '_bucket', h['labels'].items(), [('le', le)])} {cumulative}")
+            lines.append(f"{series(h['name'] + '_sum', h['labels'].items())} {h['sum']}")
+            lines.append(f"{series(h['name'] + '_count', h['labels'].items())} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, output_dir: str, name: str = "crawl_metrics"):
+        # {name}.json + {name}.prom (node_exporter textfile collector format), replaced atomically
+        base = os.path.join(output_dir, name)
+        _write_json_atomic(base + ".json", self.snapshot())
+        with open(base + ".prom.tmp", "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(base + ".prom.tmp", base + ".prom")
+
+
+METRICS = Metrics()
+
+
+class StackSampler:
+    """Opt-in sampling profiler: counts the Python stacks of all threads every interval seconds.
+
+    Covers the fetch threads too (cProfile only sees the thread it runs in). dump() writes collapsed
+    stacks ("outer;inner count" per line), the input format of flamegraph.pl / speedscope.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = ";".join(f"{fs.name} ({os.path.basename(fs.filename)}:{fs.lineno})" for fs in traceback.extract_stack(frame))
+                self.stacks[stack] += 1
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def dump(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+
+
+# -------------------- Rate limiter -------------------- #
+# Priority of the docket a thread works for (set by crawl_dockets), higher goes first at RATE_LIMITER
+_REQUEST_PRIORITY = threading.local()
+
+
+def _set_request_priority(priority: int):
+    _REQUEST_PRIORITY.value = priority
+
+
+def _request_priority() -> int:
+    return getattr(_REQUEST_PRIORITY, "value", 0)
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every request sent to regulations.gov.
+
+    Waiting threads are served by request priority (then arrival), so when several dockets share
+    the budget the higher priority one gets the tokens first.
+    """
+
+    def __init__(self, requests_per_hour: float, burst: int = 1):
+        self.rate = requests_per_hour / 3600.0
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.cond = threading.Condition()
+        self.waiting = []  # heap of (-priority, arrival)
+        self.arrivals = itertools.count()
+
+    def acquire(self):
+        # Block until this thread is first in line and a token is available (or a 429 pause is over)
+        ticket = (-_request_priority(), next(self.arrivals))
+        start = time.perf_counter()
+        with self.cond:
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if now < self.paused_until:
+                        wait = self.paused_until - now
+                    elif self.waiting[0] != ticket:
+                        wait = None  # woken up when the head of the line leaves
+                    else:
+                        elapsed = now - self.updated
+                        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+                        self.updated = now
+                        if self.tokens >= 1:
+                            self.tokens -= 1
+                            METRICS.inc("rate_limit_wait_seconds_total", time.perf_counter() - start)
+                            return
+                        wait = (1 - self.tokens) / self.rate
+                    self.cond.wait(wait)
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.cond.notify_all()
+
+    def pause(self, seconds: float):
+        # Retry-After applies to the key, so hold back every thread and drop the burst
+        with self.cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.updated = self.paused_until
+
+
+RATE_LIMITER = TokenBucket(REQUESTS_PER_HOUR, burst=RATE_LIMIT_BURST)
+
+
+# -------------------- Keep-alive connection pool -------------------- #
+class ConnectionPool:
+    """Reusable HTTP(S) connections, one bounded pool per (scheme, host, port)."""
+
+    REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, max_redirects: int = 5):
+        self.pool_size = max(1, int(pool_size))
+        self.max_redirects = max_redirects
+        self.lock = threading.Lock()
+        self.idle = {}   # host key -> idle connections
+        self.slots = {}  # host key -> semaphore capping open connections
+
+    def _host_slots(self, key):
+        with self.lock:
+            if key not in self.slots:
+                self.slots[key] = threading.BoundedSemaphore(self.pool_size)
+                self.idle[key] = []
+            return self.slots[key]
+
+    def _checkout(self, key, timeout):
+        with self.lock:
+            conn = self.idle[key].pop() if self.idle[key] else None
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        scheme, host, port = key
+        conn_cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return conn_cls(host, port, timeout=timeout), False
+
+    def _checkin(self, key, conn, resp):
+        # Only a fully read, keep-alive response leaves the connection reusable
+        if resp.isclosed() and not resp.will_close:
+            with self.lock:
+                self.idle[key].append(conn)
+        else:
+            conn.close()
+
+    def _send(self, key, path, headers, timeout):
+        conn, reused = self._checkout(key, timeout)
+        try:
+            conn.request("GET", path, headers=headers)
+            return conn, conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+        # The server dropped an idle keep-alive connection, retry once on a fresh one
+        scheme, host, port = key
+        conn_cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        conn = conn_cls(host, port, timeout=timeout)
+        try:
+            conn.request("GET", path, headers=headers)
+            return conn, conn.getresponse()
+        except BaseException:
+            conn.close()
+            raise
+
+    @contextmanager
+    def urlopen(self, url: str, headers: dict, timeout: float):
+        # Same contract as urllib.request.urlopen: HTTPError for >= 400, URLError for network issues
+        for _ in range(self.max_redirects + 1):
+            parts = urllib.parse.urlsplit(url)
+            key = (parts.scheme, parts.hostname, parts.port)
+            path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+
+            slots = self._host_slots(key)
+            slots.acquire()
+            try:
+                try:
+                    conn, resp = self._send(key, path, headers, timeout)
+                except (OSError, http.client.HTTPException) as e:
+                    raise URLError(e) from e
+
+                location = resp.getheader("Location")
+                if resp.status in self.REDIRECT_CODES and location:
+                    resp.read()
+                    self._checkin(key, conn, resp)
+                    url = urllib.parse.urljoin(url, location)
+                    continue
+
+                if resp.status >= 400:
+                    body = resp.read()
+                    self._checkin(key, conn, resp)
+                    raise HTTPError(url, resp.status, resp.reason, resp.headers, BytesIO(body))
+
+                try:
+                    yield resp
+                except (OSError, http.client.HTTPException) as e:
+                    conn.close()
+                    raise URLError(e) from e
+                except BaseException:
+                    conn.close()
+                    raise
+                self._checkin(key, conn, resp)
+                return
+            finally:
+                slots.release()
+        raise URLError(f"too many redirects: {url}")
+
+
+HTTP_POOL = ConnectionPool(HTTP_POOL_SIZE)
+
+
+# -------------------- On-disk response cache -------------------- #
+class ContentCache:
+    """Content-addressed blob store (sha256) with a key index and size-bounded LRU eviction."""
+
+    def __init__(self, cache_dir: str, max_bytes: int = CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.max_bytes = max_bytes
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, digest TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self.db.commit()
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def get(self, key: str) -> bytes | None:
+        with self.lock:
+            hit = self.db.execute("SELECT digest FROM entries WHERE key = ?", (key,)).fetchone()
+            if hit is None:
+                return None
+            try:
+                with open(self._object_path(hit[0]), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.db.commit()
+                return None
+            self.db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+            return data
+
+    def get_file(self, key: str, dest_path: str) -> bool:
+        # Copy a cached blob to dest_path without loading it, False on a miss
+        with self.lock:
+            hit = self.db.execute("SELECT digest FROM entries WHERE key = ?", (key,)).fetchone()
+            if hit is None:
+                return False
+            try:
+                shutil.copyfile(self._object_path(hit[0]), dest_path)
+            except FileNotFoundError:
+                self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.db.commit()
+                return False
+            self.db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+            return True
+
+    def put(self, key: str, data: bytes):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        with self.lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            self._index(key, digest, len(data))
+
+    def put_file(self, key: str, src_path: str):
+        # Same as put() for a blob on disk, hashed and copied in chunks
+        sha = hashlib.sha256()
+        with open(src_path, "rb") as f:
+            while chunk := f.read(DOWNLOAD_CHUNK_SIZE):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        path = self._object_path(digest)
+        with self.lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                shutil.copyfile(src_path, tmp_path)
+                os.replace(tmp_path, path)
+            self._index(key, digest, os.path.getsize(path))
+
+    def _index(self, key: str, digest: str, size: int):
+        self.db.execute(
+            "INSERT OR REPLACE INTO entries (key, digest, size, last_access) VALUES (?, ?, ?, ?)",
+            (key, digest, size, time.time()),
+        )
+        self._evict()
+        self.db.commit()
+
+    def _evict(self):
+        # Identical blobs are stored once, so count each digest once
+        total = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM entries)"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, digest, size in self.db.execute(
+            "SELECT key, digest, size FROM entries ORDER BY last_access"
+        ).fetchall():
+            self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            still_used = self.db.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone()
+            if still_used is None:
+                try:
+                    os.remove(self._object_path(digest))
+                except FileNotFoundError:
+                    pass
+                total -= size
+            if total <= self.max_bytes:
+                break
+
+
+# Set with configure_cache(), None means every call goes to the API
+CACHE = None
+
+
+def configure_cache(cache_dir: str | None, max_bytes: int = CACHE_MAX_BYTES):
+    global CACHE
+    CACHE = ContentCache(cache_dir, max_bytes) if cache_dir else None
+    return CACHE
+
 
 # -------------------- Base http tool -------------------- #
-def get_json(url, params=None, max_retries=5):
+def _retry_after_delay(e: HTTPError, attempt: int) -> int:
+    # Honor Retry-After from a 429, fall back to exponential backoff
+    retry_after = e.headers.get("Retry-After")
+    if retry_after:
+        try:
+            delay = int(retry_after)
+        except ValueError:
+            delay = 2 ** attempt
+    else:
+        delay = 2 ** attempt
+    return min(delay, 120)
+
+
+def get_json(url, params=None, max_retries=5, cache_key=None, use_cache=True):
+    # cache_key: keep the response in CACHE under this key; use_cache=False refetches and overwrites it
+    if cache_key and use_cache and CACHE is not None:
+        cached = CACHE.get(cache_key)
+        if cached is not None:
+            METRICS.inc("cache_hits_total", kind="json")
+            return json.loads(cached.decode("utf-8"))
+
     attempt = 0
     while True:
         if params:
@@ -46,37 +561,49 @@ def get_json(url, params=None, max_retries=5):
         else:
             full_url = url
 
-        req = urllib.request.Request(
-            full_url,
-            headers={
-                "User-Agent": "python-urllib/regulations-scraper",
-                "X-Api-Key": API_KEY,
-            },
-        )
+        headers = {
+            "User-Agent": "python-urllib/regulations-scraper",
+            "X-Api-Key": API_KEY,
+            "Accept-Encoding": "gzip",
+        }
 
+        RATE_LIMITER.acquire()
         try:
-            with urllib.request.urlopen(req, timeout=30) as resp:
-                data = resp.read().decode("utf-8")
-                return json.loads(data)
+            with HTTP_POOL.urlopen(full_url, headers=headers, timeout=30) as resp:
+                raw = resp.read()
+                if (resp.getheader("Content-Encoding") or "").lower() == "gzip":
+                    raw = gzip.decompress(raw)
+                data = json.loads(raw.decode("utf-8"))
+            METRICS.inc("http_requests_total", kind="json")
+            METRICS.inc("response_bytes_total", len(raw), kind="json")
+            if cache_key and CACHE is not None:
+                CACHE.put(cache_key, raw)
+            return data
 
         except HTTPError as e:
             if e.code == 429 and attempt < max_retries:
-                retry_after = e.headers.get("Retry-After")
-                if retry_after:
-                    try:
-                        delay = int(retry_after)
-                    except ValueError:
-                        delay = 2 ** attempt
-                else:
-                    delay = 2 ** attempt
-                delay = min(delay, 120)
+                delay = _retry_after_delay(e, attempt)
                 attempt += 1
                 print(f"[WARN] HTTP 429 Too Many Requests, wait {delay} seconds before retry ({attempt}/{max_retries})")
-                time.sleep(delay)
+                METRICS.inc("http_retries_total", kind="json", reason="429")
+                METRICS.inc("backoff_seconds_total", delay, kind="json")
+                RATE_LIMITER.pause(delay)
                 continue
+            METRICS.inc("http_errors_total", kind="json", status=str(e.code))
             raise
 
-def get_binary(url, max_retries=5):
+def get_binary_to_file(url, max_retries=5, use_cache=True, max_bytes=PDF_MAX_BYTES) -> str | None:
+    # Stream an attachment to a temp file in PDF_SPOOL_DIR and return its path (the caller removes it).
+    # None when the download failed or is over max_bytes. Cached by the attachment URL (without api_key).
+    cache_key = f"url:{url}"
+    if use_cache and CACHE is not None:
+        fd, path = tempfile.mkstemp(prefix="pdf-", suffix=".pdf", dir=PDF_SPOOL_DIR)
+        os.close(fd)
+        if CACHE.get_file(cache_key, path):
+            METRICS.inc("cache_hits_total", kind="pdf")
+            return path
+        os.remove(path)
+
     attempt = 0
     while True:
         # Add api_key to URL if missing for downloads.regulations.gov
@@ -85,72 +612,114 @@ def get_binary(url, max_retries=5):
             sep = "&" if "?" in url else "?"
             final_url = f"{url}{sep}api_key={API_KEY}"
 
-        req = urllib.request.Request(
-            final_url,
-            headers={
-                # Mimic real browser
-                "User-Agent": (
-                    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-                    "AppleWebKit/537.36 (KHTML, like Gecko) "
-                    "Chrome/120.0.0.0 Safari/537.36"
-                ),
-                # Add API key to avoid 403 (may fail to fatch pdf is not added, 1/3 times)
-                "X-Api-Key": API_KEY,
-                "Accept": "application/pdf,application/octet-stream,*/*;q=0.8",
-            },
-        )
+        headers = {
+            # Mimic real browser
+            "User-Agent": (
+                "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+                "AppleWebKit/537.36 (KHTML, like Gecko) "
+                "Chrome/120.0.0.0 Safari/537.36"
+            ),
+            # Add API key to avoid 403 (may fail to fatch pdf is not added, 1/3 times)
+            "X-Api-Key": API_KEY,
+            "Accept": "application/pdf,application/octet-stream,*/*;q=0.8",
+        }
 
+        RATE_LIMITER.acquire()
+        path = None
         try:
-            with urllib.request.urlopen(req, timeout=60) as resp:
-                return resp.read()
+            with HTTP_POOL.urlopen(final_url, headers=headers, timeout=60) as resp:
+                # Leaving the block with the body unread drops the connection instead of draining it
+                length = resp.getheader("Content-Length")
+                if length and length.isdigit() and int(length) > max_bytes:
+                    print(f"[WARN] PDF is {int(length) / 1024 ** 2:.0f} MB (limit {max_bytes / 1024 ** 2:.0f} MB), skipped, url={url}")
+                    METRICS.inc("pdf_skipped_total", reason="too_large")
+                    return None
+
+                fd, path = tempfile.mkstemp(prefix="pdf-", suffix=".pdf", dir=PDF_SPOOL_DIR)
+                size = 0
+                with os.fdopen(fd, "wb") as f:
+                    while chunk := resp.read(DOWNLOAD_CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > max_bytes:
+                            break
+                        f.write(chunk)
+
+            METRICS.inc("http_requests_total", kind="pdf")
+            METRICS.inc("response_bytes_total", size, kind="pdf")
+            if size > max_bytes:
+                print(f"[WARN] PDF over {max_bytes / 1024 ** 2:.0f} MB limit, skipped, url={url}")
+                METRICS.inc("pdf_skipped_total", reason="too_large")
+                return None
+            if size == 0:
+                return None
+            if CACHE is not None:
+                CACHE.put_file(cache_key, path)
+            done_path, path = path, None
+            return done_path
         except HTTPError as e:
             if e.code == 429 and attempt < max_retries:
-                retry_after = e.headers.get("Retry-After")
-                if retry_after:
-                    try:
-                        delay = int(retry_after)
-                    except ValueError:
-                        delay = 2 ** attempt
-                else:
-                    delay = 2 ** attempt
-                delay = min(delay, 120)
+                delay = _retry_after_delay(e, attempt)
                 attempt += 1
                 print(f"[WARN] 429 when downloading PDF, wait {delay} seconds and reattempt ({attempt}/{max_retries})")
-                time.sleep(delay)
+                METRICS.inc("http_retries_total", kind="pdf", reason="429")
+                METRICS.inc("backoff_seconds_total", delay, kind="pdf")
+                RATE_LIMITER.pause(delay)
                 continue
 
             print(f"[WARN] fail to download PDF, HTTP {e.code}, url={final_url}")
-            return b""
+            METRICS.inc("http_errors_total", kind="pdf", status=str(e.code))
+            return None
         except URLError as e:
             if attempt < max_retries:
                 delay = 2 ** attempt
                 attempt += 1
                 print(f"[WARN] Internet Error {e.reason}, wait {delay} seconds and reattempt ({attempt}/{max_retries})")
+                METRICS.inc("http_retries_total", kind="pdf", reason="network")
+                METRICS.inc("backoff_seconds_total", delay, kind="pdf")
                 time.sleep(delay)
                 continue
             print(f"[WARN] PDF download failure, url={final_url}")
-            return b""
+            METRICS.inc("http_errors_total", kind="pdf", status="network")
+            return None
+        finally:
+            # Partial, oversized or empty downloads don't leave temp files behind
+            if path is not None:
+                _remove_spooled(path)
 
 
 # -------------------- Pre-processing -------------------- #
 def clean_comment_html(raw: str) -> str:
     if not raw:
         return ""
-    text = re.sub(r"<[^>]+>", " ", raw)
-    text = html.unescape(text)
-    text = re.sub(r"\s+", " ", text).strip()
+    with METRICS.timer("stage_seconds", stage="clean"):
+        text = re.sub(r"<[^>]+>", " ", raw)
+        text = html.unescape(text)
+        text = re.sub(r"\s+", " ", text).strip()
     return text
 
 def extract_text_from_pdf_bytes(pdf_bytes: bytes, max_pages: int = 20) -> str:
+    if not pdf_bytes:
+        return ""
+    return _extract_pdf_text(BytesIO(pdf_bytes), max_pages)
 
-    if not PdfReader:
+def extract_text_from_pdf_file(path: str, max_pages: int = 20) -> str:
+    # Hand PdfReader an open file, given a path it reads the whole file into memory first
+    try:
+        with open(path, "rb") as f:
+            return _extract_pdf_text(f, max_pages)
+    except OSError as e:
+        print(f"[WARN] Failed to open PDF {path}: {e}")
         return ""
 
-    if not pdf_bytes:
+def _extract_pdf_text(stream, max_pages: int) -> str:
+
+    if not PdfReader:
         return ""
 
     try:
-        reader = PdfReader(BytesIO(pdf_bytes))
+        reader = PdfReader(stream)
+    except MemoryError:
+        raise  # the parser process's memory cap, not a broken PDF
     except DependencyError as e:
         # PyCryptodome not installed for AES encripted PDF
         print(f"[WARN] This PDF needs PyCryptodome to decode: {e}")
@@ -161,14 +730,18 @@ def extract_text_from_pdf_bytes(pdf_bytes: bytes, max_pages: int = 20) -> str:
 
     texts = []
     try:
-        for i, page in enumerate(reader.pages):
-            if i >= max_pages:
-                break
+        # Index pages directly: only the first max_pages are ever parsed and decoded
+        for i in range(min(max_pages, len(reader.pages))):
+            page = reader.pages[i]
             try:
                 page_text = page.extract_text() or ""
+            except MemoryError:
+                raise
             except Exception:
                 page_text = ""
             texts.append(page_text)
+    except MemoryError:
+        raise
     except DependencyError as e:
         print(f"[WARN] Enconter decoding issue, skipped: {e}")
         return ""
@@ -182,12 +755,258 @@ def extract_text_from_pdf_bytes(pdf_bytes: bytes, max_pages: int = 20) -> str:
 
 
 
+def _remove_spooled(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _pdf_worker_main(conn, max_pages: int, max_memory: int | None):
+    # Parser process: parse the paths sent on conn one at a time under an address-space limit,
+    # answer (status, text). Exits after a MemoryError, its heap may be left fragmented.
+    out_of_memory_reply = pickle.dumps(("memory", ""))  # prebuilt: sending it must not allocate
+    if max_memory and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+    while True:
+        try:
+            path = conn.recv()
+        except EOFError:
+            return
+        if path is None:
+            return
+        try:
+            reply = ("ok", extract_text_from_pdf_file(path, max_pages))
+        except MemoryError:
+            reply = None
+        except Exception as e:
+            reply = ("error", repr(e))
+        try:
+            if reply is not None:
+                conn.send(reply)
+                continue
+        except MemoryError:
+            pass  # the cap was hit below the parser (it may report something else), no room to answer
+        conn.send_bytes(out_of_memory_reply)
+        return
+
+
+class _PdfWorker:
+    """One sandboxed parser process and the pipe to it."""
+
+    def __init__(self, ctx, max_pages: int, max_memory: int | None):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_pdf_worker_main, args=(child_conn, max_pages, max_memory), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def parse(self, path: str, timeout: float | None) -> tuple[str, str, float]:
+        # (status, text, seconds): "ok", "error", "memory" (hit the limit), "timeout" (killed) or "crashed"
+        start = time.perf_counter()
+        self.tasks += 1
+        try:
+            self.conn.send(path)
+            if not self.conn.poll(timeout):
+                self.kill()
+                return "timeout", "", time.perf_counter() - start
+            status, text = self.conn.recv()
+            return status, text, time.perf_counter() - start
+        except (EOFError, OSError):
+            # Died mid-parse: killed by the OS, segfault in a C extension, ...
+            self.process.join(1)
+            self.kill()
+            return "crashed", f"exit code {self.process.exitcode}", time.perf_counter() - start
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class PdfExtractionPool:
+    """Sandboxed parser processes running extract_text_from_pdf_file, fed by the download threads with backpressure.
+
+    Each process parses one PDF at a time under an address-space limit (max_memory, RLIMIT_AS) and
+    is killed when a PDF takes longer than timeout seconds, so a malformed or hostile attachment
+    costs one worker restart instead of stalling the crawl. Workers are also replaced after
+    max_tasks documents. PDFs that time out, hit the memory limit or crash their worker get ""
+    as text and go to the quarantine list (and to quarantine_dir, with quarantine.jsonl, for a
+    later retry_quarantined_pdfs).
+    """
+
+    def __init__(
+        self,
+        workers: int = PDF_WORKERS,
+        max_pending: int = PDF_QUEUE_SIZE,
+        max_pages: int = 20,
+        timeout: float | None = PDF_PARSE_TIMEOUT,
+        max_memory: int | None = PDF_WORKER_MAX_MEMORY,
+        max_tasks: int = PDF_WORKER_MAX_TASKS,
+        quarantine_dir: str | None = None,
+    ):
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.max_tasks = max(1, max_tasks)
+        self.quarantine_dir = quarantine_dir or PDF_QUARANTINE_DIR
+        self.quarantine = []  # one dict per PDF that failed in a worker
+        self.quarantine_lock = threading.Lock()
+        # spawn, not fork: workers start from a fetch thread, a forked child could inherit a held lock
+        self.ctx = multiprocessing.get_context("spawn")
+        # Bounded "queue": a download thread waits here while max_pending PDFs are still unparsed
+        self.slots = threading.BoundedSemaphore(max(1, max_pending))
+        self.tasks = queue.Queue()
+        # One supervising thread per worker process: sends it a PDF, waits with the timeout, restarts it
+        self.threads = [threading.Thread(target=self._supervise, daemon=True) for _ in range(max(1, workers))]
+        for t in self.threads:
+            t.start()
+
+    def submit(self, pdf_path: str, source: str | None = None) -> Future:
+        # Takes ownership of the spooled file: it is removed once parsed (or cancelled).
+        # source: where the PDF came from (URL), kept in the quarantine record
+        with METRICS.timer("stage_seconds", stage="pdf_queue_wait"):
+            self.slots.acquire()
+        future = Future()
+        self.tasks.put((pdf_path, source, future))
+        return future
+
+    def _supervise(self):
+        worker = None
+        try:
+            while True:
+                task = self.tasks.get()
+                if task is None:
+                    return
+                pdf_path, source, future = task
+                try:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    if worker is None:
+                        worker = _PdfWorker(self.ctx, self.max_pages, self.max_memory)
+                    status, text, seconds = worker.parse(pdf_path, self.timeout)
+                    METRICS.observe("stage_seconds", seconds, stage="pdf_parse")
+                    if status != "ok":
+                        self._quarantine(pdf_path, source, status, text, seconds)
+                        text = ""
+                    if status not in ("ok", "error") or worker.tasks >= self.max_tasks:
+                        worker.close()
+                        worker = None
+                        METRICS.inc("pdf_worker_restarts_total", reason="recycled" if status == "ok" else status)
+                    future.set_result(text)
+                except BaseException as e:
+                    if not future.done():
+                        future.set_exception(e)
+                finally:
+                    self.slots.release()
+                    _remove_spooled(pdf_path)
+        finally:
+            if worker is not None:
+                worker.close()
+
+    def _quarantine(self, pdf_path: str, source: str | None, reason: str, detail: str, seconds: float):
+        record = {
+            "source": source or pdf_path,
+            "reason": reason,
+            "detail": detail,
+            "seconds": round(seconds, 3),
+            "quarantinedAt": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "file": None,
+        }
+        print(f"[WARN] PDF quarantined ({reason}, {seconds:.1f} s): {record['source']}")
+        METRICS.inc("pdf_quarantined_total", reason=reason)
+        with self.quarantine_lock:
+            if self.quarantine_dir:
+                os.makedirs(self.quarantine_dir, exist_ok=True)
+                name = hashlib.sha1(record["source"].encode("utf-8")).hexdigest()[:20] + ".pdf"
+                try:
+                    shutil.copyfile(pdf_path, os.path.join(self.quarantine_dir, name))
+                    record["file"] = name
+                except OSError as e:
+                    print(f"[WARN] Could not keep quarantined PDF {pdf_path}: {e}")
+                with open(os.path.join(self.quarantine_dir, "quarantine.jsonl"), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.quarantine.append(record)
+
+    def shutdown(self):
+        # Queued PDFs are cancelled, the ones being parsed finish first
+        while True:
+            try:
+                pdf_path, _, future = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            future.cancel()
+            self.slots.release()
+            _remove_spooled(pdf_path)
+        for _ in self.threads:
+            self.tasks.put(None)
+        for t in self.threads:
+            t.join()
+
+
+def retry_quarantined_pdfs(
+    quarantine_dir: str,
+    timeout: float | None = None,
+    max_memory: int | None = None,
+    workers: int = 1,
+    max_pages: int = 20,
+) -> dict:
+    # Parse the PDFs kept in quarantine_dir again (default: no time or memory limit), {source: text}
+    # of those that now parse; the others stay in quarantine.jsonl
+    index_path = os.path.join(quarantine_dir, "quarantine.jsonl")
+    with open(index_path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    pool = PdfExtractionPool(workers=workers, max_pages=max_pages, timeout=timeout, max_memory=max_memory)
+    pool.quarantine_dir = None  # failures are only listed, quarantine.jsonl is rewritten below
+    futures = {}
+    try:
+        for record in records:
+            if record.get("file") and record["source"] not in futures:
+                fd, spooled = tempfile.mkstemp(suffix=".pdf", dir=PDF_SPOOL_DIR)
+                os.close(fd)
+                shutil.copyfile(os.path.join(quarantine_dir, record["file"]), spooled)
+                futures[record["source"]] = pool.submit(spooled, source=record["source"])
+        texts = {source: future.result() for source, future in futures.items()}
+    finally:
+        pool.shutdown()
+
+    failed = {r["source"] for r in pool.quarantine}
+    recovered = {source: text for source, text in texts.items() if source not in failed}
+    remaining = [r for r in records if r["source"] not in recovered]
+    for r in records:
+        if r["source"] in recovered and r.get("file"):
+            _remove_spooled(os.path.join(quarantine_dir, r["file"]))
+    _write_jsonl_atomic(index_path, remaining)
+    print(f"[INFO] Recovered {len(recovered)} of {len(futures)} quarantined PDFs, {len(remaining)} left in {index_path}")
+    return recovered
+
+
+def _write_jsonl_atomic(path: str, records: list):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+
 # -------------------- API Packaging -------------------- #
-def get_comment_detail_by_id(comment_id: str) -> dict:
+def get_comment_detail_by_id(comment_id: str, use_cache: bool = True) -> dict:
 
     url = f"{BASE_URL}/comments/{comment_id}"
     params = {"api_key": API_KEY, "include": "attachments"}
-    data = get_json(url, params)
+    with METRICS.timer("stage_seconds", stage="detail"):
+        data = get_json(url, params, cache_key=f"detail:{comment_id}", use_cache=use_cache)
     return data
 
 def _collect_from_file_formats(file_formats):
@@ -241,20 +1060,251 @@ def get_pdf_urls_from_detail(detail: dict) -> list:
     deduped = list(dict.fromkeys(pdf_urls))
     return deduped
 
-# ----------- Main logic: fetch comment by page + process HTML + PDF ------------ #
-def get_comments_with_text_and_pdfs(
+# -------------------- Query planner: date windows under the page ceiling -------------------- #
+# regulations.gov date filters take Eastern time "YYYY-MM-DD HH:MM:SS", responses are UTC ISO
+API_TIMEZONE = ZoneInfo("America/New_York")
+API_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _to_api_datetime(iso_utc: str) -> str:
+    dt = datetime.strptime(iso_utc, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    return dt.astimezone(API_TIMEZONE).strftime(API_DATETIME_FORMAT)
+
+
+def _list_cache_key(params: dict) -> str:
+    return "list:" + urllib.parse.urlencode(sorted((k, v) for k, v in params.items() if k != "api_key"))
+
+
+def _describe_window(window: dict) -> str:
+    filters = window.get("filters") or {}
+    ge = filters.get("filter[lastModifiedDate][ge]")
+    le = filters.get("filter[lastModifiedDate][le]")
+    return f", lastModifiedDate {ge or '...'} -> {le or '...'}" if ge or le else ""
+
+
+def _query_meta(docket_id: str, filters: dict, sort: str | None = None, cached: bool = False) -> tuple[int, list]:
+    # Cheap probe: totalElements + the first few items of a query
+    params = {"filter[docketId]": docket_id, "page[size]": "5", "page[number]": "1", "api_key": API_KEY}
+    params.update(filters)
+    if sort:
+        params["sort"] = sort
+    data = get_json(f"{BASE_URL}/comments", params, cache_key=_list_cache_key(params), use_cache=cached)
+    total = (data.get("meta") or {}).get("totalElements") or 0
+    return int(total), data.get("data") or []
+
+
+def plan_docket_windows(
     docket_id: str,
     page_size: int = 250,
+    since: str | None = None,
+    cached: bool = False,
+) -> list:
+    # Split the docket (optionally only lastModifiedDate >= since, API time) into lastModifiedDate
+    # windows that each fit in MAX_PAGES_PER_QUERY pages; windows that are still too big get halved.
+    limit = page_size * MAX_PAGES_PER_QUERY
+    sort = "lastModifiedDate,documentId"
+    base = {"filter[lastModifiedDate][ge]": since} if since else {}
+
+    total, _ = _query_meta(docket_id, base, cached=cached)
+    if total <= limit:
+        return [{"filters": base, "sort": sort if since else None, "count": total}]
+
+    _, first = _query_meta(docket_id, base, sort=sort, cached=cached)
+    _, last = _query_meta(docket_id, base, sort="-lastModifiedDate,documentId", cached=cached)
+    lo = datetime.strptime(_to_api_datetime(first[0]["attributes"]["lastModifiedDate"]), API_DATETIME_FORMAT)
+    hi = datetime.strptime(_to_api_datetime(last[0]["attributes"]["lastModifiedDate"]), API_DATETIME_FORMAT)
+    print(f"=== {docket_id}: {total} comments > {limit} per query, split {lo} -> {hi} into date windows ===")
+
+    def split(lo, hi):
+        filters = {
+            "filter[lastModifiedDate][ge]": lo.strftime(API_DATETIME_FORMAT),
+            "filter[lastModifiedDate][le]": hi.strftime(API_DATETIME_FORMAT),
+        }
+        count, _ = _query_meta(docket_id, filters, cached=cached)
+        if count == 0:
+            return []
+        if count <= limit or hi - lo < timedelta(seconds=1):
+            if count > limit:
+                print(f"[WARN] {count} comments modified at {lo}, only the first {limit} can be listed.")
+            return [{"filters": filters, "sort": sort, "count": count}]
+        mid = lo + (hi - lo) // 2
+        mid = mid.replace(microsecond=0)
+        return split(lo, mid) + split(mid + timedelta(seconds=1), hi)
+
+    windows = split(lo, hi)
+    print(f"  Planned {len(windows)} windows: {[w['count'] for w in windows]}")
+    return windows
+
+
+# ----------- Main logic: fetch comment by page + process HTML + PDF ------------ #
+def fetch_comment(item: dict, pdf_pool: PdfExtractionPool | None = None, refresh: bool = False) -> dict:
+    # Network half of a row: detail + PDF downloads. With a pdf_pool the PDFs are handed to the
+    # parser processes and kept as futures, so this thread moves on to the next download.
+    # refresh: skip CACHE reads (the comment changed since it was cached).
+    base_attrs = item.get("attributes", {}) or {}
+    comment_id = item.get("id")
+
+    # ---- Get HTML comment ----
+    raw_comment_html = (
+        base_attrs.get("comment")
+        or base_attrs.get("commentText")
+        or ""
+    )
+    clean_html_text = clean_comment_html(raw_comment_html)
+
+    # ---- Get detail：Garantee attachments + more complete text ----
+    detail = None
+    detail_attrs = {}
+    try:
+        detail = get_comment_detail_by_id(comment_id, use_cache=not refresh)
+        detail_attrs = (detail.get("data") or {}).get("attributes", {}) or {}
+        # If no comment in list, try detail
+        if not raw_comment_html:
+            raw_comment_html = (
+                detail_attrs.get("comment")
+                or detail_attrs.get("commentText")
+                or ""
+            )
+            clean_html_text = clean_comment_html(raw_comment_html)
+    except HTTPError as e:
+        if e.code == 429:
+            # Quota exhausted after all retries: stop here so the checkpoint resumes on this comment
+            raise
+        print(f"[WARN] Fail to extract commentId={comment_id}, HTTP {e.code}, jump over detail.")
+    except URLError as e:
+        print(f"[WARN] Network error for getting details commentId={comment_id}, reason: {e.reason}, jump over detail.")
+
+    # ---- KEYWORD：if attach shows up (see attached file(s), attached request) ----
+    search_str = " ".join(
+        [
+            base_attrs.get("title") or "",
+            detail_attrs.get("title") or "",
+            clean_html_text or "",
+        ]
+    )
+    has_attach_keyword = bool(re.search(r"attach", search_str, flags=re.I))
+
+    # ---- If there's attachment in detail download PDF ----
+    pdf_urls = []
+    pdf_texts = []
+    if detail:
+        pdf_urls = get_pdf_urls_from_detail(detail)
+
+        if pdf_urls:
+            print(f"  commentId={comment_id} find {len(pdf_urls)} attachments, start extract PDF text...")
+            for u in pdf_urls:
+                with METRICS.timer("stage_seconds", stage="pdf_download"):
+                    pdf_path = get_binary_to_file(u, use_cache=not refresh)
+                if pdf_path is None:
+                    pdf_texts.append("")
+                elif pdf_pool is not None:
+                    pdf_texts.append(pdf_pool.submit(pdf_path, source=u))
+                else:
+                    try:
+                        with METRICS.timer("stage_seconds", stage="pdf_parse"):
+                            pdf_texts.append(extract_text_from_pdf_file(pdf_path, max_pages=20))
+                    except MemoryError:
+                        print(f"[WARN] Out of memory parsing {u}, skipped.")
+                        pdf_texts.append("")
+                    finally:
+                        _remove_spooled(pdf_path)
+
+    return {
+        "item": item,
+        "detail_attrs": detail_attrs,
+        "raw_comment_html": raw_comment_html,
+        "clean_html_text": clean_html_text,
+        "has_attach_keyword": has_attach_keyword,
+        "pdf_urls": pdf_urls,
+        "pdf_texts": pdf_texts,
+    }
+
+
+def assemble_comment_row(fetched: dict) -> dict | None:
+    # Wait for the PDF texts (in attachment order) and build the output row, None when there's no text
+    item = fetched["item"]
+    base_attrs = item.get("attributes", {}) or {}
+    comment_id = item.get("id")
+    detail_attrs = fetched["detail_attrs"]
+    raw_comment_html = fetched["raw_comment_html"]
+    clean_html_text = fetched["clean_html_text"]
+    has_attach_keyword = fetched["has_attach_keyword"]
+    pdf_urls = fetched["pdf_urls"]
+
+    pdf_text = ""
+    all_pdf_texts = []
+    for text_one in fetched["pdf_texts"]:
+        if isinstance(text_one, Future):
+            with METRICS.timer("stage_seconds", stage="pdf_wait"):
+                text_one = text_one.result()
+        if text_one:
+            all_pdf_texts.append(text_one)
+
+    if all_pdf_texts:
+        pdf_text = "\n\n----- [PDF_SEP] -----\n\n".join(all_pdf_texts)
+        pdf_text = re.sub(r"\s+", " ", pdf_text).strip()
+
+    # ---- Merge HTML and PDF text ----
+    combined_parts = []
+    if clean_html_text:
+        combined_parts.append(clean_html_text)
+    if pdf_text:
+        combined_parts.append("[PDF_TEXT]\n" + pdf_text)
+
+    combined_text = "\n\n".join(combined_parts).strip()
+
+    # Ignore if no text at all
+    if not combined_text:
+        return None
+
+    attrs = detail_attrs or base_attrs
+
+    return {
+        "commentId": comment_id,
+        "agencyId": attrs.get("agencyId") or base_attrs.get("agencyId"),
+        "docketId": attrs.get("docketId") or base_attrs.get("docketId"),
+        "documentId": attrs.get("documentId") or base_attrs.get("documentId"),
+        "commentOnId": attrs.get("commentOnId") or base_attrs.get("commentOnId"),
+        "documentType": attrs.get("documentType") or base_attrs.get("documentType"),
+        "postedDate": attrs.get("postedDate") or base_attrs.get("postedDate"),
+        "receiveDate": attrs.get("receiveDate") or base_attrs.get("receiveDate"),
+        "title": attrs.get("title") or base_attrs.get("title"),
+        "trackingNbr": attrs.get("trackingNbr") or base_attrs.get("trackingNbr"),
+        "organizationName": attrs.get("organization") or base_attrs.get("organization"),
+        "firstName": attrs.get("firstName") or base_attrs.get("firstName"),
+        "lastName": attrs.get("lastName") or base_attrs.get("lastName"),
+        "city": attrs.get("city") or base_attrs.get("city"),
+        "stateProvinceRegion": attrs.get("stateProvinceRegion") or base_attrs.get("stateProvinceRegion"),
+        "country": attrs.get("country") or base_attrs.get("country"),
+        "withdrawn": attrs.get("withdrawn") or base_attrs.get("withdrawn"),
+        "restrictReasonType": attrs.get("restrictReasonType") or base_attrs.get("restrictReasonType"),
+        "restrictReason": attrs.get("restrictReason") or base_attrs.get("restrictReason"),
+        "rawCommentHtml": raw_comment_html,
+        "cleanCommentHtml": clean_html_text,
+        "pdfText": pdf_text,
+        "combinedText": combined_text,
+        "pdfUrls": ";".join(pdf_urls),
+        "hasSeeAttachedHint": has_attach_keyword,
+    }
+
+
+def build_comment_row(item: dict, pdf_pool: PdfExtractionPool | None = None) -> dict | None:
+    # Fetch detail + PDFs for one list item, return None when there's no text at all
+    return assemble_comment_row(fetch_comment(item, pdf_pool))
+
+
+def _list_query_pages(
+    docket_id: str,
+    window: dict,
+    page_size: int,
     start_page: int = 1,
     end_page: int | None = None,
-    per_detail_sleep: float = 0.3,
-):
+    cached_list_pages: bool = False,
+) -> list:
+    # All list pages of one (sub-)query as [(page_number, items)]
     url = f"{BASE_URL}/comments"
-
-    all_results = []
+    pages = []
     page_number = start_page
-    total_from_meta = None
-
     while True:
         params = {
             "filter[docketId]": docket_id,
@@ -262,12 +1312,16 @@ def get_comments_with_text_and_pdfs(
             "page[number]": str(page_number),
             "api_key": API_KEY,
         }
+        params.update(window.get("filters") or {})
+        if window.get("sort"):
+            params["sort"] = window["sort"]
 
         print(
             f"=== Require page {page_number} comments"
-            f"(docketId={docket_id}, page[size]={page_size}) ==="
+            f"(docketId={docket_id}, page[size]={page_size}{_describe_window(window)}) ==="
         )
-        data = get_json(url, params)
+        with METRICS.timer("stage_seconds", stage="list_page"):
+            data = get_json(url, params, cache_key=_list_cache_key(params), use_cache=cached_list_pages)
 
         meta = data.get("meta", {}) or {}
         items = data.get("data", []) or []
@@ -284,116 +1338,7 @@ def get_comments_with_text_and_pdfs(
             print(" No more data on this page, stop.")
             break
 
-        for idx, item in enumerate(items, start=1):
-            base_attrs = item.get("attributes", {}) or {}
-            comment_id = item.get("id")
-
-            # ---- Get HTML comment ----
-            raw_comment_html = (
-                base_attrs.get("comment")
-                or base_attrs.get("commentText")
-                or ""
-            )
-            clean_html_text = clean_comment_html(raw_comment_html)
-
-            # ---- Get detail：Garantee attachments + more complete text ----
-            detail = None
-            detail_attrs = {}
-            try:
-                detail = get_comment_detail_by_id(comment_id)
-                detail_attrs = (detail.get("data") or {}).get("attributes", {}) or {}
-                # If no comment in list, try detail
-                if not raw_comment_html:
-                    raw_comment_html = (
-                        detail_attrs.get("comment")
-                        or detail_attrs.get("commentText")
-                        or ""
-                    )
-                    clean_html_text = clean_comment_html(raw_comment_html)
-            except HTTPError as e:
-                print(f"[WARN] Fail to extract commentId={comment_id}, HTTP {e.code}, jump over detail.")
-            except URLError as e:
-                print(f"[WARN] Network error for getting details commentId={comment_id}, reason: {e.reason}, jump over detail.")
-
-            time.sleep(per_detail_sleep)
-
-            # ---- KEYWORD：if attach shows up (see attached file(s), attached request) ----
-            search_str = " ".join(
-                [
-                    base_attrs.get("title") or "",
-                    detail_attrs.get("title") or "",
-                    clean_html_text or "",
-                ]
-            )
-            has_attach_keyword = bool(re.search(r"attach", search_str, flags=re.I))
-
-            # ---- If there's attachment in detail download PDF ----
-            pdf_urls = []
-            pdf_text = ""
-            if detail:
-                pdf_urls = get_pdf_urls_from_detail(detail)
-
-                if pdf_urls:
-                    print(f"  commentId={comment_id} find {len(pdf_urls)} attachments, start extract PDF text...")
-                    all_pdf_texts = []
-                    for u in pdf_urls:
-                        pdf_bytes = get_binary(u)
-                        text_one = extract_text_from_pdf_bytes(pdf_bytes, max_pages=20)
-                        if text_one:
-                            all_pdf_texts.append(text_one)
-                        time.sleep(0.1)  # sleep between PDF downloads
-
-                    if all_pdf_texts:
-                        pdf_text = "\n\n----- [PDF_SEP] -----\n\n".join(all_pdf_texts)
-                        pdf_text = re.sub(r"\s+", " ", pdf_text).strip()
-
-            # ---- Merge HTML and PDF text ----
-            combined_parts = []
-            if clean_html_text:
-                combined_parts.append(clean_html_text)
-            if pdf_text:
-                combined_parts.append("[PDF_TEXT]\n" + pdf_text)
-
-            combined_text = "\n\n".join(combined_parts).strip()
-
-            # Ignore if no text at all
-            if not combined_text:
-                continue
-
-            attrs = detail_attrs or base_attrs
-
-            row = {
-                "commentId": comment_id,
-                "agencyId": attrs.get("agencyId") or base_attrs.get("agencyId"),
-                "docketId": attrs.get("docketId") or base_attrs.get("docketId"),
-                "documentId": attrs.get("documentId") or base_attrs.get("documentId"),
-                "commentOnId": attrs.get("commentOnId") or base_attrs.get("commentOnId"),
-                "documentType": attrs.get("documentType") or base_attrs.get("documentType"),
-                "postedDate": attrs.get("postedDate") or base_attrs.get("postedDate"),
-                "receiveDate": attrs.get("receiveDate") or base_attrs.get("receiveDate"),
-                "title": attrs.get("title") or base_attrs.get("title"),
-                "trackingNbr": attrs.get("trackingNbr") or base_attrs.get("trackingNbr"),
-                "organizationName": attrs.get("organization") or base_attrs.get("organization"),
-                "firstName": attrs.get("firstName") or base_attrs.get("firstName"),
-                "lastName": attrs.get("lastName") or base_attrs.get("lastName"),
-                "city": attrs.get("city") or base_attrs.get("city"),
-                "stateProvinceRegion": attrs.get("stateProvinceRegion") or base_attrs.get("stateProvinceRegion"),
-                "country": attrs.get("country") or base_attrs.get("country"),
-                "withdrawn": attrs.get("withdrawn") or base_attrs.get("withdrawn"),
-                "restrictReasonType": attrs.get("restrictReasonType") or base_attrs.get("restrictReasonType"),
-                "restrictReason": attrs.get("restrictReason") or base_attrs.get("restrictReason"),
-                "rawCommentHtml": raw_comment_html,
-                "cleanCommentHtml": clean_html_text,
-                "pdfText": pdf_text,
-                "combinedText": combined_text,
-                "pdfUrls": ";".join(pdf_urls),
-                "hasSeeAttachedHint": has_attach_keyword,
-            }
-
-            all_results.append(row)
-
-            if page_number == start_page and idx <= 3:
-                print("  Sample combinedText(preview): ", combined_text[:200], "...\n")
+        pages.append((page_number, items))
 
         if has_next is False:
             print("  meta.hasNextPage = False, stop.")
@@ -403,90 +1348,609 @@ def get_comments_with_text_and_pdfs(
             print(f" Reach set end_page={end_page}, stop.")
             break
 
+        if page_number >= MAX_PAGES_PER_QUERY:
+            print(f"[WARN] Query hit the {MAX_PAGES_PER_QUERY}-page ceiling, plan_docket_windows splits it further.")
+            break
+
         page_number += 1
-        time.sleep(0.5)
+    return pages
 
-    print(
-        f"\n==== API have {total_from_meta} records: "
-        f"Between {start_page}-{end_page or page_number} pages, "
-        f"Fetched {len(all_results)} records with HTML + PDF ====\n"
-    )
 
-    return all_results
+def iter_comment_rows(
+    docket_id: str,
+    page_size: int = 250,
+    start_page: int = 1,
+    end_page: int | None = None,
+    max_workers: int = 8,
+    skip_through: str | None = None,
+    cached_list_pages: bool = False,
+    pdf_workers: int = PDF_WORKERS,
+    windows: list | None = None,
+    start_window: int = 0,
+    seen_ids=None,
+    refresh: bool = False,
+    pdf_pool: PdfExtractionPool | None = None,
+):
+    # Yield (window_index, page_number, item, row) in API order, row is None when the comment has no text.
+    # windows: sub-queries from plan_docket_windows (default: one query over the whole docket).
+    # Up to LIST_WORKERS windows are listed ahead in parallel; items of a page are fetched concurrently
+    # (detail + PDFs), throttled by RATE_LIMITER, and PDFs are parsed by pdf_workers processes meanwhile.
+    # pool.map yields in submission order and rows are assembled in that order, so they keep the
+    # API order of a serial run. Items already in seen_ids (or in an earlier window) are skipped.
+    # start_page / end_page / skip_through apply to windows[start_window], skip_through being the last
+    # commentId already done there. cached_list_pages: replay list pages from CACHE too (zero API calls).
+    # refresh: refetch details + PDFs instead of reading CACHE.
+    # pdf_pool: parser processes shared with other crawls (default: own pool of pdf_workers processes).
+    windows = windows or [{"filters": {}, "sort": None}]
+    seen = set(seen_ids or ())
+
+    n_rows = 0
+    # Helper threads queue at RATE_LIMITER with the priority of the docket they work for
+    priority = (_request_priority(),)
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers), initializer=_set_request_priority, initargs=priority)
+    list_pool = ThreadPoolExecutor(max_workers=max(1, LIST_WORKERS), initializer=_set_request_priority, initargs=priority)
+    own_pdf_pool = pdf_pool is None and pdf_workers > 0
+    if own_pdf_pool:
+        pdf_pool = PdfExtractionPool(workers=pdf_workers)
+    listed = deque()
+    next_window = start_window
+
+    def list_next_window():
+        nonlocal next_window
+        if next_window < len(windows):
+            first = next_window == start_window
+            listed.append((next_window, list_pool.submit(
+                _list_query_pages,
+                docket_id,
+                windows[next_window],
+                page_size,
+                start_page if first else 1,
+                end_page if first else None,
+                cached_list_pages,
+            )))
+            next_window += 1
 
+    try:
+        for _ in range(max(1, LIST_WORKERS)):
+            list_next_window()
+
+        while listed:
+            window_idx, pages = listed.popleft()
+            list_next_window()
+
+            for page_number, items in pages.result():
+                if window_idx == start_window and page_number == start_page and skip_through is not None:
+                    done_ids = [item.get("id") for item in items]
+                    if skip_through in done_ids:
+                        n_done = done_ids.index(skip_through) + 1
+                        print(f"  Resume after commentId={skip_through}, skip {n_done} finished items.")
+                        items = items[n_done:]
+                    else:
+                        print(f"[WARN] commentId={skip_through} not on page {page_number} anymore, refetch the whole page.")
+
+                # A comment modified mid-crawl can show up again in a later window
+                items = [item for item in items if item.get("id") not in seen]
+                seen.update(item.get("id") for item in items)
+
+                fetched_items = pool.map(lambda item: fetch_comment(item, pdf_pool, refresh), items)
+                for idx, (item, fetched) in enumerate(zip(items, fetched_items), start=1):
+                    row = assemble_comment_row(fetched)
+                    METRICS.inc("comments_total", result="row" if row is not None else "no_text")
+                    if row is not None:
+                        n_rows += 1
+                        if window_idx == start_window and page_number == start_page and idx <= 3:
+                            print("  Sample combinedText(preview): ", row["combinedText"][:200], "...\n")
+
+                    yield window_idx, page_number, item, row
+    finally:
+        # On errors / early close don't keep spending quota on items nobody will read
+        list_pool.shutdown(wait=True, cancel_futures=True)
+        pool.shutdown(wait=True, cancel_futures=True)
+        if own_pdf_pool:
+            pdf_pool.shutdown()
+
+    print(f"\n==== {docket_id}: fetched {n_rows} records with HTML + PDF from {len(windows)} quer(ies) ====\n")
 
-# -------------------- main：set up docket + make page into blocks -------------------- #
-if __name__ == "__main__":
-    #==== Change Output Directory =====
-    OUTPUT_DIR = "" # <<< !!! Change your Output Directory here !!!
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+def get_comments_with_text_and_pdfs(
+    docket_id: str,
+    page_size: int = 250,
+    start_page: int = 1,
+    end_page: int | None = None,
+    max_workers: int = 8,
+    pdf_workers: int = PDF_WORKERS,
+):
+    # In-memory variant: collect every row with text into a list
+    return [
+        row
+        for _, _, _, row in iter_comment_rows(
+            docket_id,
+            page_size=page_size,
+            start_page=start_page,
+            end_page=end_page,
+            max_workers=max_workers,
+            pdf_workers=pdf_workers,
+        )
+        if row is not None
+    ]
 
-    #==== Change Docket ID =====
-    docket_id = "" # <<< !!! Change your docket ID here !!!
-    page_size = 250
 
-    #==== Page Section =====
-    CHUNK_START_PAGE = 1
-    CHUNK_END_PAGE   = 2
+# -------------------- Streaming output + checkpoint -------------------- #
+FIELDNAMES = [
+    "commentId",
+    "agencyId",
+    "docketId",
+    "documentId",
+    "commentOnId",
+    "documentType",
+    "postedDate",
+    "receiveDate",
+    "title",
+    "trackingNbr",
+    "organizationName",
+    "firstName",
+    "lastName",
+    "city",
+    "stateProvinceRegion",
+    "country",
+    "withdrawn",
+    "restrictReasonType",
+    "restrictReason",
+    "rawCommentHtml",
+    "cleanCommentHtml",
+    "pdfText",
+    "combinedText",
+    "pdfUrls",
+    "hasSeeAttachedHint",
+]
+
+
+def _utc_now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _write_json_atomic(path: str, obj):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class CrawlSink:
+    """Append rows to JSONL + CSV as they finish and checkpoint the crawl position after each comment."""
+
+    def __init__(self, output_dir: str, docket_id: str, page_size: int):
+        # Same {docket_id}_comments_text_pdf_*.csv/json layout as the page-chunk exports
+        # (_p{a}_to_p{b}); "_all" since a crawl covers the whole docket
+        prefix = os.path.join(output_dir, f"{docket_id}_comments_text_pdf_all")
+        self.jsonl_path = prefix + ".jsonl"
+        self.csv_path = prefix + ".csv"
+        self.json_path = prefix + ".json"
+        self.checkpoint_path = os.path.join(output_dir, f"{docket_id}_checkpoint.json")
+
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                self.state = json.load(f)
+            if self.state["docketId"] != docket_id or self.state["pageSize"] != page_size:
+                raise ValueError(
+                    f"Checkpoint {self.checkpoint_path} was written for docketId={self.state['docketId']}, "
+                    f"page[size]={self.state['pageSize']}; delete it to start over with new settings."
+                )
+        else:
+            self.state = {
+                "docketId": docket_id,
+                "pageSize": page_size,
+                "page": 1,
+                "lastCommentId": None,
+                "rowsWritten": 0,
+                "jsonlBytes": 0,
+                "csvBytes": 0,
+                "done": False,
+                "startedAt": _utc_now_iso(),
+            }
+        self.f_jsonl = None
+        self.f_csv = None
+        self.writer = None
+
+    def open(self):
+        # Cut off rows written after the last checkpoint (crash between row write and checkpoint)
+        for path, size in ((self.jsonl_path, self.state["jsonlBytes"]), (self.csv_path, self.state["csvBytes"])):
+            with open(path, "a+b") as f:
+                f.truncate(size)
+
+        self.f_jsonl = open(self.jsonl_path, "a", encoding="utf-8")
+        self.f_csv = open(self.csv_path, "a", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.f_csv, fieldnames=FIELDNAMES)
+        if self.state["csvBytes"] == 0:
+            self.writer.writeheader()
+        return self
+
+    def write(self, page_number: int, comment_id: str, row: dict | None):
+        if row is not None:
+            self.f_jsonl.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self.writer.writerow(row)
+            self.f_jsonl.flush()
+            self.f_csv.flush()
+            self.state["rowsWritten"] += 1
+
+        self.state["page"] = page_number
+        self.state["lastCommentId"] = comment_id
+        self.state["jsonlBytes"] = os.fstat(self.f_jsonl.fileno()).st_size
+        self.state["csvBytes"] = os.fstat(self.f_csv.fileno()).st_size
+        _write_json_atomic(self.checkpoint_path, self.state)
+
+    def close(self, done: bool = False):
+        for f in (self.f_jsonl, self.f_csv):
+            if f is not None:
+                f.close()
+        self.f_jsonl = self.f_csv = self.writer = None
+        if done:
+            self.state["done"] = True
+            _write_json_atomic(self.checkpoint_path, self.state)
+
+    def export_json(self):
+        # Same layout as json.dump(rows, indent=2), streamed line by line from the JSONL
+        tmp_path = self.json_path + ".tmp"
+        with open(self.jsonl_path, encoding="utf-8") as f_in, open(tmp_path, "w", encoding="utf-8") as f_out:
+            n = 0
+            for line in f_in:
+                if not line.strip():
+                    continue
+                row_json = json.dumps(json.loads(line), ensure_ascii=False, indent=2)
+                f_out.write(("[\n" if n == 0 else ",\n") + "\n".join("  " + l for l in row_json.split("\n")))
+                n += 1
+            f_out.write("\n]" if n else "[]")
+        os.replace(tmp_path, self.json_path)
+
+
+def _saved_comment_ids(path: str) -> set:
+    ids = set()
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    ids.add(json.loads(line)["commentId"])
+    return ids
+
+
+def crawl_docket_to_files(
+    docket_id: str,
+    output_dir: str,
+    page_size: int = 250,
+    max_workers: int = 8,
+    cached_list_pages: bool = False,
+    pdf_workers: int = PDF_WORKERS,
+    pdf_pool: PdfExtractionPool | None = None,
+) -> dict:
+    # Stream a docket into {docket_id}_comments_text_pdf_all.jsonl/.csv, resuming from the checkpoint if any.
+    # The date-window plan is made on the first run and kept in the checkpoint, so a docket of any
+    # size is crawled by one unattended command (rerun after a crash / quota stop to continue).
+    sink = CrawlSink(output_dir, docket_id, page_size)
+    state = sink.state
+    if state["done"]:
+        print(f"==== {docket_id} already complete ({state['rowsWritten']} rows), nothing to fetch ====")
+        sink.export_json()
+        return state
+
+    if "windows" not in state:
+        # Checkpoints from before the planner crawled one query over the whole docket
+        fresh = state["lastCommentId"] is None
+        state["windows"] = plan_docket_windows(docket_id, page_size, cached=cached_list_pages) if fresh else [
+            {"filters": {}, "sort": None}
+        ]
+        state["window"] = 0
+        _write_json_atomic(sink.checkpoint_path, state)
+
+    if state["lastCommentId"]:
+        print(
+            f"==== Resume {docket_id} at window {state['window'] + 1}/{len(state['windows'])}, page {state['page']} "
+            f"after commentId={state['lastCommentId']} ({state['rowsWritten']} rows already saved) ===="
+        )
+
+    finished = False
+    sink.open()
+    try:
+        for window_idx, page_number, item, row in iter_comment_rows(
+            docket_id,
+            page_size=page_size,
+            start_page=state["page"],
+            max_workers=max_workers,
+            skip_through=state["lastCommentId"],
+            cached_list_pages=cached_list_pages,
+            pdf_workers=pdf_workers,
+            windows=state["windows"],
+            start_window=state["window"],
+            seen_ids=_saved_comment_ids(sink.jsonl_path) if state["rowsWritten"] else None,
+            pdf_pool=pdf_pool,
+        ):
+            state["window"] = window_idx
+            sink.write(page_number, item.get("id"), row)
+        finished = True
+    finally:
+        sink.close(done=finished)
+
+    sink.export_json()
+    print("JSONL saved to:", sink.jsonl_path)
+    print("CSV saved to:", sink.csv_path)
+    print("JSON saved to:", sink.json_path)
+    return state
+
+
+# -------------------- Delta sync: only comments modified since the last run -------------------- #
+def _merge_into_outputs(sink: CrawlSink, updated: dict, withdrawn_ids: set) -> tuple[int, int]:
+    # Rewrite JSONL/CSV: changed rows replaced in place, rows withdrawn without text flagged,
+    # new rows appended in the order the API returned them
+    updated = dict(updated)
+    n_replaced = 0
+    tmp_jsonl, tmp_csv = sink.jsonl_path + ".tmp", sink.csv_path + ".tmp"
+    with open(sink.jsonl_path, encoding="utf-8") as f_in, \
+            open(tmp_jsonl, "w", encoding="utf-8") as f_jsonl, \
+            open(tmp_csv, "w", newline="", encoding="utf-8") as f_csv:
+        writer = csv.DictWriter(f_csv, fieldnames=FIELDNAMES)
+        writer.writeheader()
 
-    comments_with_text = get_comments_with_text_and_pdfs(
+        def write_row(row):
+            f_jsonl.write(json.dumps(row, ensure_ascii=False) + "\n")
+            writer.writerow(row)
+
+        n_rows = 0
+        for line in f_in:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            comment_id = row["commentId"]
+            if comment_id in updated:
+                row = updated.pop(comment_id)
+                n_replaced += 1
+            elif comment_id in withdrawn_ids:
+                row["withdrawn"] = True
+                n_replaced += 1
+            write_row(row)
+            n_rows += 1
+        for row in updated.values():
+            write_row(row)
+            n_rows += 1
+
+    os.replace(tmp_jsonl, sink.jsonl_path)
+    os.replace(tmp_csv, sink.csv_path)
+    sink.state["rowsWritten"] = n_rows
+    sink.state["jsonlBytes"] = os.path.getsize(sink.jsonl_path)
+    sink.state["csvBytes"] = os.path.getsize(sink.csv_path)
+    _write_json_atomic(sink.checkpoint_path, sink.state)
+    sink.export_json()
+    return n_replaced, len(updated)
+
+
+def sync_docket(
+    docket_id: str,
+    output_dir: str,
+    page_size: int = 250,
+    max_workers: int = 8,
+    pdf_workers: int = PDF_WORKERS,
+    pdf_pool: PdfExtractionPool | None = None,
+) -> dict:
+    # First run (or an unfinished one): full crawl via crawl_docket_to_files.
+    # Afterwards: only ask /comments for items with lastModifiedDate >= the high-water mark saved
+    # in {docket_id}_sync_state.json and merge them into the existing output by commentId.
+    state_path = os.path.join(output_dir, f"{docket_id}_sync_state.json")
+    sink = CrawlSink(output_dir, docket_id, page_size)
+
+    if not sink.state["done"]:
+        state = crawl_docket_to_files(
+            docket_id, output_dir, page_size=page_size, max_workers=max_workers, pdf_workers=pdf_workers,
+            pdf_pool=pdf_pool,
+        )
+        if state["done"]:
+            # Anything modified after the crawl started may have been missed, start the next delta there
+            sync_state = {"docketId": docket_id, "lastModifiedDate": state.get("startedAt")}
+            _write_json_atomic(state_path, sync_state)
+        return state
+
+    if os.path.exists(state_path):
+        with open(state_path, encoding="utf-8") as f:
+            sync_state = json.load(f)
+    else:
+        sync_state = {"docketId": docket_id, "lastModifiedDate": sink.state.get("startedAt")}
+
+    new_mark = _utc_now_iso()
+    since = None
+    if sync_state.get("lastModifiedDate"):
+        since = _to_api_datetime(sync_state["lastModifiedDate"])
+    else:
+        print(f"[WARN] No high-water mark for {docket_id}, relisting the whole docket.")
+    print(f"==== Delta sync {docket_id}: lastModifiedDate >= {since} ====")
+
+    updated = {}
+    withdrawn_ids = set()
+    for _, _, item, row in iter_comment_rows(
         docket_id,
         page_size=page_size,
-        start_page=CHUNK_START_PAGE,
-        end_page=CHUNK_END_PAGE,
-        per_detail_sleep=0.3,
-    )
+        max_workers=max_workers,
+        pdf_workers=pdf_workers,
+        windows=plan_docket_windows(docket_id, page_size, since=since),
+        refresh=True,
+        pdf_pool=pdf_pool,
+    ):
+        if row is not None:
+            updated[item.get("id")] = row
+        elif (item.get("attributes") or {}).get("withdrawn"):
+            withdrawn_ids.add(item.get("id"))
+
+    n_replaced, n_new = _merge_into_outputs(sink, updated, withdrawn_ids)
+    sync_state["lastModifiedDate"] = new_mark
+    _write_json_atomic(state_path, sync_state)
+    print(f"==== {docket_id}: {n_new} new, {n_replaced} updated/withdrawn, {sink.state['rowsWritten']} rows total ====")
+    return sink.state
+
+
+# -------------------- Multi-docket scheduler: one process, one API budget -------------------- #
+def _docket_progress(output_dir: str, docket_id: str) -> dict:
+    # Crawl position as saved in the docket's checkpoint
+    path = os.path.join(output_dir, f"{docket_id}_checkpoint.json")
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}  # being replaced right now, next report picks it up
+    progress = {"rowsWritten": state.get("rowsWritten", 0), "page": state.get("page")}
+    if state.get("windows"):
+        progress["window"] = f"{state.get('window', 0) + 1}/{len(state['windows'])}"
+    return progress
+
+
+def crawl_dockets(
+    dockets: list,
+    output_dir: str,
+    page_size: int = 250,
+    max_workers: int = 8,
+    max_concurrent_dockets: int = 4,
+    pdf_workers: int = PDF_WORKERS,
+    replay_from_cache: bool = False,
+    progress_every: float = 60.0,
+    profile: str | None = None,
+) -> dict:
+    # Crawl / delta-sync several dockets at once in this process, so they all draw on RATE_LIMITER
+    # instead of each process assuming it has the whole key. dockets: [(docket_id, priority), ...].
+    # Higher priority dockets start first and get tokens first while they wait alongside others.
+    # Each docket keeps its own outputs + checkpoint in output_dir; PDF parser processes are shared.
+    # Progress of every docket is printed and saved to crawl_progress.json every progress_every seconds,
+    # METRICS to crawl_metrics.json/.prom at the same time.
+    # profile="cprofile": cProfile each docket's hot loop (list, assemble, write) to {docket_id}_profile.pstats;
+    # only one profiler can be active at a time (Python 3.12+ refuses a second one), so with dockets
+    # running in parallel it falls back to "sample".
+    # profile="sample": sample the stacks of all threads into crawl_profile.folded (flame graph input).
+    # A docket that fails (e.g. quota exhausted) is reported and the others go on; rerun to resume it.
+    order = sorted(range(len(dockets)), key=lambda i: (-dockets[i][1], i))
+    if profile == "cprofile" and min(len(dockets), max_concurrent_dockets) > 1:
+        print("[WARN] cProfile can't profile dockets running in parallel, sampling all threads instead (crawl_profile.folded).")
+        profile = "sample"
+    status = {
+        dockets[i][0]: {"priority": dockets[i][1], "status": "queued", "startedAt": None, "finishedAt": None}
+        for i in order
+    }
+    status_lock = threading.Lock()
+    progress_path = os.path.join(output_dir, "crawl_progress.json")
+
+    def report():
+        with status_lock:
+            snapshot = {docket_id: dict(info) for docket_id, info in status.items()}
+        for docket_id, info in snapshot.items():
+            info.update(_docket_progress(output_dir, docket_id))
+        _write_json_atomic(progress_path, snapshot)
+        METRICS.dump(output_dir)
+        print("==== Progress ====")
+        for docket_id, info in snapshot.items():
+            where = f", window {info['window']}" if info.get("window") else ""
+            print(f"  [{info['status']:>8}] {docket_id} (priority {info['priority']}): {info.get('rowsWritten', 0)} rows{where}")
+        return snapshot
+
+    def run_docket(docket_id, priority):
+        _set_request_priority(priority)
+        with status_lock:
+            status[docket_id].update(status="running", startedAt=_utc_now_iso())
+        profiler = cProfile.Profile() if profile == "cprofile" else None
+        profiling = False
+        try:
+            if profiler is not None:
+                profiler.enable()  # raises if another profiler is active; the docket is then "failed"
+                profiling = True
+            if replay_from_cache:
+                crawl_docket_to_files(
+                    docket_id, output_dir, page_size=page_size, max_workers=max_workers,
+                    cached_list_pages=True, pdf_workers=pdf_workers, pdf_pool=pdf_pool,
+                )
+            else:
+                sync_docket(
+                    docket_id, output_dir, page_size=page_size, max_workers=max_workers,
+                    pdf_workers=pdf_workers, pdf_pool=pdf_pool,
+                )
+            result = {"status": "done"}
+        except Exception as e:
+            print(f"[WARN] Docket {docket_id} stopped: {e!r}, rerun to resume it.")
+            result = {"status": "failed", "error": repr(e)}
+        finally:
+            if profiling:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(output_dir, f"{docket_id}_profile.pstats"))
+        with status_lock:
+            status[docket_id].update(result, finishedAt=_utc_now_iso())
+
+    quarantine_dir = PDF_QUARANTINE_DIR or os.path.join(output_dir, "pdf_quarantine")
+    pdf_pool = PdfExtractionPool(workers=pdf_workers, quarantine_dir=quarantine_dir) if pdf_workers > 0 else None
+    stop_reporting = threading.Event()
+
+    def report_periodically():
+        while not stop_reporting.wait(progress_every):
+            report()
+
+    reporter = threading.Thread(target=report_periodically, daemon=True)
+    reporter.start()
+    sampler = StackSampler().start() if profile == "sample" else None
+    try:
+        # Submitted in priority order, so queued dockets start by priority as slots free up
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrent_dockets)) as docket_pool:
+            for i in order:
+                docket_pool.submit(run_docket, *dockets[i])
+    finally:
+        stop_reporting.set()
+        reporter.join()
+        if sampler is not None:
+            sampler.stop()
+            sampler.dump(os.path.join(output_dir, "crawl_profile.folded"))
+        if pdf_pool is not None:
+            pdf_pool.shutdown()
+            if pdf_pool.quarantine:
+                print(f"[WARN] {len(pdf_pool.quarantine)} PDFs quarantined, see {quarantine_dir}/quarantine.jsonl (retry_quarantined_pdfs)")
+    return report()
+
+
+# -------------------- main：set up dockets, stream + checkpoint output -------------------- #
+if __name__ == "__main__":
+    #==== Change Output Directory =====
+    OUTPUT_DIR = "" # <<< !!! Change your Output Directory here !!!
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-    print(f"==== Fetched {len(comments_with_text)} records, combinedText is not empty ====\n")
 
-    # ===== Export JSON =====
-    json_filename = os.path.join(
-        OUTPUT_DIR,
-        f"{docket_id}_comments_text_pdf_p{CHUNK_START_PAGE}_to_p{CHUNK_END_PAGE}.json"
-    )
-    with open(json_filename, "w", encoding="utf-8") as f_json:
-        json.dump(comments_with_text, f_json, ensure_ascii=False, indent=2)
-    print("JSON saved to:", json_filename)
+    #==== Change Docket IDs =====
+    # (docket ID, priority): all dockets share the API key budget, higher priority is served first
+    DOCKETS = [
+        ("", 1), # <<< !!! Change your docket IDs here !!!
+    ]
+    page_size = 250
 
-    # ===== Export CSV =====
-    csv_filename = os.path.join(
+    #==== Concurrent fetch threads per docket (rate is capped by REQUESTS_PER_HOUR) + PDF parser processes =====
+    max_workers = 8
+    max_concurrent_dockets = 4
+    pdf_workers = PDF_WORKERS
+
+    #==== Metrics (crawl_metrics.json/.prom) are dumped with the progress report; profiling is opt-in =====
+    progress_every = 60
+    PROFILE = None  # None, "cprofile" or "sample"
+
+    #==== Local cache of details + PDFs (None to disable) =====
+    # To re-extract / re-clean a finished docket, delete its outputs + checkpoint and rerun
+    # with REPLAY_FROM_CACHE = True: everything is read from the cache, no API calls.
+    CACHE_DIR = os.path.join(OUTPUT_DIR, "http_cache")
+    REPLAY_FROM_CACHE = False
+    configure_cache(CACHE_DIR, max_bytes=CACHE_MAX_BYTES)
+
+    # Rows are appended as they finish; if the run stops (crash, quota), rerun to resume.
+    # Once a docket is complete, reruns only fetch comments modified since the last run.
+    progress = crawl_dockets(
+        DOCKETS,
         OUTPUT_DIR,
-        f"{docket_id}_comments_text_pdf_p{CHUNK_START_PAGE}_to_p{CHUNK_END_PAGE}.csv"
+        page_size=page_size,
+        max_workers=max_workers,
+        max_concurrent_dockets=max_concurrent_dockets,
+        pdf_workers=pdf_workers,
+        replay_from_cache=REPLAY_FROM_CACHE,
+        progress_every=progress_every,
+        profile=PROFILE,
     )
-    fieldnames = [
-        "commentId",
-        "agencyId",
-        "docketId",
-        "documentId",
-        "commentOnId",
-        "documentType",
-        "postedDate",
-        "receiveDate",
-        "title",
-        "trackingNbr",
-        "organizationName",
-        "firstName",
-        "lastName",
-        "city",
-        "stateProvinceRegion",
-        "country",
-        "withdrawn",
-        "restrictReasonType",
-        "restrictReason",
-        "rawCommentHtml",
-        "cleanCommentHtml",
-        "pdfText",
-        "combinedText",
-        "pdfUrls",
-        "hasSeeAttachedHint",
-    ]
 
-    with open(csv_filename, "w", newline="", encoding="utf-8") as f_csv:
-        writer = csv.DictWriter(f_csv, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in comments_with_text:
-            writer.writerow(row)
-    print("CSV saved to:", csv_filename)
+    for docket_id, info in progress.items():
+        print(f"==== {docket_id}: {info['status']}, saved {info.get('rowsWritten', 0)} records, combinedText is not empty ====")
 
     print("\nCurrent Path:", os.getcwd())
@@ -3,7 +3,7 @@ Combine multiple IRS comment CSV files into a single dataset, create a lightly c
 text field for transformer models, and export both raw + cleaned outputs.
 
 What this script does:
-1) Reads multiple CSV files listed in `CSV_FILES` from `ROOT_DIR`
+1) Reads multiple CSV files listed in `CSV_FILES` from `ROOT_DIR`, every column as text
 2) Standardizes the schema by keeping a fixed set of columns (`COLS_KEEP`)
    - missing columns are created as NA
 3) Exports a raw combined dataset:
@@ -17,11 +17,28 @@ What this script does:
 6) Filters out empty/very short cleaned texts (length < 5)
 7) Exports the cleaned dataset:
    - tot_comments_all_clean_irs_multi.csv
-   - tot_comments_all_clean_irs_multi.json
+   - tot_comments_all_clean_irs_multi.jsonl
+
+With STREAMING = True (off by default) the same steps run batch by batch (BATCH_ROWS rows at a
+time, inputs read in parallel), so memory stays bounded by the batch size instead of the corpus
+size, and with "parquet" in OUTPUT_FORMATS (needs pyarrow) both datasets are also written as
+Parquet partitioned by docketId:
+   - comments_all_raw_irs_multi_parquet/docketId=<docket>/part-0.parquet
+   - tot_comments_all_clean_irs_multi_parquet/docketId=<docket>/part-0.parquet
+
+With FTS_INDEX_PATH set, the cleaned comments are also added to a full-text index (SQLite FTS5,
+see comments_fts_index.py); rerunning with new scrape files updates it in place.
 """
 
 from __future__ import annotations
+import os
+import queue
 import re
+import shutil
+import threading
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 import numpy as np
 import pandas as pd
@@ -51,51 +68,138 @@ CSV_FILES = []
 #    Used to normalize references like "section ..." / "§ ..." into a consistent format.
 SECTION_CODES = []
 
+# Processes cleaning text_clean in chunks (1 = in this process)
+CLEAN_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+CLEAN_CHUNK_SIZE = 20_000
+
+# Streaming combine: read / clean / write BATCH_ROWS rows at a time instead of whole files
+STREAMING = False
+BATCH_ROWS = 50_000
+# Input CSVs read ahead in parallel (each buffers at most 2 batches)
+READ_WORKERS = 4
+# Outputs of the streaming combine, any of "csv", "jsonl", "parquet" (needs pyarrow)
+OUTPUT_FORMATS = ["csv", "jsonl"]
+
+# Full-text index of the cleaned comments (SQLite file), None = don't build one
+FTS_INDEX_PATH = None  # e.g. ROOT_DIR / "comments_fts.sqlite"
+
 
 # Text preprocess for BERT/transformers (light)
-def clean_for_bert(x, lowercase: bool = True):
+# Patterns are compiled once here instead of per row. The passes keep their original order:
+# e.g. "see\tattached files" only goes because tabs are replaced first, "see•attached files"
+# stays because bullets are replaced after.
+_SEE_ATTACHED_FILE_S = re.compile(r"(?i)see attached file\(s\)")
+_SEE_ATTACHED_FILES = re.compile(r"(?i)see attached files")
+
+
+@lru_cache(maxsize=8)
+def _section_code_patterns(codes: tuple, lowercase: bool):
+    # One pass per code, longest first (the original rules), plus a single alternation over all codes.
+    # The alternation gives the same result when codes are plain literals that can't overlap a
+    # "section"/"§" prefix; otherwise (or when its output still matches, i.e. a rewrite created a
+    # new reference the per-code passes would have caught) clean_for_bert falls back to the passes.
+    if lowercase:
+        codes = sorted([c.lower() for c in codes], key=len, reverse=True)
+        prefix = "section"
+    else:
+        codes = sorted(codes, key=len, reverse=True)
+        prefix = "[sS]ection"
+
+    passes = []
+    for code in codes:
+        passes.append((re.compile(rf"{prefix}\s*{code}"), code))
+        passes.append((re.compile(rf"§\s*{code}"), code))
+
+    plain = all(
+        code
+        and re.escape(code) == code
+        and not re.search(r"\s|§", code)
+        and "section" not in code.lower()
+        # a code ending in "s", "se", ... could run into a following "section"
+        and not any("section".startswith(code.lower()[-k:]) for k in range(1, 7))
+        for code in codes
+    )
+    combined = None
+    if codes and plain:
+        combined = re.compile(rf"(?:{prefix}|§)\s*({'|'.join(codes)})")
+    return passes, combined
+
+
+def clean_for_bert(x, lowercase: bool = True, section_codes=None):
+    # section_codes: defaults to SECTION_CODES
 
-    if pd.isna(x):
+    if not isinstance(x, str) and pd.isna(x):
         return np.nan
 
-    s = str(x)
-    s = re.sub(r"[\r\n\t]", " ", s)
+    # str.replace, not str.translate: translate has no fast path for non-ASCII text
+    s = str(x).replace("\r", " ").replace("\n", " ").replace("\t", " ")
 
-    s = re.sub(r"(?i)see attached file\(s\)", " ", s)
-    s = re.sub(r"(?i)see attached files", " ", s)
+    # Case-insensitive scans are slow; "ttached" has no non-ASCII case variants, so a plain
+    # substring check on the lowered text tells whether they can match at all
+    if "ttached" in s.lower():
+        s = _SEE_ATTACHED_FILE_S.sub(" ", s)
+        s = _SEE_ATTACHED_FILES.sub(" ", s)
     s = s.replace("[PDF_TEXT]", " ")
 
-    s = s.replace("•", " ")
-    s = s.replace("’", "'")
-    s = re.sub(r"\s+", " ", s).strip()
+    # str.split() and re's \s agree on what whitespace is
+    s = " ".join(s.replace("•", " ").replace("’", "'").split())
     if not s:
         return np.nan
 
     # --- Section code normalization ---
+    codes = SECTION_CODES if section_codes is None else section_codes
+    if not codes:
+        return s.lower() if lowercase else s
+
     if lowercase:
         s = s.lower()
-        codes = sorted([c.lower() for c in SECTION_CODES], key=len, reverse=True)
+    passes, combined = _section_code_patterns(tuple(codes), lowercase)
+    if combined is not None:
+        if "§" not in s and "ection" not in s:
+            return s  # no reference to rewrite
+        out = combined.sub(r"\1", s)
+        if not combined.search(out):
+            return out if out else np.nan
+    for pattern, code in passes:
+        s = pattern.sub(code, s)
+    return s if s else np.nan
+
 
-        for code in codes:
-            # e.g. section 45q -> 45q
-            s = re.sub(rf"section\s*{code}", code, s)
-            # e.g. §45q -> 45q
-            s = re.sub(rf"§\s*{code}", code, s)
+def _clean_chunk(values: list, lowercase: bool, section_codes: list) -> list:
+    return [clean_for_bert(x, lowercase, section_codes) for x in values]
+
+
+def clean_text_series(
+    texts: pd.Series,
+    lowercase: bool = True,
+    workers: int = CLEAN_WORKERS,
+    chunk_size: int = CLEAN_CHUNK_SIZE,
+    pool: ProcessPoolExecutor | None = None,
+) -> pd.Series:
+    # Same values as texts.apply(clean_for_bert), cleaned in chunks across worker processes
+    # pool: reuse running workers (streaming mode) instead of starting `workers` new ones
+    values = texts.tolist()
+    codes = list(SECTION_CODES)  # pass explicitly, workers may not see changes made at runtime
+    if (pool is None and workers <= 1) or len(values) <= chunk_size:
+        cleaned = _clean_chunk(values, lowercase, codes)
     else:
-        codes = sorted(SECTION_CODES, key=len, reverse=True)
-        for code in codes:
-            s = re.sub(
-                rf"[sS]ection\s*{code}",
-                code,
-                s,
-            )
-            s = re.sub(rf"§\s*{code}", code, s)
-    return s if s else np.nan
+        chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+        own_pool = pool is None
+        if own_pool:
+            pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            cleaned = []
+            for part in pool.map(_clean_chunk, chunks, [lowercase] * len(chunks), [codes] * len(chunks)):
+                cleaned.extend(part)
+        finally:
+            if own_pool:
+                pool.shutdown()
+    return pd.Series(cleaned, index=texts.index, name=texts.name)
 
 
 # Read a single CSV and standardize its column schema
 def read_one_comments_csv(path: Path) -> pd.DataFrame:
-    df = pd.read_csv(path)
+    df = pd.read_csv(path, dtype=str)  # as text, like the streaming reader: no "1.0" for IDs
 
     for col in COLS_KEEP:
         if col not in df.columns:
@@ -105,6 +209,194 @@ def read_one_comments_csv(path: Path) -> pd.DataFrame:
     return df.loc[:, cols].copy()
 
 
+# ---------- Streaming mode: batches instead of whole files ----------
+def iter_comments_csv_batches(path: Path, batch_rows: int = BATCH_ROWS):
+    # Only COLS_KEEP are parsed, all as text (no per-batch type guessing), missing ones added as NA
+    reader = pd.read_csv(path, usecols=lambda c: c in COLS_KEEP, dtype=str, chunksize=batch_rows)
+    with reader:
+        for batch in reader:
+            for col in COLS_KEEP:
+                if col not in batch.columns:
+                    batch[col] = pd.NA
+            yield batch.loc[:, list(COLS_KEEP)]
+
+
+def iter_combined_batches(paths: list, batch_rows: int = BATCH_ROWS, read_workers: int = READ_WORKERS):
+    # Yield (path, batch) in CSV_FILES order while the next read_workers files are parsed ahead
+    done = object()
+    stop = threading.Event()
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def read_into(path, q):
+        try:
+            for batch in iter_comments_csv_batches(path, batch_rows):
+                put(q, batch)
+        except Exception as e:
+            put(q, e)
+        put(q, done)
+
+    readers = ThreadPoolExecutor(max_workers=max(1, read_workers))
+    try:
+        pending = []
+        for path in paths:
+            if not path.exists():
+                print(f"File not found, skipping: {path}")
+                continue
+            q = queue.Queue(maxsize=2)
+            readers.submit(read_into, path, q)
+            pending.append((path, q))
+
+        for path, q in pending:
+            print(f"[INFO] Reading: {path}")
+            while True:
+                item = q.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield path, item
+    finally:
+        stop.set()
+        readers.shutdown(wait=True, cancel_futures=True)
+
+
+class _PartitionedParquetWriter:
+    """Parquet dataset partitioned by docketId (root/docketId=<docket>/part-0.parquet), one row group per batch."""
+
+    def __init__(self, root: Path, columns: list):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow), or drop it from OUTPUT_FORMATS") from e
+        self.pa = pa
+        self.pq = pq
+        self.root = root
+        # docketId lives in the directory name (hive layout), readers add it back as a column
+        self.schema = pa.schema([(col, pa.string()) for col in columns if col != "docketId"])
+        self.writers = {}
+        if root.exists():
+            shutil.rmtree(root)
+
+    def write(self, df: pd.DataFrame):
+        for docket_id, part in df.groupby("docketId", dropna=False, sort=False):
+            if pd.isna(docket_id):
+                docket_id = "__HIVE_DEFAULT_PARTITION__"
+            writer = self.writers.get(docket_id)
+            if writer is None:
+                part_dir = self.root / f"docketId={urllib.parse.quote(str(docket_id), safe='')}"
+                part_dir.mkdir(parents=True, exist_ok=True)
+                writer = self.writers[docket_id] = self.pq.ParquetWriter(part_dir / "part-0.parquet", self.schema)
+            table = self.pa.Table.from_pandas(part.drop(columns="docketId"), schema=self.schema, preserve_index=False)
+            writer.write_table(table)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+def read_comments_parquet(root: Path) -> pd.DataFrame:
+    # Load a *_parquet dataset back; plain string partitions, since pyarrow can't merge the
+    # dictionary-encoded docketId when some rows had none (__HIVE_DEFAULT_PARTITION__)
+    import pyarrow.dataset as ds
+
+    return pd.read_parquet(root, partitioning=ds.HivePartitioning.discover(infer_dictionary=False))
+
+
+class _BatchOutputs:
+    """Append batches to {base}.csv / {base}.jsonl / {base}_parquet/ (whichever of OUTPUT_FORMATS)."""
+
+    def __init__(self, base: Path, columns: list, formats=None):
+        formats = OUTPUT_FORMATS if formats is None else formats  # read at call time, may be set at runtime
+        self.paths = []
+        self.f_csv = self.f_jsonl = self.parquet = None
+        self.header = True
+        if "csv" in formats:
+            self.paths.append(base.with_name(base.name + ".csv"))
+            self.f_csv = open(self.paths[-1], "w", newline="", encoding="utf-8")
+        if "jsonl" in formats:
+            self.paths.append(base.with_name(base.name + ".jsonl"))
+            self.f_jsonl = open(self.paths[-1], "w", encoding="utf-8")
+        if "parquet" in formats:
+            self.paths.append(base.with_name(base.name + "_parquet"))
+            self.parquet = _PartitionedParquetWriter(self.paths[-1], columns)
+
+    def write(self, df: pd.DataFrame):
+        if self.f_csv is not None:
+            df.to_csv(self.f_csv, index=False, header=self.header)
+        if self.f_jsonl is not None and len(df):
+            df.to_json(self.f_jsonl, orient="records", lines=True, force_ascii=False)
+        if self.parquet is not None:
+            self.parquet.write(df)
+        self.header = False
+
+    def close(self):
+        for f in (self.f_csv, self.f_jsonl):
+            if f is not None:
+                f.close()
+        if self.parquet is not None:
+            self.parquet.close()
+
+
+def _open_fts_index():
+    if FTS_INDEX_PATH is None:
+        return None
+    from comments_fts_index import CommentIndex
+
+    return CommentIndex(FTS_INDEX_PATH, section_codes=list(SECTION_CODES))
+
+
+def main_streaming():
+    # Same outputs as main() (plus Parquet), written batch by batch; peak memory is about
+    # (READ_WORKERS * 2 + 1) batches, whatever the corpus size
+    raw_out = _BatchOutputs(ROOT_DIR / "comments_all_raw_irs_multi", list(COLS_KEEP))
+    clean_out = _BatchOutputs(ROOT_DIR / "tot_comments_all_clean_irs_multi", list(COLS_KEEP) + ["text_raw", "text_clean"])
+    pool = ProcessPoolExecutor(max_workers=CLEAN_WORKERS) if CLEAN_WORKERS > 1 else None
+    fts_index = _open_fts_index()
+    n_raw = n_clean = 0
+    try:
+        for path, batch in iter_combined_batches([ROOT_DIR / fname for fname in CSV_FILES]):
+            raw_out.write(batch)
+
+            # assign: a new frame, batch is a .loc selection (no chained assignment on pandas 2.x)
+            clean = batch.assign(
+                text_raw=batch["combinedText"],
+                text_clean=clean_text_series(batch["combinedText"], lowercase=True, pool=pool),
+            )
+            mask = clean["text_clean"].notna() & clean["text_clean"].str.len().ge(5)
+            clean_out.write(clean.loc[mask])
+            if fts_index is not None:
+                fts_index.add(clean.loc[mask])
+
+            n_raw += len(batch)
+            n_clean += int(mask.sum())
+            print(f"  {path.name}: {n_raw} rows combined, {n_clean} kept after cleaning")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        raw_out.close()
+        clean_out.close()
+        if fts_index is not None:
+            fts_index.optimize()
+            fts_index.close()
+
+    if n_raw == 0:
+        raise RuntimeError("No CSV files were successfully read.")
+
+    print(f"\n Raw combined: {n_raw} rows, saved to: {', '.join(str(p) for p in raw_out.paths)}")
+    print(f" Clean combined: {n_clean} rows, saved to: {', '.join(str(p) for p in clean_out.paths)}")
+    if fts_index is not None:
+        print(f" Full-text index: {FTS_INDEX_PATH}")
+
+
 # Main pipeline: combine >>> clean >>> export
 def main():
     # ---------- Read and merge all csv ----------
@@ -146,9 +438,7 @@ def main():
     comments_all = comments_all_raw.copy()
     comments_all["text_raw"] = comments_all["combinedText"]
 
-    comments_all["text_clean"] = comments_all["combinedText"].apply(
-        lambda x: clean_for_bert(x, lowercase=True)
-    )
+    comments_all["text_clean"] = clean_text_series(comments_all["combinedText"], lowercase=True)
 
     mask = comments_all["text_clean"].notna() & comments_all["text_clean"].str.len().ge(5)
     comments_all_clean = comments_all.loc[mask].reset_index(drop=True)
@@ -176,6 +466,17 @@ def main():
     print(f"\n Saved clean combined CSV to: {clean_csv_path}")
     print(f"Saved clean combined JSONL to: {clean_jsonl_path}")
 
+    # ---------- Full-text index ----------
+    fts_index = _open_fts_index()
+    if fts_index is not None:
+        n_indexed = fts_index.add(comments_all_clean)
+        fts_index.optimize()
+        fts_index.close()
+        print(f"Full-text index: {FTS_INDEX_PATH} ({n_indexed} new or changed comments)")
+
 
 if __name__ == "__main__":
-    main()
+    if STREAMING:
+        main_streaming()
+    else:
+        main()
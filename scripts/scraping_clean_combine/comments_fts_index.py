@@ -0,0 +1,314 @@
+"""
+Full-text index (SQLite FTS5) over the combined comments: which comments mention 45Q, 179D or an
+organization, without loading tot_comments_all_clean_irs_multi.csv into pandas.
+
+The index is one SQLite file. It holds commentId, docketId, text_clean and the COLS_KEEP metadata
+of every comment, and an FTS5 index over text_clean and the metadata. The metadata is stored
+cleaned like text_clean, and every query is too: clean_for_bert with the index's section codes
+("Section 45Q", "§45Q" -> "45q"), so a search for "section 45Q" finds text_clean's "45q". The
+index is for finding commentIds; read the rows themselves from the combined CSV / Parquet.
+
+02_combine_clean_ira_comments.py fills it while combining when FTS_INDEX_PATH is set. Rows are
+upserted by commentId (unchanged rows are not rewritten), so adding a newer combined CSV or newly
+scraped {docket}_comments_text_pdf_*.csv files updates the index in place; files already indexed
+with the same size and mtime are skipped.
+
+Queries use FTS5 syntax: words (implicit AND), "quoted phrases", AND / OR / NOT, parentheses,
+prefix* and column filters such as organizationName:sierra.
+
+    index = CommentIndex("data/comments_fts.sqlite")
+    index.search('"clean hydrogen" AND (45V OR "section 45V")', dockets=["IRS-2023-0066"])
+    index.count("organizationName:sierra NOT 45Q")
+
+    python scripts/scraping_clean_combine/comments_fts_index.py add data/comments_fts.sqlite data/tot_comments_all_clean_irs_multi.csv --section-codes 45Q 45V 179D
+    python scripts/scraping_clean_combine/comments_fts_index.py search data/comments_fts.sqlite '"section 45Q" OR 179D' --docket IRS-2023-0042
+"""
+
+from __future__ import annotations
+import argparse
+import importlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+ID_COL = "commentId"
+DOCKET_COL = "docketId"
+TEXT_COL = "text_clean"
+# Metadata columns of COLS_KEEP that are searchable, next to text_clean
+META_COLS = [
+    "title",
+    "trackingNbr",
+    "organizationName",
+    "firstName",
+    "lastName",
+    "city",
+    "stateProvinceRegion",
+    "country",
+]
+FTS_COLS = [TEXT_COL] + META_COLS
+# unicode61 folds case and diacritics; "45q" stays one token
+FTS_TOKENIZER = "unicode61 remove_diacritics 2"
+INDEX_BATCH_ROWS = 50_000
+
+_QUERY_TOKEN = re.compile(r'(?:\w+:)?"[^"]*"\*?|[()]|[^\s()"]+')
+_QUERY_PHRASE = re.compile(r'(?:(\w+):)?"([^"]*)"(\*?)')
+_OPERATORS = {"AND", "OR", "NOT"}
+
+
+def _combine_module():
+    # clean_for_bert / clean_text_series live in the combine script
+    return importlib.import_module("02_combine_clean_ira_comments")
+
+
+class CommentIndex:
+    """SQLite FTS5 index of comments, updated in place by commentId."""
+
+    def __init__(self, path: str, section_codes=None):
+        # section_codes: fixed when the index is created (None = none); reopening with other
+        # codes raises, since old rows and new queries would be normalized differently
+        self.path = str(path)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create()
+
+        saved = self.conn.execute("SELECT value FROM meta WHERE key = 'section_codes'").fetchone()
+        if saved is None:
+            self.section_codes = list(section_codes or [])
+            with self.conn:
+                self.conn.execute("INSERT INTO meta VALUES ('section_codes', ?)", (json.dumps(self.section_codes),))
+        else:
+            self.section_codes = json.loads(saved[0])
+            if section_codes is not None and sorted(section_codes) != sorted(self.section_codes):
+                raise ValueError(
+                    f"{self.path} was built with section codes {self.section_codes}; "
+                    f"delete it to rebuild with {list(section_codes)}."
+                )
+
+    def _create(self):
+        cols = ", ".join(FTS_COLS)
+        new_cols = ", ".join(f"new.{c}" for c in FTS_COLS)
+        old_cols = ", ".join(f"old.{c}" for c in FTS_COLS)
+        with self.conn:
+            self.conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, rows INTEGER, indexedAt TEXT);
+                CREATE TABLE IF NOT EXISTS comments (
+                    id INTEGER PRIMARY KEY,
+                    {ID_COL} TEXT NOT NULL UNIQUE,
+                    {DOCKET_COL} TEXT,
+                    {", ".join(f"{c} TEXT" for c in FTS_COLS)}
+                );
+                CREATE INDEX IF NOT EXISTS comments_docket ON comments ({DOCKET_COL});
+                CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+                    {cols}, content='comments', content_rowid='id', tokenize='{FTS_TOKENIZER}'
+                );
+                -- keep the FTS index in step with the comments table
+                CREATE TRIGGER IF NOT EXISTS comments_ai AFTER INSERT ON comments BEGIN
+                    INSERT INTO comments_fts (rowid, {cols}) VALUES (new.id, {new_cols});
+                END;
+                CREATE TRIGGER IF NOT EXISTS comments_ad AFTER DELETE ON comments BEGIN
+                    INSERT INTO comments_fts (comments_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+                END;
+                CREATE TRIGGER IF NOT EXISTS comments_au AFTER UPDATE ON comments BEGIN
+                    INSERT INTO comments_fts (comments_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+                    INSERT INTO comments_fts (rowid, {cols}) VALUES (new.id, {new_cols});
+                END;
+            """)
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT count(*) FROM comments").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    # ---- indexing ----
+    def _normalize(self, value):
+        # clean_for_bert as for text_clean (lowercase, section codes); None for missing / empty values
+        if value is None or (not isinstance(value, str) and pd.isna(value)):
+            return None
+        out = _combine_module().clean_for_bert(value, lowercase=True, section_codes=self.section_codes)
+        return out if isinstance(out, str) else None
+
+    def add(self, df: pd.DataFrame) -> int:
+        # Insert or update rows (commentId, docketId, text_clean + any META_COLS present) by commentId;
+        # rows identical to the indexed ones are left alone. Returns the number of rows written.
+        if ID_COL not in df.columns or TEXT_COL not in df.columns:
+            raise ValueError(f"add() needs {ID_COL} and {TEXT_COL} columns")
+        columns = {c: (df[c] if c in df.columns else pd.Series(None, index=df.index)) for c in [DOCKET_COL] + META_COLS}
+        meta = [[self._normalize(v) for v in columns[c].tolist()] for c in META_COLS]
+        docket = [None if pd.isna(v) else str(v) for v in columns[DOCKET_COL].tolist()]
+        text = [None if not isinstance(v, str) else v for v in df[TEXT_COL].tolist()]
+        rows = list(zip(df[ID_COL].astype(str).tolist(), docket, text, *meta))
+
+        cols = [ID_COL, DOCKET_COL] + FTS_COLS
+        changed = " OR ".join(f"{c} IS NOT excluded.{c}" for c in cols[1:])
+        sql = (
+            f"INSERT INTO comments ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+            f"ON CONFLICT ({ID_COL}) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in cols[1:])} "
+            f"WHERE {changed}"
+        )
+        with self.conn:
+            # rowcount: rows inserted or updated (not the trigger writes, not skipped no-op upserts)
+            cur = self.conn.executemany(sql, rows)
+        return max(cur.rowcount, 0)
+
+    def remove(self, comment_ids) -> int:
+        with self.conn:
+            cur = self.conn.executemany(f"DELETE FROM comments WHERE {ID_COL} = ?", [(str(c),) for c in comment_ids])
+        return cur.rowcount
+
+    def add_csv(self, path: str, batch_rows: int = INDEX_BATCH_ROWS, force: bool = False) -> int | None:
+        # Index a combined CSV (with text_clean) or a scraped one (combinedText, cleaned here like 02);
+        # None if the file was already indexed with the same size and mtime
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        seen = self.conn.execute("SELECT size, mtime_ns FROM sources WHERE path = ?", (path,)).fetchone()
+        if not force and seen == (st.st_size, st.st_mtime_ns):
+            print(f"[INFO] Unchanged since last indexed, skipping: {path}")
+            return None
+
+        wanted = {ID_COL, DOCKET_COL, TEXT_COL, "combinedText", *META_COLS}
+        combine = None
+        n_rows = n_written = 0
+        for batch in pd.read_csv(path, usecols=lambda c: c in wanted, dtype=str, chunksize=batch_rows):
+            if TEXT_COL not in batch.columns:
+                # Raw scrape output: clean combinedText as the combine step does, same row filter
+                if combine is None:
+                    combine = _combine_module()
+                    combine.SECTION_CODES = list(self.section_codes)
+                batch[TEXT_COL] = combine.clean_text_series(batch["combinedText"], lowercase=True, workers=1)
+                batch = batch[batch[TEXT_COL].notna() & batch[TEXT_COL].str.len().ge(5)]
+            n_rows += len(batch)
+            n_written += self.add(batch)
+
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, n_rows, time.strftime("%Y-%m-%dT%H:%M:%S")),
+            )
+        print(f"[INFO] Indexed {path}: {n_rows} rows, {n_written} new or changed")
+        return n_written
+
+    def optimize(self):
+        # Merge the FTS index segments (after a large load) for faster queries
+        with self.conn:
+            self.conn.execute("INSERT INTO comments_fts (comments_fts) VALUES ('optimize')")
+
+    # ---- queries ----
+    def _fts_query(self, query: str) -> str:
+        # FTS5 query with every phrase / run of words normalized like text_clean and quoted,
+        # operators, parentheses, column filters and prefix * kept
+        columns = {c.lower(): c for c in FTS_COLS}
+        out, words = [], []
+
+        def term(word: str, column: str = ""):
+            if not column:
+                column, _, rest = word.partition(":")
+                if rest and column.lower() in columns:
+                    word = rest
+                else:
+                    column = ""
+            column = columns[column.lower()] + ":" if column.lower() in columns else ""
+            star = "*" if word.endswith("*") else ""
+            word = word.rstrip("*")
+            return f'{column}"{word}"{star}' if word else ""
+
+        def flush():
+            # Consecutive words together, so "section 45Q" normalizes to "45q"
+            if words:
+                normalized = self._normalize(" ".join(words)) or ""
+                out.extend(t for t in (term(w) for w in normalized.split()) if t)
+                words.clear()
+
+        for token in _QUERY_TOKEN.findall(query):
+            if token in _OPERATORS or token in ("(", ")"):
+                flush()
+                out.append(token)
+            elif (match := _QUERY_PHRASE.fullmatch(token)):
+                flush()
+                column, phrase, star = match.groups()
+                phrase = self._normalize(phrase)
+                if phrase:
+                    out.append(term(phrase.replace('"', " ") + star, column or ""))
+            else:
+                words.append(token.replace('"', " "))
+        flush()
+        return " ".join(out)
+
+    def _where(self, query: str, dockets):
+        sql = "comments_fts MATCH ?"
+        params = [self._fts_query(query)]
+        if dockets:
+            dockets = [dockets] if isinstance(dockets, str) else list(dockets)
+            # unary + keeps SQLite off the docketId index: match first, then filter the hits
+            sql += f" AND +c.{DOCKET_COL} IN ({', '.join('?' * len(dockets))})"
+            params += dockets
+        return sql, params
+
+    def search(self, query: str, dockets=None, limit: int | None = None, ranked: bool = False) -> list:
+        # commentIds matching query (optionally only in dockets); ranked: best match (bm25) first
+        where, params = self._where(query, dockets)
+        sql = f"SELECT c.{ID_COL} FROM comments_fts JOIN comments c ON c.id = comments_fts.rowid WHERE {where}"
+        if ranked:
+            sql += " ORDER BY comments_fts.rank"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return [row[0] for row in self.conn.execute(sql, params)]
+
+    def count(self, query: str, dockets=None) -> int:
+        where, params = self._where(query, dockets)
+        if dockets:
+            sql = f"SELECT count(*) FROM comments_fts JOIN comments c ON c.id = comments_fts.rowid WHERE {where}"
+        else:
+            sql = f"SELECT count(*) FROM comments_fts WHERE {where}"
+        return self.conn.execute(sql, params).fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="index (or update the index from) comment CSVs")
+    add.add_argument("index", help="SQLite file, e.g. data/comments_fts.sqlite")
+    add.add_argument("csv", nargs="+", help="combined CSVs with text_clean, or scraped *_comments_text_pdf_*.csv files")
+    add.add_argument("--section-codes", nargs="*", help="section codes of a new index (as SECTION_CODES in 02)")
+    add.add_argument("--force", action="store_true", help="reindex files even if unchanged")
+    search = sub.add_parser("search", help="print the commentIds matching a query")
+    search.add_argument("index")
+    search.add_argument("query", help='FTS5 query, e.g. \'"section 45Q" OR 179D\'')
+    search.add_argument("--docket", nargs="+", help="only these docketIds")
+    search.add_argument("--limit", type=int)
+    search.add_argument("--ranked", action="store_true", help="best matches first")
+    search.add_argument("--count", action="store_true", help="print the number of matches only")
+    args = parser.parse_args()
+
+    if args.command == "add":
+        index = CommentIndex(args.index, section_codes=args.section_codes)
+        for path in args.csv:
+            index.add_csv(path, force=args.force)
+        index.optimize()
+        print(f"[INFO] {len(index):,} comments in {args.index}")
+    else:
+        index = CommentIndex(args.index)
+        start = time.perf_counter()
+        if args.count:
+            print(index.count(args.query, args.docket))
+        else:
+            for comment_id in index.search(args.query, args.docket, args.limit, args.ranked):
+                print(comment_id)
+        print(f"[INFO] {(time.perf_counter() - start) * 1000:.1f} ms", file=sys.stderr)
+    index.close()
+
+
+if __name__ == "__main__":
+    main()